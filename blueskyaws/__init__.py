@@ -1,21 +1,40 @@
 import asyncio
+import concurrent.futures
 import datetime
 import json
 import logging
+import math
 import os
 import re
 import tempfile
 import uuid
+from collections import Counter, OrderedDict
 
 import afconfig
-import boto3
-from afaws.ec2.ssh import SshClient
-from afaws.asyncutils import run_in_loop_executor
 
+from .fires import get_fire_info
+from .image import get_bluesky_image
 from .input import InputLoader
 from .launch import Ec2InstancesManager
+from .met import MetReadinessGate
+from .pool import InstancePool
+from .archive import (
+    ARCHIVE_CODECS, UNCOMPRESSED_EXT, get_archive_packages,
+    form_archive_script, parse_archive_result
+)
+from .bootstrap import (
+    StagedFile, form_bootstrap_script, parse_bootstrap_result
+)
+from .cache import ResultCache
 from .config import Config, BLUESKY_EXPORT_CONFIG, substitude_config_wildcards
+from .delta import get_run_settings, PreviousRequest
+from .s3 import get_s3_client
+from .scheduling import SchedulingPolicy, WorkQueue, order_fire_indices
+from .sizing import get_instance_type, get_instance_types, allocate_instances
+from .spot import form_interruption_check_script, parse_interruption_notice
+from .ssh import SshConnectionPool
 from .status import SystemState, Status, StatusTracker
+from .timing import StageTimer
 
 __all__ = [
     "BlueskyParallelRunner"
@@ -35,7 +54,9 @@ class BlueskyParallelRunner(object):
         # unrestricted Conig object based on whether or not new
         # instances are needed for the number of fires passed into run
         self._config = Config(config)
-        self._s3_client = boto3.client('s3')
+        self._s3_client = get_s3_client(self._config('aws', 's3', 'backend'),
+            max_concurrency=self._config('aws', 's3', 'max_concurrency'),
+            max_attempts=self._config('aws', 's3', 'max_attempts'))
 
     ##
     ## Public Interface
@@ -47,16 +68,23 @@ class BlueskyParallelRunner(object):
         self._set_bluesky_today()
         self._set_request_id(input_file_name)
 
-        await self._set_status_tracker()
-        async with InputLoader(self._config, input_file_name, self._status_tracker) as input_loader:
-            self._input_loader = input_loader
-            self._set_instances_needed()
-            await self._load_bluesky_config()
-            await self._record_input()
-            await self._record_config(self._config, 'bluesky-aws')
-            await self._record_config(self._bluesky_config, 'bluesky')
-            await self._run_all()
-            await self._notify()
+        async with self._s3_client:
+            await self._set_status_tracker()
+            async with self._status_tracker, InputLoader(self._config,
+                    input_file_name, self._status_tracker) as input_loader:
+                self._input_loader = input_loader
+                await self._load_bluesky_config()
+                await self._record_input()
+                await self._record_config(self._config, 'bluesky-aws')
+                await self._record_config(self._bluesky_config, 'bluesky')
+                await self._stage_bluesky_config()
+                self._set_result_cache()
+                await self._use_previous_results()
+                await self._use_cached_results()
+                self._set_instances_needed()
+                self._set_executor()
+                await self._run_all()
+                await self._notify()
 
     ## Initialization
 
@@ -100,9 +128,65 @@ class BlueskyParallelRunner(object):
         await self._status_tracker.initialize()
 
     def _set_instances_needed(self):
-        num_instances = 1 if self._config('single_run') else len(self._input_loader.fires)
-        self._total_instances_needed = min(num_instances,
-            self._config("aws", 'ec2', "max_num_instances") or num_instances)
+        """Determines the instance type each fire is to be run on, and
+        the type of each instance needed to run them
+        """
+        fire_index = self._input_loader.fire_index
+        if self._config('single_run'):
+            areas = [a for a in fire_index.column('area') if not math.isnan(a)]
+            self._fire_instance_types = [get_instance_type(sum(areas),
+                self._config)]
+        else:
+            self._fire_instance_types = get_instance_types(fire_index,
+                self._config)
+
+        # Fires with carried forward or cached results aren't run
+        self._instance_types = allocate_instances([t for i, t in
+                enumerate(self._fire_instance_types) if i not in self._completed_runs],
+            self._config('aws', 'ec2', 'slots_per_instance'),
+            self._config("aws", 'ec2', "max_num_instances"))
+        self._total_instances_needed = len(self._instance_types)
+
+        # Fires assigned types that couldn't be allocated any instances,
+        # for lack of enough instances, are run on the most common type
+        if self._instance_types:
+            most_common = Counter(self._instance_types).most_common(1)[0][0]
+            self._fire_instance_types = [
+                t if t in self._instance_types else most_common
+                for t in self._fire_instance_types
+            ]
+        logging.info("Instances needed: %s", dict(Counter(self._instance_types)))
+
+    # Default number of threads in asyncio's default executor is
+    # min(32, os.cpu_count() + 4)
+    BASE_MAX_EXECUTOR_THREADS = 32
+
+    # With slots_per_instance set to 'auto', the number of slots isn't known
+    # until instances are running, so the executor is sized for this many
+    # per instance; any more concurrent waits share threads
+    ESTIMATED_AUTO_SLOTS_PER_INSTANCE = 16
+
+    def _set_executor(self):
+        """Sizes the default executor so that each concurrent run can block
+        a thread while waiting for bsp to complete, and each spot instance
+        can block one while watching for interruption notices, without
+        starving other ssh and s3 calls.
+        """
+        num_blocking = 0
+        if self._config('bluesky', 'completion_check_strategy') == 'wait':
+            num_runs = (1 if self._config('single_run')
+                else self._input_loader.num_fires - len(self._completed_runs))
+            slots = self._config('aws', 'ec2', 'slots_per_instance')
+            if slots == 'auto':
+                slots = self.ESTIMATED_AUTO_SLOTS_PER_INSTANCE
+            num_blocking += min(num_runs, self._total_instances_needed * slots)
+        if self._config('aws', 'ec2', 'spot', 'enabled'):
+            num_blocking += self._total_instances_needed
+
+        if num_blocking:
+            asyncio.get_event_loop().set_default_executor(
+                concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.BASE_MAX_EXECUTOR_THREADS + num_blocking))
 
     async def _load_bluesky_config(self):
         self._bluesky_config = {'config': {}}
@@ -136,7 +220,7 @@ class BlueskyParallelRunner(object):
         self._bluesky_config['config'].update(BLUESKY_EXPORT_CONFIG)
 
     async def _record_input(self):
-        await run_in_loop_executor(self._s3_client.upload_file,
+        await self._s3_client.upload_file(
             self._input_loader.local_input_file_name,
             self._config('aws', 's3', 'bucket_name'),
             os.path.join('requests', self._request_id + '.json'))
@@ -145,51 +229,702 @@ class BlueskyParallelRunner(object):
         if hasattr(config, 'to_dict'):
             config = config.to_dict()
 
-        await run_in_loop_executor(self._s3_client.put_object,
+        await self._s3_client.put_object(
             Body=json.dumps(config),
             Bucket=self._config('aws', 's3', 'bucket_name'),
             Key=os.path.join('config', self._request_id + '-config-'
                 + config_type + '.json'))
 
+    STAGED_PATH = 'staged'
+
+    async def _stage_bluesky_config(self):
+        """Serializes and hashes the bluesky config once, to be cached on
+        each instance by hash, and, if configured, stores it in s3 by hash
+        for instances to fetch
+        """
+        self._staged_bluesky_config = StagedFile(self._bluesky_config)
+        if not self._config('bluesky', 'staged_config', 'fetch_from_s3'):
+            return
+
+        bucket = self._config('aws', 's3', 'bucket_name')
+        key = os.path.join(self.STAGED_PATH,
+            self._staged_bluesky_config.hash + '.json')
+        try:
+            await self._s3_client.head_object(Bucket=bucket, Key=key)
+            logging.info("bluesky config already staged in s3 at %s", key)
+        except Exception:
+            # Content addressed, so there's no harm in overwriting
+            await self._s3_client.put_object(Bucket=bucket, Key=key,
+                Body=self._staged_bluesky_config.contents)
+        self._staged_bluesky_config.s3_url = "s3://{}/{}".format(bucket, key)
+
+    def _set_result_cache(self):
+        self._result_cache = ResultCache(self._config, self._s3_client,
+            self._staged_bluesky_config, self._bluesky_today)
+
+    # Number of unchanged fires whose results are carried forward at a time
+    CARRY_FORWARD_BATCH_SIZE = 100
+
+    async def _use_previous_results(self):
+        """Carries forward the results of fires that are unchanged since
+        the previous request for the same bluesky 'today', recording their
+        indices so that they aren't run again
+        """
+        self._completed_runs = set()
+        if not self._config('delta', 'enabled'):
+            return
+        if self._config('single_run'):
+            logging.warning("Delta requests aren't supported with single_run")
+            return
+
+        try:
+            previous_request = await PreviousRequest.load(self._s3_client,
+                self._config('aws', 's3', 'bucket_name'), self._bluesky_today,
+                self._request_id, get_run_settings(self._config,
+                self._bluesky_config),
+                self._config('delta', 'previous_request_id'))
+        except Exception as e:
+            # e.g. the previous request failed before recording its input
+            logging.warning("Failed to load previous request, so all fires "
+                "will be run: %s", e)
+            return
+
+        if not previous_request:
+            logging.info("No previous request with the same config for %s",
+                self._bluesky_today.strftime('%Y-%m-%d'))
+            return
+
+        fire_index = self._input_loader.fire_index
+        batch = []
+        i = 0
+        async for fire in self._input_loader.iter_fires():
+            run_status = previous_request.get_unchanged_run(fire)
+            if run_status:
+                batch.append((i, {'fires': [fire]}, fire_index.row(i),
+                    run_status))
+            i += 1
+            if len(batch) >= self.CARRY_FORWARD_BATCH_SIZE:
+                await self._carry_forward_results(previous_request, batch)
+                batch = []
+        await self._carry_forward_results(previous_request, batch)
+
+        logging.info("Carried forward results of %s unchanged fires from %s",
+            len(self._completed_runs), previous_request.request_id)
+        await self._status_tracker.set_system_state(SystemState.RUNNING,
+            previous_request_id=previous_request.request_id)
+
+    async def _carry_forward_results(self, previous_request, batch):
+        await asyncio.gather(*[
+            self._create_runner(input_data, fire_metadata,
+                run_id=run_status['run_id']).carry_forward(
+                previous_request.request_id, run_status)
+            for i, input_data, fire_metadata, run_status in batch
+        ])
+        self._completed_runs.update(b[0] for b in batch)
+
+    # Number of fires whose cached results are looked up at a time
+    CACHE_LOOKUP_BATCH_SIZE = 100
+
+    async def _use_cached_results(self):
+        """Reuses the results of earlier runs whose inputs, config, and
+        version are unchanged, recording the indices of the runs -
+        fires, or 0 for the single run if single_run is set - so that
+        they aren't run again
+        """
+        if not self._result_cache.enabled:
+            return
+
+        num_completed = len(self._completed_runs)
+        fire_index = self._input_loader.fire_index
+        if self._config('single_run'):
+            fires = [f async for f in self._input_loader.iter_fires()]
+            await self._reuse_cached_results([(0, {'fires': fires},
+                fire_index.row(0) if len(fire_index) else None)])
+
+        else:
+            batch = []
+            i = 0
+            async for fire in self._input_loader.iter_fires():
+                if i not in self._completed_runs:
+                    batch.append((i, {'fires': [fire]}, fire_index.row(i)))
+                i += 1
+                if len(batch) >= self.CACHE_LOOKUP_BATCH_SIZE:
+                    await self._reuse_cached_results(batch)
+                    batch = []
+            await self._reuse_cached_results(batch)
+
+        if len(self._completed_runs) > num_completed:
+            logging.info("Reused cached results of %s runs",
+                len(self._completed_runs) - num_completed)
+
+    async def _reuse_cached_results(self, batch):
+        reused = await asyncio.gather(*[
+            self._reuse_cached_result(input_data, fire_metadata)
+            for i, input_data, fire_metadata in batch
+        ])
+        self._completed_runs.update(b[0] for b, r in zip(batch, reused) if r)
+
+    async def _reuse_cached_result(self, input_data, fire_metadata):
+        entry = await self._result_cache.lookup(input_data)
+        if not entry:
+            return False
+        runner = self._create_runner(input_data, fire_metadata)
+        return await runner.reuse(entry)
+
     async def _run_all(self):
+        # Fires are put on work queues, one per instance type, from
+        # which each instance of that type pulls runs until the queue
+        # is empty.  This supports the case where
+        # num_fires > num_instances (when single_run=false) by running
+        # the extra fires sequentially on instances that have already
+        # completed a run, rather than dropping them.
+        queues = OrderedDict(
+            (t, WorkQueue(maxsize=self._get_queue_size(n)))
+            for t, n in Counter(self._instance_types).items())
+        self._exhausted_queues = set()
+        self._ended_queues = set()
+        self._aborts = []
+        self._aborted_types = set()
+        self._met_gate = MetReadinessGate(self._config,
+            self._input_loader.fire_index, self._bluesky_today,
+            self._status_tracker)
+        self._check_met_wait_budget()
+        self._num_allocated = Counter(self._instance_types)
+        self._num_to_run = Counter(t for i, t in enumerate(
+            self._fire_instance_types) if i not in self._completed_runs)
+        self._num_released = Counter()
+        self._num_waiting_for_met = Counter()
+        self._waiting_for_met = []
+        self._all_fires_sorted = asyncio.Event()
+        self._ready_to_launch = asyncio.Event()
+        self._ec2_instance_manager = None
+        self._unserved_types = set()
+        self._num_serving = Counter()
+        self._num_pending = Counter()
+        self._num_launching = Counter()
+        self._idle_instance_ids = set()
+        self._launches = []
+        filler = asyncio.ensure_future(self._fill_queues(queues))
+
+        # Instances are launched only for the fires that are ready to run
+        # once each fire has either been released or found to be waiting
+        # for met, and more are launched as the met of the rest arrives
+        await self._ready_to_launch.wait()
+        self._size_launches()
+
+        pool, pooled = await self._lease_pooled_instances()
+        # Ssh connections opened while launching and initializing
+        # instances are reused for the runs
+        self._ssh_pool = SshConnectionPool(self._config('ssh_key'))
         ec2_instance_manager = Ec2InstancesManager(self._config,
             self._total_instances_needed, self._request_id,
-            existing=self._instances)
-        async with ec2_instance_manager:
-            # TODO: Add more options for supporting the case where
-            #     num_fires > num_instances (when single_run=false);
-            #     Some possibilities:
-            #       1) take the first num_instances fires, given the order the
-            #          fires are specified in the input data
-            #          ***(this is the current implementation***)
-            #       2) somehow prioritize fires and run only first
-            #          num_instances fires
-            #       3) tranche fires, one tranche per instance, and within
-            #          each tranche, execute one of the following:
-            #            a) separate runs sequentially
-            #            b) separate runs in parallel
-            #            c) single run
+            existing=self._instances, pool=pool, pooled=pooled,
+            ssh_pool=self._ssh_pool, status_tracker=self._status_tracker,
+            instance_types=self._instance_types)
+        async with self._ssh_pool, ec2_instance_manager:
+            # Runs start on each instance as soon as it's ready, rather
+            # than after all instances are launched and initialized
+            self._interruption_notices = {}
+            self._ec2_instance_manager = ec2_instance_manager
+            self._num_pending = Counter(self._instance_types)
+            # Fires released while instances were being leased
+            for instance_type in self._unserved_types:
+                self._ensure_served(queues, instance_type)
+            runs = []
+            async for instance in ec2_instance_manager.ready_instances():
+                runs.append(self._start_runs_on_instance(ec2_instance_manager,
+                    instance, queues))
+            # Any not yet ready failed
+            self._num_pending.clear()
+            # Fires of any type for which no instances became ready
+            # won't be run
+            for instance_type in self._num_allocated:
+                self._abort_if_unserved(ec2_instance_manager, queues,
+                    instance_type)
+            await asyncio.gather(*runs)
+
+            # Fires whose met arrived after the instances of their type
+            # were released are run on instances launched for them
+            await self._all_fires_sorted.wait()
+            await asyncio.gather(*self._waiting_for_met)
+            while self._launches:
+                launches, self._launches = self._launches, []
+                await asyncio.gather(*launches)
+
+            # If all instances failed, there may be fires left on the queues
+            await asyncio.gather(*self._aborts, *[
+                self._abort_remaining(queue, instance_type)
+                for instance_type, queue in queues.items()
+            ])
+            await filler
+
+            await self._status_tracker.set_system_state(SystemState.COMPLETE,
+                ssh_connections=self._ssh_pool.stats,
+                s3_requests=self._s3_client.stats,
+                timings=await self._status_tracker.summarize_timings())
+
+        if pool:
+            await pool.reap()
+
+    # Marks the end of the work queue
+    END_OF_QUEUE = None
+
+    # Returned instead of an item when the rest of the instance type's
+    # fires are waiting for met
+    IDLE = object()
+
+    def _check_met_wait_budget(self):
+        minutes = self._config('aws', 'ec2', 'minutes_until_auto_shutdown')
+        if (self._config('met', 'domains') and minutes
+                and self._met_gate.max_wait_seconds > minutes * 60):
+            logging.warning("Fires may wait up to %s minutes for met, longer "
+                "than the %s minutes after which instances shut themselves "
+                "down, so instances kept busy by fires as their met arrives "
+                "may shut down mid-run", self._met_gate.max_wait_seconds // 60,
+                minutes)
+
+    def _size_launches(self):
+        """Reduces the number of instances of each type to be launched to
+        the number needed for the type's fires that aren't waiting for
+        met, so that none are launched for those that are
+        """
+        remaining = Counter({t: min(n, self._get_num_instances(
+                self._num_to_run[t] - self._num_waiting_for_met[t]))
+            for t, n in self._num_allocated.items()})
+        instance_types = []
+        for instance_type in self._instance_types:
+            if remaining[instance_type]:
+                instance_types.append(instance_type)
+                remaining[instance_type] -= 1
+
+        if len(instance_types) < len(self._instance_types):
+            logging.info("Launching %s of %s instances, for the fires that "
+                "are ready to run", len(instance_types),
+                len(self._instance_types))
+        self._instance_types = instance_types
+        self._total_instances_needed = len(instance_types)
+
+    def _get_num_instances(self, num_fires):
+        """Returns the number of instances needed to run the given number
+        of fires at once
+        """
+        slots = self._config('aws', 'ec2', 'slots_per_instance')
+        slots = 1 if slots == 'auto' else slots
+        return math.ceil(max(0, num_fires) / slots)
+
+    def _get_queue_size(self, num_instances):
+        """Returns the maximum size of the work queue for the given number
+        of instances - unbounded unless streaming input, in which case the
+        queue holds a couple fires per slot, so that fires are read from
+        the input only as needed
+        """
+        if not self._input_loader.streaming:
+            return 0
+
+        slots = self._config('aws', 'ec2', 'slots_per_instance')
+        slots = 1 if slots == 'auto' else slots
+        return 2 * num_instances * slots
+
+    async def _fill_queues(self, queues):
+        """Puts (input_data, fire_metadata) items on the queue for the
+        instance type each fire is to be run on, where fire_metadata is
+        the fire's row in the input's metadata index.  Fires whose results
+        were carried forward or reused from the cache are skipped.
+        """
+        fire_index = self._input_loader.fire_index
+        instance_type = lambda i: self._fire_instance_types[i]
+        try:
             if self._config('single_run'):
-                runners = [
-                    BlueskySingleRunner({'fires': self._input_loader.fires}, ec2_instance_manager,
-                        ec2_instance_manager.instances[0], self._config, self._bluesky_config,
-                        self._request_id, self._status_tracker, self._bluesky_today)
-                ]
+                if 0 in self._completed_runs:
+                    return
+                fires = [f async for f in self._input_loader.iter_fires()]
+                await self._release(queues, instance_type(0), ({'fires': fires},
+                    fire_index.row(0) if len(fire_index) else None),
+                    range(len(fire_index)))
+
+            elif self._input_loader.streaming:
+                if self._config('scheduling', 'policy') != SchedulingPolicy.FIFO:
+                    logging.warning("Fires are scheduled in input order "
+                        "when streaming input")
+                i = 0
+                async for fire in self._input_loader.iter_fires():
+                    if i not in self._completed_runs:
+                        await self._release(queues, instance_type(i),
+                            ({'fires': [fire]}, fire_index.row(i)), [i])
+                    i += 1
+
             else:
-                runs = zip(self._input_loader.fires, ec2_instance_manager.instances)
-                runners = [
-                    BlueskySingleRunner({'fires': [fire]}, ec2_instance_manager,
-                        instance, self._config, self._bluesky_config,
-                        self._request_id, self._status_tracker, self._bluesky_today)
-                    for fire, instance in runs
-                ]
-
-            await asyncio.gather(*[
-                runner.run() for runner in runners
-            ])
+                fires = self._input_loader.fires
+                for i in order_fire_indices(fire_index, self._config):
+                    if i in self._completed_runs:
+                        continue
+                    await self._release(queues, instance_type(i),
+                        ({'fires': [fires[i]]}, fire_index.row(i)), [i])
+
+            self._set_all_fires_sorted()
+            await asyncio.gather(*self._waiting_for_met)
+
+        except Exception as e:
+            logging.error("Failed to read fires from input: %s", e,
+                exc_info=True)
+
+        finally:
+            self._set_all_fires_sorted()
+            for q in queues.values():
+                await q.put(self.END_OF_QUEUE)
+                self._ended_queues.add(q)
+
+    def _set_all_fires_sorted(self):
+        self._all_fires_sorted.set()
+        self._ready_to_launch.set()
+
+    async def _release(self, queues, instance_type, item, indices):
+        """Puts the item on the instance type's queue if the met its fires
+        need is available, and otherwise starts a task that puts it on the
+        queue once the met arrives, so that other fires aren't held up by it
+        """
+        if await self._met_gate.get_missing(indices):
+            self._num_waiting_for_met[instance_type] += 1
+            self._waiting_for_met.append(asyncio.ensure_future(
+                self._release_when_met_available(queues, instance_type,
+                item, indices)))
+        else:
+            await self._put(queues, instance_type, item)
+
+    async def _release_when_met_available(self, queues, instance_type, item,
+            indices):
+        try:
+            missing = await self._met_gate.wait(indices)
+        finally:
+            self._num_waiting_for_met[instance_type] -= 1
+
+        if missing:
+            runner = self._create_runner(*item)
+            await runner.abort("Met not available: {}".format(
+                ', '.join(missing)))
+        else:
+            await self._put(queues, instance_type, item, ensure_served=True)
+
+    async def _put(self, queues, instance_type, item, ensure_served=False):
+        queue = queues[instance_type]
+        self._num_released[instance_type] += 1
+        # Instances are launched once enough fires are ready to run for all
+        # of them or, when streaming input, once no more fires can be read
+        # until instances start taking them off the queues
+        if not self._ready_to_launch.is_set() and (queue.full() or all(
+                self._num_released[t] >= n
+                for t, n in self._num_allocated.items())):
+            self._ready_to_launch.set()
+        if ensure_served:
+            self._ensure_served(queues, instance_type, num_putting=1)
+        await queue.put(item)
+
+    def _ensure_served(self, queues, instance_type, num_putting=0):
+        """Launches as many instances of the given type as are needed, up
+        to the number allocated to it, to run the fires on its queue, e.g.
+        because they were released, once their met arrived, after the
+        instances of the type were released
+        """
+        manager = self._ec2_instance_manager
+        if not manager:
+            # Checked once instances start being launched
+            self._unserved_types.add(instance_type)
+            return
+        if instance_type in self._aborted_types:
+            return
+
+        num_new = min(self._num_allocated[instance_type],
+            self._get_num_instances(self._num_fires_on(queues[instance_type])
+                + num_putting)) - (self._num_serving[instance_type]
+            + self._num_pending[instance_type]
+            + self._num_launching[instance_type])
+        if num_new > 0:
+            logging.info("Launching %s %s instance(s) for fires that are now "
+                "ready to run", num_new, instance_type)
+        for i in range(num_new):
+            self._num_launching[instance_type] += 1
+            self._launches.append(asyncio.ensure_future(
+                self._launch_and_run_on_instances(manager, queues,
+                instance_type)))
+
+    async def _launch_and_run_on_instances(self, ec2_instance_manager, queues,
+            instance_type):
+        try:
+            instance = await ec2_instance_manager.launch_instance(instance_type)
+        finally:
+            self._num_launching[instance_type] -= 1
+
+        if instance:
+            self._num_serving[instance_type] += 1
+            await self._run_on_instances(ec2_instance_manager, instance,
+                queues, instance_type)
+        else:
+            self._abort_if_unserved(ec2_instance_manager, queues,
+                instance_type)
+
+    def _num_fires_on(self, queue):
+        """Returns the number of fires on the queue, not counting the
+        end-of-queue marker
+        """
+        return queue.qsize() - (1 if queue in self._ended_queues else 0)
+
+    async def _get_from_queue(self, queue, instance_type=None):
+        """Returns the next item on the queue.  If instance_type is given,
+        returns IDLE instead if the queue is empty, once all fires have
+        been read, and the rest of the type's fires are waiting for met,
+        so that instances aren't kept running while they wait.
+        """
+        if instance_type:
+            item = await self._get_unless_idle(queue, instance_type)
+        else:
+            item = await queue.get()
+        if item is self.END_OF_QUEUE:
+            # Leave it for any other consumers
+            queue.put_nowait(item)
+            self._exhausted_queues.add(queue)
+        return item
+
+    async def _get_unless_idle(self, queue, instance_type):
+        get = asyncio.ensure_future(queue.get())
+        all_sorted = asyncio.ensure_future(self._all_fires_sorted.wait())
+        try:
+            await asyncio.wait([get, all_sorted],
+                return_when=asyncio.FIRST_COMPLETED)
+            if (not get.done() and queue.empty()
+                    and self._num_waiting_for_met[instance_type]):
+                return self.IDLE
+            return await get
+        finally:
+            all_sorted.cancel()
+            # Items aren't lost when a pending get is cancelled
+            get.cancel()
+
+    async def _lease_pooled_instances(self):
+        if not self._config('aws', 'ec2', 'pool', 'name'):
+            return None, []
+
+        pool = InstancePool(self._config)
+        num_needed = self._total_instances_needed - len(self._instances or [])
+        return pool, await pool.lease(num_needed, self._request_id)
+
+    def _start_runs_on_instance(self, ec2_instance_manager, instance, queues):
+        instance_type = ec2_instance_manager.get_instance_type(instance)
+        # Counted right away, so that the instance's type isn't
+        # considered unserved before its runs start
+        self._num_serving[instance_type] += 1
+        self._num_pending[instance_type] -= 1
+        return asyncio.ensure_future(self._run_on_instances(
+            ec2_instance_manager, instance, queues, instance_type))
+
+    async def _run_on_instances(self, ec2_instance_manager, instance, queues,
+            instance_type):
+        """Runs on the instance, and then on each instance that replaces
+        it, if any
+        """
+        try:
+            while instance:
+                last_instance = instance
+                instance = await self._run_on_instance(ec2_instance_manager,
+                    instance, queues[instance_type], instance_type)
+        finally:
+            self._num_serving[instance_type] -= 1
+        if (last_instance.id in self._idle_instance_ids
+                and self._num_fires_on(queues[instance_type]) > 0):
+            # Fires were released while the instance was being released
+            self._ensure_served(queues, instance_type)
+        self._abort_if_unserved(ec2_instance_manager, queues, instance_type)
+
+    def _abort_if_unserved(self, ec2_instance_manager, queues, instance_type):
+        """Aborts fires left on the instance type's queue if there are no
+        more instances of that type to run them, so that, when streaming
+        input, filling the queues isn't blocked on it
+        """
+        queue = queues[instance_type]
+        if (not self._num_serving[instance_type]
+                and not ec2_instance_manager.is_preparing(instance_type)
+                and not self._num_launching[instance_type]
+                and queue not in self._exhausted_queues
+                and instance_type not in self._aborted_types
+                and not self._is_waiting_for_met(queue, instance_type)):
+            logging.warning("No %s instances left to run on", instance_type)
+            self._aborted_types.add(instance_type)
+            self._aborts.append(asyncio.ensure_future(
+                self._abort_remaining(queue, instance_type)))
+
+    def _is_waiting_for_met(self, queue, instance_type):
+        """Returns whether the only fires of the type left to run are
+        waiting for met, in which case an instance is launched for them
+        once they're released
+        """
+        return (self._all_fires_sorted.is_set()
+            and self._num_fires_on(queue) <= 0
+            and self._num_waiting_for_met[instance_type] > 0)
+
+    async def _run_on_instance(self, ec2_instance_manager, instance, queue,
+            instance_type):
+        """Runs fires from the queue on the instance until the queue is
+        empty, returning the instance's replacement if it was interrupted
+        and could be replaced
+        """
+        ip = instance.classic_address.public_ip
+        replacement = None
+        failed = False
+        try:
+            num_slots = await self._get_num_slots(ip)
+            logging.info("Running %s concurrent runs on %s", num_slots, ip)
+            slots = asyncio.ensure_future(asyncio.gather(*[
+                self._run_in_slot(instance, slot, queue, instance_type)
+                for slot in range(num_slots)
+            ]))
+            if not ec2_instance_manager.is_spot(instance):
+                await slots
+            elif await self._run_until_interrupted(slots, ip):
+                replacement = await ec2_instance_manager.replace_instance(
+                    instance)
+
+        except Exception as e:
+            # Any fires not yet pulled off the queue will be
+            # run on other instances
+            logging.error("Failed to run on %s: %s", ip, e, exc_info=True)
+            failed = True
+
+        finally:
+            if queue in self._exhausted_queues:
+                # No need to replace any instances of this type that
+                # fail from here on
+                ec2_instance_manager.stop_launching(instance_type)
+            # Interrupted instances were already terminated when replaced
+            await ec2_instance_manager.terminate_instance(instance,
+                failed=failed)
+
+        return replacement
+
+    async def _run_until_interrupted(self, slots, ip):
+        """Waits for the spot instance's slots to finish, unless the
+        instance receives an interruption notice first, in which case the
+        slots are cancelled, putting their runs back on the queue, and
+        the notice is returned.
+        """
+        watcher = asyncio.ensure_future(self._watch_for_interruption(ip))
+        await asyncio.wait([slots, watcher],
+            return_when=asyncio.FIRST_COMPLETED)
+        if slots.done():
+            watcher.cancel()
+            return None
+
+        notice = watcher.result()
+        logging.warning("Spot instance %s was issued an interruption notice:"
+            " %s", ip, notice)
+        self._interruption_notices[ip] = notice
+        slots.cancel()
+        await asyncio.gather(slots, return_exceptions=True)
+        await self._status_tracker.set_instance_status(ip,
+            interruption=notice)
+        return notice
+
+    # Each remote check for interruption notices polls for about this
+    # long before returning, to limit the number of ssh executions
+    SECONDS_PER_INTERRUPTION_WATCH = 60
+
+    async def _watch_for_interruption(self, ip):
+        """Returns the spot interruption notice issued for the instance,
+        once there is one
+        """
+        interval = self._config('aws', 'ec2', 'spot',
+            'seconds_between_interruption_checks')
+        script = form_interruption_check_script(
+            self._config('aws', 'ec2', 'spot', 'metadata_url'), interval,
+            max(1, self.SECONDS_PER_INTERRUPTION_WATCH // interval))
+        while True:
+            try:
+                ssh_client = await self._ssh_pool.get(ip)
+                result = await ssh_client.execute(
+                    "bash << '{d}'\n{script}\n{d}".format(script=script,
+                    d=self.INTERRUPTION_SCRIPT_DELIMITER))
+                notice = parse_interruption_notice(result.stdout)
+                if notice:
+                    return notice
+
+            except Exception as e:
+                logging.warning("Failed to check %s for interruption: %s",
+                    ip, e)
+                await asyncio.sleep(interval)
+
+    INTERRUPTION_SCRIPT_DELIMITER = "__BLUESKY_AWS_INTERRUPTION_EOF__"
+
+    async def _get_num_slots(self, ip):
+        slots = self._config('aws', 'ec2', 'slots_per_instance')
+        if slots != 'auto':
+            return slots
+
+        # One slot per vCPU, or per the number of cpus each
+        # container is limited to, if configured
+        ssh_client = await self._ssh_pool.get(ip)
+        result = await ssh_client.execute('nproc')
+        num_cpus = int(result.stdout.strip())
+        cpus_per_slot = self._config('bluesky', 'docker', 'cpus') or 1
+        return max(1, int(num_cpus / cpus_per_slot))
+
+    async def _run_in_slot(self, instance, slot, queue, instance_type):
+        ip = instance.classic_address.public_ip
+        # Each slot runs its own container, which needs a name that's unique
+        # on the instance
+        container_name = '{}-{}'.format(self._request_id, slot)
+        while True:
+            # Existing instances are kept running regardless
+            item = await self._get_from_queue(queue, None
+                if instance in (self._instances or []) else instance_type)
+            if item is self.END_OF_QUEUE:
+                break
+            if item is self.IDLE:
+                logging.info("Releasing slot %s on %s while the rest of "
+                    "its fires wait for met", slot, ip)
+                self._idle_instance_ids.add(instance.id)
+                break
+
+            runner = self._create_runner(*item, instance_type=instance_type)
+            try:
+                await runner.run(instance, self._ssh_pool, container_name)
 
-            await self._status_tracker.set_system_state(SystemState.COMPLETE)
+            except asyncio.CancelledError:
+                # The instance was interrupted, so the run is put back
+                # on the queue, to be run on another instance
+                queue.put_back((item[0], item[1], runner.run_id))
+                await self._status_tracker.record_interruption(runner,
+                    ip=ip, notice=self._interruption_notices.get(ip))
+                raise
+
+            except Exception as e:
+                # Errors not handled by the run itself, e.g. failing to
+                # record its input, only fail that run, and the slot goes
+                # on to the next one
+                logging.error("Failed to run %s in slot %s on %s: %s",
+                    runner.run_id, slot, ip, e, exc_info=True)
+                await self._set_run_unknown(runner, str(e))
+
+    async def _set_run_unknown(self, runner, message):
+        try:
+            await self._status_tracker.set_run_status(runner, Status.UNKNOWN,
+                message=message)
+        except Exception as e:
+            logging.error("Failed to record status of %s: %s", runner.run_id,
+                e, exc_info=True)
+
+    async def _abort_remaining(self, queue, instance_type):
+        while True:
+            item = await self._get_from_queue(queue)
+            if item is self.END_OF_QUEUE:
+                break
+            runner = self._create_runner(*item, instance_type=instance_type)
+            await runner.abort("No instance was available to run on")
 
+    def _create_runner(self, input_data, fire_metadata, run_id=None,
+            instance_type=None):
+        return BlueskySingleRunner(input_data, self._config,
+            self._staged_bluesky_config, self._request_id, self._status_tracker,
+            self._bluesky_today, self._s3_client, fire_metadata=fire_metadata,
+            run_id=run_id, instance_type=instance_type,
+            result_cache=self._result_cache)
 
 
     ## Notifications
@@ -202,79 +937,180 @@ class BlueskyParallelRunner(object):
 
 class BlueskySingleRunner(object):
 
-    def __init__(self, input_data, ec2_instance_manager, instance, config,
-            bluesky_config, request_id, status_tracker, bluesky_today):
+    def __init__(self, input_data, config, bluesky_config, request_id,
+            status_tracker, bluesky_today, s3_client, fire_metadata=None,
+            run_id=None, instance_type=None, result_cache=None):
+        """
+        Args:
+
+         - bluesky_config - StagedFile containing the bluesky config, which
+           is shared by all runs
+        Kwargs:
+
+         - fire_metadata - the fire's row in the input's FireMetadataIndex;
+           parsed from the fire if not provided
+         - run_id - id of a previous, interrupted attempt at the run;
+           a new one is formed if not provided
+         - instance_type - the instance type chosen for the run by the
+           sizing policy, which is recorded in its status
+         - result_cache - ResultCache in which to record where the output
+           and log were published, if the run succeeds
+        """
         self._input_data = input_data
-        self._ec2_instance_manager = ec2_instance_manager
-        self._instance = instance
-        self._ip = self._instance.classic_address.public_ip
+        self._fire_metadata = fire_metadata
+        self._s3_client = s3_client
         self._config = config
         self._bluesky_config = bluesky_config
         self._request_id = request_id
         self._status_tracker = status_tracker
         self._bluesky_today = bluesky_today
-        self._set_run_id()
+        self._run_id = run_id
+        self._instance_type = instance_type
+        self._result_cache = result_cache
+        if not self._run_id:
+            self._set_run_id()
         self._output_url = None
         self._log_url = None
-        logging.info("Run %s will be executed on %s", self._run_id, self._ip)
 
     ## Public Interface
 
-    async def run(self):
-        await self._record_input()
+    async def run(self, instance, ssh_pool, container_name):
+        """Executes the run on the given instance, using the instance's
+        connection in the given SshConnectionPool.  The instance is not
+        terminated after the run, so that it may be used for subsequent
+        runs.
+
+        The container name must not be in use by any other run that's
+        executing concurrently on the instance.
+        """
+        self._instance = instance
+        self._ip = self._instance.classic_address.public_ip
+        self._ssh_client = None
+        self._container_name = container_name
+        self._host_data_dir = None
+        self._image_digest = None
+        self._exit_code = None
+        self._archive_info = None
+        # s3 keys of published files, by url attribute
+        self._published_keys = {}
+        logging.info("Run %s will be executed on %s", self._run_id, self._ip)
+
+        timer = StageTimer()
+        with timer.time('record_input'):
+            await self._record_input()
         await self._status_tracker.set_run_status(self, Status.RUNNING,
-            fire_info=self._get_fire_info())
+            fire_id=self._get_fire_id(), fire_info=self._get_fire_info(),
+            instance_type=self._instance_type)
         logging.info("Running BlueskySingleRunner.run on %s", self._ip)
 
         try:
-            with SshClient(self._config('ssh_key'), self._ip) as ssh_client:
-                try:
-                    self._ssh_client = ssh_client
-                    await self._create_remote_dirs()
-                    await self._write_remote_files()
-                    await self._install_bluesky_and_dependencies()
-                    # TODO: check for met and wait until it arrives,
-                    #   setting system status to WAITING until is available
-                    await self._run_bluesky()
-                    await self._tarball()
-                    await self._upload_aws_credentials()
-                    await self._publish_output()
-                    await self._publish_log()
-
-                except Exception as e:
-                    logging.error(str(e), exc_info=True)
-                    await self._status_tracker.set_run_status(self,
-                        Status.UNKNOWN, message=str(e),
-                        output_url=self._output_url, log_url=self._log_url)
-
-                else:
-                    # TODO: also check return value of bsp to detect
-                    #    failure, if possible
-                    error = await self._check_output_for_error()
-                    status = Status.FAILURE if error else Status.SUCCESS
-                    status_kwargs = dict(
-                        output_url=self._output_url,
-                        log_url=self._log_url
-                    )
-                    if error:
-                        status_kwargs.update(error=error)
-                    await self._status_tracker.set_run_status(self,
-                        status, **status_kwargs)
-
-                finally:
-                    # Lastly, try cleaning up, if configured to do so.
-                    # Errors are ignored
-                    await self._cleanup()
+            # The connection is retrieved for each run, so that it's
+            # checked and reopened if it was dropped
+            self._ssh_client = await ssh_pool.get(self._ip)
+            with timer.time('bootstrap'):
+                await self._bootstrap()
+            with timer.time('run_bluesky'):
+                await self._run_bluesky()
+            with timer.time('archive'):
+                await self._archive()
+            with timer.time('upload_aws_credentials'):
+                await self._upload_aws_credentials()
+            with timer.time('publish_output'):
+                await self._publish_output()
+            with timer.time('publish_log'):
+                await self._publish_log()
 
         except Exception as e:
             logging.error(str(e), exc_info=True)
-            # TODO: determine error, if possible
-            await self._status_tracker.set_run_status(self, Status.UNKNOWN,
-                message=str(e))
+            await self._status_tracker.set_run_status(self,
+                Status.UNKNOWN, message=str(e),
+                output_url=self._output_url, log_url=self._log_url,
+                timings=timer.timings)
+
+        else:
+            with timer.time('check_output_for_error'):
+                error = await self._check_output_for_error()
+            if not error and self._exit_code:
+                error = "bsp exited with code {}".format(self._exit_code)
+            status = Status.FAILURE if error else Status.SUCCESS
+            status_kwargs = dict(
+                output_url=self._output_url,
+                log_url=self._log_url,
+                image_digest=self._image_digest,
+                exit_code=self._exit_code,
+                archive=self._archive_info,
+                timings=timer.timings
+            )
+            if error:
+                status_kwargs.update(error=error)
+            await self._status_tracker.set_run_status(self,
+                status, **status_kwargs)
+            if status == Status.SUCCESS and self._result_cache and self._output_url:
+                await self._result_cache.store(self._input_data,
+                    self._request_id, self._run_id,
+                    self._published_keys['_output_url'],
+                    self._published_keys.get('_log_url'))
 
         finally:
-            await self._ec2_instance_manager.terminate_instance(self._instance)
+            # Lastly, try cleaning up, if configured to do so.
+            # Errors are ignored
+            await self._cleanup()
+
+    async def reuse(self, entry):
+        """Copies the output and log of an earlier run with the same
+        inputs, given its ResultCache entry, into this run's paths in s3,
+        and marks the run as successful, without executing it.  Returns
+        False, without recording anything, if they couldn't be copied.
+        """
+        bucket = self._config('aws', 's3', 'bucket_name')
+        s3_path = self._config('aws', 's3', 'output_path').strip('/')
+        ext = os.path.basename(entry['output_key'])[len(entry['run_id']):]
+        copies = [(entry['output_key'], self._s3_key(s3_path, ext))]
+        if entry.get('log_key'):
+            copies.append((entry['log_key'], self._s3_key('log', '.log')))
+
+        try:
+            for source_key, key in copies:
+                await self._s3_client.copy_object(Bucket=bucket, Key=key,
+                    CopySource={'Bucket': bucket, 'Key': source_key})
+        except Exception as e:
+            logging.warning("Failed to reuse output of %s: %s",
+                entry['run_id'], e)
+            return False
 
+        logging.info("Reusing output of %s for %s", entry['run_id'],
+            self._run_id)
+        await self._record_input()
+        await self._status_tracker.set_run_status(self, Status.SUCCESS,
+            fire_id=self._get_fire_id(), fire_info=self._get_fire_info(),
+            output_url=self._s3_url(s3_path, self._run_id + ext),
+            log_url=(self._s3_url('log', self._run_id + '.log')
+                if entry.get('log_key') else None),
+            cached_from={k: entry[k] for k in ('request_id', 'run_id', 'created')})
+        return True
+
+    async def carry_forward(self, previous_request_id, run_status):
+        """Marks the run as successful, without executing it, with the
+        status of the successful run of the unchanged fire in the given
+        previous request, whose output and log are referenced in place.
+        """
+        await self._record_input()
+        await self._status_tracker.set_run_status(self, Status.SUCCESS,
+            fire_id=self._get_fire_id(), fire_info=self._get_fire_info(),
+            **{k: v for k, v in run_status.items()
+                if k not in ('status', 'run_id', 'fire_id', 'fire_info',
+                    'carried_forward_from', 'timings')},
+            carried_forward_from={'request_id': previous_request_id,
+                'run_id': run_status['run_id']})
+
+    async def abort(self, message):
+        """Records the run's input and marks it as unknown without
+        executing it.
+        """
+        await self._record_input()
+        await self._status_tracker.set_run_status(self, Status.UNKNOWN,
+            fire_id=self._get_fire_id(), fire_info=self._get_fire_info(),
+            instance_type=self._instance_type, message=message)
 
     @property
     def run_id(self):
@@ -288,51 +1124,9 @@ class BlueskySingleRunner(object):
             return self._input_data['fires'][0]['id']
 
     def _get_fire_info(self):
-        fire_info = {
-            'area': None,
-            'lat': None,
-            'lng': None
-        }
-        try:
-            area = 0
-            for a in self._input_data['fires'][0]['activity']:
-                for aa in a['active_areas']:
-                    if 'specified_points' in aa:
-                        for sp in aa['specified_points']:
-                            area += sp['area']
-                            if not fire_info['lat']:
-                                fire_info.update(
-                                    lat=sp['lat'],
-                                    lng=sp['lng']
-                                )
-
-                    elif 'perimeter' in aa:
-                        area += aa['perimeter'].get('area', 0)
-
-                        if not fire_info['lat']:
-                            first_coord = None
-
-                            if 'polygon' in aa['perimeter']:
-                                first_coord = aa['perimeter']['polygon'][0]
-
-                            elif 'geometry' in aa['perimeter']:
-                                if aa['perimeter']['geometry']['type'] == 'MultiPolygon':
-                                    first_coord = aa['perimeter']['geometry']['coordinates'][0][0][0]
-                                elif aa['perimeter']['geometry']['type'] == 'Polygon':
-                                    first_coord = aa['perimeter']['geometry']['coordinates'][0][0]
-
-                            if first_coord:
-                                fire_info.update(
-                                    lat=first_coord[1],
-                                    lng=first_coord[0]
-                                )
-
-            fire_info['area'] = area
-
-        except Exception as e:
-            logging.warn("Failed to parse fire info from input file")
-
-        return fire_info
+        fire_info = (self._fire_metadata
+            or get_fire_info(self._input_data['fires'][0]))
+        return {k: fire_info[k] for k in ('area', 'lat', 'lng')}
 
     def _set_run_id(self):
         # if run_id_format is not defined, set run id to fire id, if
@@ -351,7 +1145,7 @@ class BlueskySingleRunner(object):
             self._run_id = "fire-" + fire_id if fire_id else str(uuid.uuid4())
 
     async def _record_input(self):
-        await run_in_loop_executor(boto3.client('s3').put_object,
+        await self._s3_client.put_object(
             Body=json.dumps(self._input_data),
             Bucket=self._config('aws', 's3', 'bucket_name'),
             Key=os.path.join('input', self._request_id,
@@ -383,61 +1177,67 @@ class BlueskySingleRunner(object):
                 raise e
 
 
-    async def _create_remote_dirs(self):
-        logging.info("Creating remote dirs on %s", self._ip)
-        self._remote_home_dir = await self._execute('echo $HOME')
-        # TODO: handle self._remote_home_dir == None
-        # create dir, in case it doesn't already exist
-        self._host_data_dir = os.path.join(self._remote_home_dir,
-            "data/bluesky/", self._run_id)
-        await self._execute("mkdir -p {}".format(self._host_data_dir))
-        # clear out any old output, if there is any
-        await self._execute("rm -r {}".format(
-            os.path.join(self._host_data_dir, '*')), ignore_errors=True)
-
-    async def _write_remote_files(self):
-        logging.info("Writing remote files on %s", self._ip)
-        await self._write_remote_json_file(self._bluesky_config,
-            os.path.join(self._host_data_dir, 'config.json'))
-        await self._write_remote_json_file(self._input_data,
-            os.path.join(self._host_data_dir, 'input.json'))
-
-    async def _write_remote_json_file(self, data, remote_file_path):
+    async def _bootstrap(self):
+        """Creates the run's data dir, writes the config and input files,
+        checks that dependencies were installed when the instance was
+        initialized, and pulls the bluesky image if it wasn't already
+        pulled then, all with a single generated script, to avoid the
+        latency of executing each step separately.
+        """
+        logging.info("Bootstrapping run on %s", self._ip)
+        # The bluesky config is only embedded in the script if it's not
+        # known to already be cached on the instance and it can't be
+        # fetched from s3
+        embed = not (self._bluesky_config.is_staged_on(self._ip)
+            or self._bluesky_config.s3_url)
+        result = await self._execute_bootstrap_script(embed)
+        if result['staged_misses'] and not embed:
+            logging.warning("Failed to stage %s on %s. Retrying with "
+                "contents embedded", ', '.join(result['staged_misses']),
+                self._ip)
+            result = await self._execute_bootstrap_script(True)
+        if result['staged_misses']:
+            raise RuntimeError("Failed to stage {} on {}".format(
+                ', '.join(result['staged_misses']), self._ip))
+        self._bluesky_config.mark_staged(self._ip)
+        logging.info("Bootstrapped run on %s: %s", self._ip, result)
+
+        self._remote_home_dir = result['home_dir']
+        self._host_data_dir = result['host_data_dir']
+        self._has_remote_aws_credentials = result['has_aws_credentials']
+        self._image_digest = result['image_digest']
+        if result['image_pulled']:
+            logging.info("Pulled bluesky image on %s", self._ip)
+
+    async def _execute_bootstrap_script(self, embed):
+        script = form_bootstrap_script(self._run_id,
+            get_bluesky_image(self._config),
+            {'input.json': self._input_data},
+            packages=get_archive_packages(self._config),
+            staged_files={'config.json': self._bluesky_config},
+            embed=embed,
+            cache_dir=self._config('bluesky', 'staged_config', 'cache_dir'))
+        remote_script_path = "/tmp/bluesky-aws-bootstrap-{}.sh".format(
+            self._run_id)
         with tempfile.NamedTemporaryFile(mode='w') as f:
-            f.write(json.dumps(data))
+            f.write(script)
             f.flush()
-            await self._ssh_client.put(f.name, remote_file_path)
-
-    async def _install_bluesky_and_dependencies(self):
-        logging.info("Installing bluesky and dependencies on %s", self._ip)
-        # Note: it's advised to have these pre-installed on the
-        #    ec2 instance, but this is just in case they're not
-
-        # Note: these installation commands are ubuntu/debian specific
-        if not (await self._execute("which aws")):
-            await self._execute("sudo apt -y install awscli")
-
-        if not (await self._execute("which docker")):
-            await self._execute('sudo apt update')
-            await self._execute('sudo apt install -y apt-transport-https ca-certificates curl software-properties-common')
-            await self._execute('curl -fsSL https://download.docker.com/linux/ubuntu/gpg | sudo apt-key add -')
-            await self._execute('sudo add-apt-repository "deb [arch=amd64] https://download.docker.com/linux/ubuntu bionic stable"')
-            await self._execute('sudo apt update')
-            await self._execute('apt-cache policy docker-ce')
-            await self._execute('sudo apt install -y docker-ce')
+            await self._ssh_client.put(f.name, remote_script_path)
 
-        await self._execute("docker pull pnwairfire/bluesky:{}".format(
-            self._config('bluesky_version')))
+        return parse_bootstrap_result(
+            await self._execute("bash {}".format(remote_script_path)))
 
     async def _run_bluesky(self):
         """Runs bluesky
 
         Due to a bug in paramiko which causes it to hang on longer
         running processes, we run bsp in the background and then
-        poll until it finishes.
+        wait, in bounded intervals, until it finishes.
         """
         logging.info("Running bluesky on %s", self._ip)
         cmd = self._form_bsp_command()
+        if self._config('bluesky', 'completion_check_strategy') == 'wait':
+            cmd = self._add_completion_waiter(cmd)
         # TODO: verify that ignore_errors=True is no longer needed now
         #   that we're running bsp in the background, and
         # Note: Running bsp through hysplit dispersion results in output
@@ -445,7 +1245,7 @@ class BlueskySingleRunner(object):
         #     'Warning 1: No UNIDATA NC_GLOBAL:Conventions attribute'
         #   So, ignore stderr
         await self._execute(cmd, ignore_errors=True)
-        await self._wait_for_bsp_to_complete()
+        self._exit_code = await self._wait_for_bsp_to_complete()
         await self._execute('sudo chown -R $USER:$USER {}'.format(
             self._host_data_dir))
 
@@ -454,14 +1254,25 @@ class BlueskySingleRunner(object):
         #  OpenBLAS blas_thread_init: pthread_create failed for thread 1 of 2: Operation not permitted
         # TODO: allow users to specify extra docker run options
         #  (like '--security-opt') in the config
-        cmd = "docker run --security-opt seccomp=unconfined --name {name} -d --rm -v {host_data_dir}:/data/bluesky/".format(
-            name=self._request_id, host_data_dir=self._host_data_dir)
-
+        cmd = "docker run --security-opt seccomp=unconfined --name {name} -d -v {host_data_dir}:/data/bluesky/".format(
+            name=self._container_name, host_data_dir=self._host_data_dir)
+        if self._config('bluesky', 'completion_check_strategy') == 'poll':
+            # When waiting on completion, the container is removed
+            # after its exit code is captured
+            cmd += " --rm"
+
+        # Resource limits, to keep concurrent runs on the same instance
+        # from starving each other
+        if self._config('bluesky', 'docker', 'cpus'):
+            cmd += " --cpus {}".format(self._config('bluesky', 'docker', 'cpus'))
+        if self._config('bluesky', 'docker', 'memory'):
+            cmd += " --memory {}".format(self._config('bluesky', 'docker', 'memory'))
 
         for v in self._config('aws', 'ec2', 'efs_volumes'):
             cmd += " -v {d}:{d}".format(d=v[1])
 
-        cmd += (" pnwairfire/bluesky:{version}"
+        # The same image that's pulled when instances are initialized
+        cmd += (" {image}"
             " bsp --log-level=DEBUG"
             " --run-id={run_id}"
             " -c /data/bluesky/config.json"
@@ -471,7 +1282,7 @@ class BlueskySingleRunner(object):
             " --today {today}"
             " {modules}"
             ).format(
-                version=self._config('bluesky_version'),
+                image=get_bluesky_image(self._config),
                 run_id=self._run_id,
                 today=self._bluesky_today.strftime('%Y-%m-%d'),
                 modules=' '.join(self._config('bluesky', 'modules') + ['export'])
@@ -479,9 +1290,80 @@ class BlueskySingleRunner(object):
 
         return cmd
 
+    EXIT_CODE_FILENAME = 'bsp-exit-code'
+
+    def _add_completion_waiter(self, cmd):
+        """Wraps the bsp command so that a background process on the
+        instance waits for the container to exit, writes its exit code
+        to file, and then removes the container.
+        """
+        exit_code_pathname = os.path.join(self._host_data_dir,
+            self.EXIT_CODE_FILENAME)
+        waiter = ("docker wait {name} > {f}.tmp 2>&1; mv {f}.tmp {f};"
+            " docker rm {name}").format(name=self._container_name,
+            f=exit_code_pathname)
+        # Remove any container left over from a previous run in this slot
+        return ("docker rm -f {name} > /dev/null 2>&1; {cmd}"
+            " && (nohup sh -c '{waiter}' > /dev/null 2>&1 &)").format(
+            name=self._container_name, cmd=cmd, waiter=waiter)
+
     async def _wait_for_bsp_to_complete(self):
+        """Waits for bsp to complete, and returns its exit code, if known.
+        """
+        if self._config('bluesky', 'completion_check_strategy') == 'wait':
+            return await self._wait_for_exit_code()
+
+        await self._poll_for_bsp_completion()
+
+    async def _wait_for_exit_code(self):
+        # Each check blocks on the instance until the exit code file is
+        # written or until the timeout is reached, so that completion is
+        # detected within a second while limiting the number of remote
+        # executions, and so that no single execution runs long enough
+        # to trigger the paramiko bug mentioned above.  Output is empty
+        # if the timeout is reached.
+        wait_time = self._config('bluesky', 'seconds_per_completion_wait')
+        exit_code_pathname = os.path.join(self._host_data_dir,
+            self.EXIT_CODE_FILENAME)
+        wait_cmd = ("timeout {t} sh -c 'while [ ! -e {f} ]; do sleep 1; done';"
+            " cat {f} 2> /dev/null || true").format(t=wait_time,
+            f=exit_code_pathname)
+        num_waits_since_exit = 0
+        while True:
+            logging.info("Waiting up to %s seconds for bsp to complete on %s",
+                wait_time, self._ip)
+            exit_code = await self._execute(wait_cmd)
+            if exit_code:
+                break
+
+            # The exit code is written as soon as the container exits, so
+            # if it's still missing after another wait, it never will be,
+            # e.g. if 'docker run' failed or the waiter died
+            if not await self._is_container_running():
+                num_waits_since_exit += 1
+                if num_waits_since_exit > 1:
+                    raise RuntimeError("bsp container {} on {} exited without"
+                        " its exit code being recorded".format(
+                        self._container_name, self._ip))
+
+        logging.info("bsp run complete with exit code %s", exit_code)
+        try:
+            return int(exit_code)
+        except ValueError:
+            # e.g. if the container was removed before 'docker wait' ran
+            logging.warning("Failed to determine bsp exit code: %s", exit_code)
+
+    async def _is_container_running(self):
+        return bool(await self._execute("docker ps -q -f 'name=^/?{}$'".format(
+            self._container_name)))
+
+    async def _poll_for_bsp_completion(self):
         poll_wait = self._config('bluesky', 'seconds_between_completion_checks')
-        ps_cmd = 'docker ps -f name={} |grep -v CONTAINER'.format(self._request_id)
+        # The name filter matches substrings, so it's anchored to avoid
+        # matching other slots' containers (e.g. '<request_id>-1' and
+        # '<request_id>-10')
+        ps_cmd = "docker ps -f 'name=^/?{}$' |grep -v CONTAINER".format(
+            self._container_name)
         while True:
             logging.info("Waiting %s before checking if bsp completed", poll_wait)
             await asyncio.sleep(poll_wait)
@@ -493,20 +1375,33 @@ class BlueskySingleRunner(object):
                 break
         logging.info("bsp run complete")
 
-    async def _tarball(self):
+    async def _archive(self):
+        if self._config('aws', 's3', 'stream_output'):
+            # The archive is streamed directly to s3 when publishing
+            return
+
         try:
-            logging.info("Creating tarball on %s", self._ip)
-            await self._execute(("cd {host_data_dir}/exports/; tar czf "
-                " {run_id}.tar.gz {run_id}").format(
-                host_data_dir=self._host_data_dir, run_id=self._run_id))
+            logging.info("Archiving output on %s", self._ip)
+            await self._execute_archive_script(form_archive_script(
+                self._config, self._run_id,
+                os.path.join(self._host_data_dir, 'exports')))
         except Exception as e:
-            logging.error("Failed to created tarball: %s", e)
+            logging.error("Failed to archive output: %s", e)
+
+    ARCHIVE_SCRIPT_DELIMITER = "__BLUESKY_AWS_ARCHIVE_EOF__"
+
+    async def _execute_archive_script(self, script):
+        result = parse_archive_result(await self._execute(
+            "bash << '{d}'\n{script}\n{d}".format(script=script,
+            d=self.ARCHIVE_SCRIPT_DELIMITER)))
+        logging.info("Archived output on %s: %s", self._ip, result)
+        self._archive_info = dict(result, codec=self._config('archive', 'codec'))
 
     async def _upload_aws_credentials(self):
         logging.info("Uploading AWS credentials to %s", self._ip)
         # Credentials are uploaded in order to push to s3
         remote_aws_dir = os.path.join(self._remote_home_dir, ".aws")
-        if not await self._execute('ls {}'.format(remote_aws_dir), ignore_errors=True):
+        if not self._has_remote_aws_credentials:
             local_aws_dir = os.path.join(os.environ["HOME"], ".aws/")
             # TODO: if recursive put fails, update put/get to support it
             await self._ssh_client.put(local_aws_dir, remote_aws_dir)
@@ -514,12 +1409,21 @@ class BlueskySingleRunner(object):
     async def _publish_output(self):
         try:
             logging.info("Publishing output from %s", self._ip)
-            filename = "{}.tar.gz".format(self._run_id)
             s3_path = self._config('aws', 's3', 'output_path')
-            await self._publish(filename, s3_path, '_output_url', 'exports/', '.tar.gz')
+            if self._config('aws', 's3', 'stream_output'):
+                await self._stream_output(s3_path, '_output_url')
+            elif self._archive_info:
+                ext = self._archive_info['extension']
+                filename = self._run_id + ext
+                await self._publish(filename, s3_path, '_output_url', 'exports/', ext)
         except Exception as e:
             logging.error("Failed to publish output: %s", e)
 
+        if self._archive_info and self._archive_info['compressed_bytes']:
+            self._archive_info['ratio'] = round(
+                self._archive_info['compressed_bytes']
+                / max(1, self._archive_info['uncompressed_bytes']), 3)
+
 
     async def _publish_log(self):
         logging.info("Publishing bluesky log file from %s", self._ip)
@@ -534,23 +1438,55 @@ class BlueskySingleRunner(object):
 
         s3_path = s3_path.strip('/')
         bucket = self._config('aws', 's3', 'bucket_name')
+        s3_key = self._s3_key(s3_path, ext)
 
-        s3_filename = self._run_id + ext
-        s3_url = "s3://" + os.path.join(
-            bucket, s3_path, self._request_id, s3_filename)
-
-        cmd = "aws s3 cp {} {}".format(local_pathname, s3_url)
+        cmd = "aws s3 cp {} s3://{}/{}".format(local_pathname, bucket, s3_key)
         await self._execute(cmd)
+        await self._check_published(s3_key, s3_path, filename, attr)
 
+    async def _stream_output(self, s3_path, attr):
+        """Pipes the archived output directly into a multipart s3 upload,
+        without writing the archive to disk.
+        """
+        s3_path = s3_path.strip('/')
+        bucket = self._config('aws', 's3', 'bucket_name')
+        s3_url_base = "s3://{}/{}".format(bucket, self._s3_key(s3_path, ''))
+        script = form_archive_script(self._config, self._run_id,
+            os.path.join(self._host_data_dir, 'exports'), s3_url_base=s3_url_base)
         try:
-            await self._execute("aws s3 ls {}".format(s3_url))
+            await self._execute_archive_script(script)
+        except Exception:
+            # Don't leave behind a partial upload, whichever extension
+            # was used
+            codec_ext = ARCHIVE_CODECS[self._config('archive', 'codec')][0]
+            for ext in {codec_ext, UNCOMPRESSED_EXT}:
+                await self._s3_client.delete_object(
+                    Bucket=bucket, Key=self._s3_key(s3_path, ext))
+            raise
+
+        ext = self._archive_info['extension']
+        response = await self._check_published(self._s3_key(s3_path, ext),
+            s3_path, self._run_id + ext, attr)
+        if response:
+            self._archive_info['compressed_bytes'] = response['ContentLength']
+
+    def _s3_key(self, s3_path, ext):
+        return os.path.join(s3_path, self._request_id, self._run_id + ext)
+
+    async def _check_published(self, s3_key, s3_path, filename, attr):
+        try:
+            response = await self._s3_client.head_object(
+                Bucket=self._config('aws', 's3', 'bucket_name'), Key=s3_key)
             setattr(self, attr, self._s3_url(s3_path, filename))
-        except:
-            # else attr remains None
-            pass
+            self._published_keys[attr] = s3_key
+            return response
+        except Exception as e:
+            # attr remains None
+            logging.error("Failed to verify that %s was published: %s",
+                s3_key, e)
 
     async def _cleanup(self):
-        if self._config('cleanup_output'):
+        if self._config('cleanup_output') and self._host_data_dir:
             logging.info("Cleaning up output on %s", self._ip)
             # delete the entire output dir
             await self._execute("rm -r {}".format(self._host_data_dir),
@@ -0,0 +1,122 @@
+import json
+
+__all__ = [
+    "ARCHIVE_CODECS",
+    "UNCOMPRESSED_EXT",
+    "get_archive_packages",
+    "form_archive_script",
+    "parse_archive_result"
+]
+
+# Maps each codec to the archive's file extension and the package
+# that provides the compression utility, if it's not installed by default
+ARCHIVE_CODECS = {
+    'gzip': ('.tar.gz', None),
+    'pigz': ('.tar.gz', 'pigz'),
+    'zstd': ('.tar.zst', 'zstd'),
+    'zip': ('.zip', 'zip'),
+    'none': ('.tar', None)
+}
+
+UNCOMPRESSED_EXT = '.tar'
+
+ARCHIVE_SCRIPT_TEMPLATE = """set -e -o pipefail
+cd {exports_dir}
+UNCOMPRESSED_BYTES=$(du -sb {run_id} | cut -f1)
+EXT={ext}
+{store_check}
+START=$(date +%s.%N)
+case $EXT in
+    {uncompressed_ext}) tar cf - {run_id} ;;
+    *) {archive_cmd} ;;
+esac {destination}
+END=$(date +%s.%N)
+COMPRESSED_BYTES={compressed_bytes}
+export UNCOMPRESSED_BYTES COMPRESSED_BYTES EXT START END
+python3 -c 'import json, os; print(json.dumps({{
+    "extension": os.environ["EXT"],
+    "seconds": round(float(os.environ["END"]) - float(os.environ["START"]), 3),
+    "uncompressed_bytes": int(os.environ["UNCOMPRESSED_BYTES"]),
+    "compressed_bytes": int(os.environ["COMPRESSED_BYTES"] or 0) or None
+}}))'
+"""
+
+# Archives are stored uncompressed if the files with the configured
+# extensions, which are presumably already compressed, make up at least
+# the configured fraction of the output
+STORE_CHECK_TEMPLATE = """STORED_BYTES=$(find {run_id} -type f \\( {find_patterns} \\) -printf '%s\\n' | awk '{{s += $1}} END {{print s + 0}}')
+if awk "BEGIN {{exit !($UNCOMPRESSED_BYTES > 0 && $STORED_BYTES / $UNCOMPRESSED_BYTES >= {store_fraction})}}"; then
+    EXT={uncompressed_ext}
+fi"""
+
+def get_archive_packages(config):
+    """Returns the packages that need to be installed on the instance
+    for the configured codec
+    """
+    package = ARCHIVE_CODECS[config('archive', 'codec')][1]
+    return [package] if package else []
+
+def _form_archive_cmd(config, run_id):
+    codec = config('archive', 'codec')
+    level = config('archive', 'level')
+    level_opt = ' -{}'.format(level) if level is not None else ''
+    # 0 tells zstd to use all cores; pigz uses all cores by default
+    threads = config('archive', 'threads')
+
+    if codec in ('gzip', 'pigz', 'zstd'):
+        compressor = codec + level_opt
+        if codec == 'pigz' and threads:
+            compressor += ' -p {}'.format(threads)
+        elif codec == 'zstd':
+            compressor += ' -q -T{}'.format(threads or 0)
+        return "tar cf - {} | {} -c".format(run_id, compressor)
+
+    elif codec == 'zip':
+        # zip stores files with the specified suffixes without compressing them
+        suffixes = ':'.join(config('archive', 'store_extensions'))
+        store_opt = ' -n {}'.format(suffixes) if suffixes else ''
+        return "zip -q -r{}{} - {}".format(level_opt, store_opt, run_id)
+
+    # 'none'
+    return "tar cf - {}".format(run_id)
+
+def form_archive_script(config, run_id, exports_dir, s3_url_base=None):
+    """Returns a bash script that archives the run's exported output and
+    prints a json object with the archive's extension, the time it took
+    to create, and its uncompressed and compressed sizes.
+
+    If s3_url_base is specified, the archive is streamed to s3, to
+    the url formed by appending the archive's extension, rather than
+    written to file.  In that case, the compressed size is not reported
+    and the reported time includes the upload.
+    """
+    codec = config('archive', 'codec')
+    ext = ARCHIVE_CODECS[codec][0]
+    store_extensions = config('archive', 'store_extensions')
+
+    store_check = ''
+    if store_extensions and codec not in ('zip', 'none'):
+        store_check = STORE_CHECK_TEMPLATE.format(run_id=run_id,
+            find_patterns=' -o '.join(["-iname '*{}'".format(e)
+                for e in store_extensions]),
+            store_fraction=config('archive', 'store_fraction'),
+            uncompressed_ext=UNCOMPRESSED_EXT)
+
+    if s3_url_base:
+        # The expected size (which is only needed by aws for streams
+        # larger than 50GB) is an upper bound, since it's uncompressed.
+        destination = ('| aws s3 cp - {}$EXT --expected-size $UNCOMPRESSED_BYTES'
+            ' > /dev/null').format(s3_url_base)
+        compressed_bytes = '""'
+    else:
+        destination = '> {}$EXT'.format(run_id)
+        compressed_bytes = '$(stat -c %s {}$EXT)'.format(run_id)
+
+    return ARCHIVE_SCRIPT_TEMPLATE.format(exports_dir=exports_dir,
+        run_id=run_id, ext=ext, store_check=store_check,
+        uncompressed_ext=UNCOMPRESSED_EXT,
+        archive_cmd=_form_archive_cmd(config, run_id),
+        destination=destination, compressed_bytes=compressed_bytes)
+
+def parse_archive_result(stdout):
+    return json.loads(stdout.strip().split('\n')[-1])
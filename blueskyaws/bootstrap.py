@@ -0,0 +1,184 @@
+import base64
+import hashlib
+import json
+
+__all__ = [
+    "StagedFile",
+    "form_bootstrap_script",
+    "parse_bootstrap_result"
+]
+
+# Delimits the base64 encoded file contents embedded in the script
+HEREDOC_DELIMITER = "__BLUESKY_AWS_EOF__"
+
+BOOTSTRAP_SCRIPT_TEMPLATE = """#!/usr/bin/env bash
+# Generated by bluesky-aws to prepare an instance for a single run.
+# Prints a json object summarizing what was done.
+set -e
+trap 'rm -f "$0"' EXIT
+
+HOST_DATA_DIR="$HOME/data/bluesky/{run_id}"
+LOG_FILE="$HOME/data/bluesky/bootstrap.log"
+
+# create dir, in case it doesn't already exist, and then
+# clear out any old output, if there is any
+mkdir -p "$HOST_DATA_DIR"
+rm -rf "$HOST_DATA_DIR"/*
+
+{write_files}
+
+# Dependencies are installed once per instance, when it's initialized,
+# rather than here, since runs bootstrapped concurrently on the instance
+# would contend for apt's lock; they're only checked for here
+MISSING=""
+for EXECUTABLE in aws docker {packages}; do
+    which $EXECUTABLE > /dev/null 2>&1 || MISSING="$MISSING $EXECUTABLE"
+done
+if [ -n "$MISSING" ]; then
+    echo "Missing dependencies:$MISSING" >&2
+    exit 1
+fi
+
+STAGED_MISSES=""
+{stage_files}
+
+# The image is normally pulled when the instance is initialized, so
+# it's only pulled here if that didn't happen or failed
+IMAGE_PULLED=""
+if ! docker image inspect {image} > /dev/null 2>&1; then
+    docker pull {image} > /dev/null
+    IMAGE_PULLED=1
+fi
+IMAGE_DIGEST=$(docker image inspect --format '{{{{index .RepoDigests 0}}}}' {image} 2> /dev/null || true)
+
+HAS_AWS_CREDENTIALS=$([ -e "$HOME/.aws" ] && echo 1 || echo "")
+
+export HOST_DATA_DIR IMAGE_PULLED IMAGE_DIGEST HAS_AWS_CREDENTIALS STAGED_MISSES
+python3 -c 'import json, os; print(json.dumps({{
+    "home_dir": os.environ["HOME"],
+    "host_data_dir": os.environ["HOST_DATA_DIR"],
+    "image_pulled": bool(os.environ["IMAGE_PULLED"]),
+    "image_digest": os.environ["IMAGE_DIGEST"] or None,
+    "has_aws_credentials": bool(os.environ["HAS_AWS_CREDENTIALS"]),
+    "staged_misses": os.environ["STAGED_MISSES"].split()
+}}))'
+"""
+
+# Staged files are copied into the run's data dir from the instance's
+# cache, which is populated, if necessary, with the embedded contents
+# or by fetching them from s3.  File names of any that couldn't be
+# staged are reported as misses
+STAGE_FILE_TEMPLATE = """STAGED_FILE="{cache_dir}/{hash}"
+if [ ! -e "$STAGED_FILE" ]; then
+    mkdir -p "{cache_dir}"
+{populate}
+fi
+if [ -e "$STAGED_FILE" ]; then
+    cp "$STAGED_FILE" "$HOST_DATA_DIR/{file_name}"
+else
+    STAGED_MISSES="$STAGED_MISSES {file_name}"
+fi"""
+
+# Written to temp files and then moved, so that concurrent runs
+# on the instance never see partially written files
+EMBED_STAGED_FILE_TEMPLATE = """    base64 -d > "$STAGED_FILE.$$" << '{delimiter}'
+{contents}
+{delimiter}
+    mv "$STAGED_FILE.$$" "$STAGED_FILE\""""
+
+FETCH_STAGED_FILE_TEMPLATE = """    (aws s3 cp --quiet {s3_url} "$STAGED_FILE.$$" >> "$LOG_FILE" 2>&1 \\
+        && mv "$STAGED_FILE.$$" "$STAGED_FILE") || rm -f "$STAGED_FILE.$$\""""
+
+DEFAULT_STAGED_FILE_CACHE_DIR = "$HOME/data/bluesky/staged"
+
+WRITE_FILE_TEMPLATE = """base64 -d > "$HOST_DATA_DIR/{file_name}" << '{delimiter}'
+{contents}
+{delimiter}"""
+
+class StagedFile(object):
+    """A json file that's shared by multiple runs, such as the bluesky
+    config, and that's cached on instances by the hash of its contents,
+    so that it only needs to be transferred to each instance once.
+
+    Tracks the instances on which it's known to have been staged.
+    """
+
+    def __init__(self, data, s3_url=None):
+        """
+        Args:
+
+         - data - json data
+         - s3_url - url from which instances can fetch the file, if not
+           already cached, rather than having it embedded in the
+           bootstrap script
+        """
+        self.contents = json.dumps(data, sort_keys=True)
+        self.hash = hashlib.sha256(self.contents.encode()).hexdigest()
+        self.s3_url = s3_url
+        self._staged_on = set()
+
+    def is_staged_on(self, ip):
+        return ip in self._staged_on
+
+    def mark_staged(self, ip):
+        self._staged_on.add(ip)
+
+def form_bootstrap_script(run_id, image, files, packages=None,
+        staged_files=None, embed=False, cache_dir=None):
+    """Returns a bash script that creates the run's data dir, writes the
+    given files to it, checks that dependencies are installed, and pulls
+    the bluesky docker image if it's not already on the instance, all in
+    one remote execution.
+
+    Args:
+
+     - run_id - used to name the run's data dir
+     - image - bluesky docker image, with tag
+     - files - dict mapping file names to json data
+     - packages - additional packages that must be installed; each
+       package is assumed to provide an executable of the same name
+     - staged_files - dict mapping file names to StagedFile objects,
+       which are copied from the instance's cache
+     - embed - whether or not to embed the contents of staged files,
+       to be cached if they're not already; if False, staged files
+       not already cached are fetched from s3, if they have s3 urls
+     - cache_dir - where staged files are cached on the instance;
+       defaults to $HOME/data/bluesky/staged
+    """
+    write_files = '\n'.join([
+        WRITE_FILE_TEMPLATE.format(file_name=file_name,
+            delimiter=HEREDOC_DELIMITER,
+            contents=_encode(json.dumps(data)))
+        for file_name, data in files.items()
+    ])
+
+    cache_dir = cache_dir or DEFAULT_STAGED_FILE_CACHE_DIR
+    stage_files = '\n'.join([
+        STAGE_FILE_TEMPLATE.format(file_name=file_name, hash=f.hash,
+            cache_dir=cache_dir, populate=_form_populate_cmd(f, embed))
+        for file_name, f in (staged_files or {}).items()
+    ])
+
+    return BOOTSTRAP_SCRIPT_TEMPLATE.format(run_id=run_id, image=image,
+        write_files=write_files, packages=' '.join(packages or []),
+        stage_files=stage_files)
+
+def _encode(contents):
+    # base64 encoding avoids having to escape anything, and
+    # the encoded contents can't contain the delimiter
+    return base64.encodebytes(contents.encode()).decode().rstrip('\n')
+
+def _form_populate_cmd(staged_file, embed):
+    if embed:
+        return EMBED_STAGED_FILE_TEMPLATE.format(delimiter=HEREDOC_DELIMITER,
+            contents=_encode(staged_file.contents))
+    if staged_file.s3_url:
+        return FETCH_STAGED_FILE_TEMPLATE.format(s3_url=staged_file.s3_url)
+    # Nothing to do but report the miss
+    return "    true"
+
+def parse_bootstrap_result(stdout):
+    """Parses the json object printed by the bootstrap script, which
+    is the last line of output.
+    """
+    return json.loads(stdout.strip().split('\n')[-1])
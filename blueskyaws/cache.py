@@ -0,0 +1,108 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import time
+
+__all__ = [
+    "ResultCache"
+]
+
+class ResultCache(object):
+    """Cache, in s3, of where the output and log of successful runs were
+    published, so that runs with the same inputs can reuse them rather
+    than re-running bluesky.
+
+    Entries are keyed by a hash of the run's input data, the merged
+    bluesky config, bluesky version, modules, and bluesky's 'today'.
+    Entries older than 'cache' > 'ttl_hours', or created before
+    'cache' > 'invalidate_before', are ignored, as are all entries if
+    'cache' > 'refresh' is set, in which case they're overwritten as
+    runs complete.
+    """
+
+    PATH = 'cache'
+
+    def __init__(self, config, s3_client, bluesky_config, bluesky_today):
+        """
+        Args:
+
+         - bluesky_config - StagedFile containing the merged bluesky config
+        """
+        self._config = config
+        self._s3_client = s3_client
+        self._bucket = config('aws', 's3', 'bucket_name')
+        self._base_key = {
+            'bluesky_config': bluesky_config.hash,
+            'bluesky_version': config('bluesky_version'),
+            'modules': config('bluesky', 'modules'),
+            'bluesky_today': bluesky_today.strftime('%Y-%m-%d')
+        }
+        self._invalidate_before = None
+        if config('cache', 'invalidate_before'):
+            self._invalidate_before = (datetime.datetime.strptime(
+                config('cache', 'invalidate_before'), '%Y-%m-%dT%H:%M:%S')
+                - datetime.datetime(1970, 1, 1)).total_seconds()
+
+    ## Public Interface
+
+    @property
+    def enabled(self):
+        return self._config('cache', 'enabled')
+
+    def get_key(self, input_data):
+        return hashlib.sha256(json.dumps(dict(self._base_key,
+            input=input_data), sort_keys=True).encode()).hexdigest()
+
+    async def lookup(self, input_data):
+        """Returns the cache entry for the input data, or None if there
+        isn't a valid one
+        """
+        if not self.enabled or self._config('cache', 'refresh'):
+            return None
+
+        try:
+            response = await self._s3_client.get_object(Bucket=self._bucket,
+                Key=self._s3_key(self.get_key(input_data)))
+            entry = json.loads(response['Body'])
+        except Exception:
+            # Most likely not cached
+            return None
+
+        if time.time() - entry['created'] > self._config('cache', 'ttl_hours') * 3600:
+            logging.debug("Cached result of %s has expired", entry['run_id'])
+            return None
+        if self._invalidate_before and entry['created'] < self._invalidate_before:
+            logging.debug("Cached result of %s was invalidated", entry['run_id'])
+            return None
+
+        return entry
+
+    async def store(self, input_data, request_id, run_id, output_key, log_key):
+        """Records where the output and log of a successful run with the
+        given input data were published
+        """
+        if not self.enabled:
+            return
+
+        entry = {
+            'request_id': request_id,
+            'run_id': run_id,
+            'output_key': output_key,
+            'log_key': log_key,
+            'created': time.time()
+        }
+        try:
+            await self._s3_client.put_object(Bucket=self._bucket,
+                Key=self._s3_key(self.get_key(input_data)),
+                Body=json.dumps(entry))
+        except Exception as e:
+            # The next run with the same input just won't be able to
+            # reuse the results
+            logging.warning("Failed to cache result of %s: %s", run_id, e)
+
+    ## Helpers
+
+    def _s3_key(self, key):
+        return os.path.join(self.PATH, key + '.json')
@@ -1,6 +1,7 @@
 import copy
 import json
 import logging
+import re
 from collections import OrderedDict
 
 __all__ = [
@@ -134,9 +135,189 @@ CONFIG_SETTINGS = OrderedDict({
                 validator=lambda v: v in ('fixed', 'backoff')),
             "time": ConfigSetting(15*60, "wait time, in seconds"), # seconds
             "max_attempts": ConfigSetting(3, "max number to attempts before aborting")
+        },
+        "streaming": ConfigSetting(False, help_string='\n'.join([
+                "Whether or not to parse the input file incrementally, reading",
+                "fires one at a time as instances are ready to run them, rather",
+                "than loading the entire file into memory.  Useful for very large",
+                "inputs.  Requires ijson.  Fires are run in input order when",
+                "streaming, regardless of 'scheduling' > 'policy'; defaults to false"
+            ]), validator=lambda v: isinstance(v, bool))
+    },
+
+    "met": {
+        "domains": ConfigSetting(None, help_string='\n'.join([
+                "Met domains, by name, against which to check that the met files",
+                "each fire needs are available before running it.  Each domain",
+                "has a 'boundary', a 'dir' containing its met files, as mounted",
+                "on the machine running bluesky-aws (e.g. the EFS volume in",
+                "`aws > ec2 > efs_volumes`), a 'file_name_format', with which each",
+                "file's start time (UTC) is formatted to get its name, and",
+                "'hours_per_file' (default 24).  Fires are checked against the",
+                "first domain containing their centroid, for their activity's",
+                "date range, and are run as soon as their met is available.",
+                "Instances are launched only for fires whose met is available, and",
+                "released while the rest wait, with more launched as their met",
+                "arrives.  Fires not in any domain aren't checked; default null",
+                "(no checks)"
+            ]), validator=lambda v: isinstance(v, dict) and all(
+                isinstance(d, dict) and {'boundary', 'dir', 'file_name_format'}.issubset(d)
+                for d in v.values()),
+            example={
+                "CANSAC-1.33km": {
+                    "boundary": {
+                        "sw": {"lng": -125.0, "lat": 32.0},
+                        "ne": {"lng": -112.0, "lat": 43.0}
+                    },
+                    "dir": "/Met/CANSAC/1.33km/ARL/",
+                    "file_name_format": "wrfout_d3.%Y%m%d%H.f00-11_12hr01.arl",
+                    "hours_per_file": 12
+                }
+            }),
+        "default_num_hours": ConfigSetting(24, help_string='\n'.join([
+                "Number of hours of met, starting at 00Z on `bluesky > today`,",
+                "required by fires whose activity doesn't specify start and end",
+                "times; default 24"
+            ]), validator=lambda v: isinstance(v, int) and v > 0),
+        "index_ttl_seconds": ConfigSetting(60, help_string='\n'.join([
+                "Number of seconds for which listings of met directories are",
+                "cached, so that checking many fires' met doesn't list each",
+                "directory for each fire; default 60"
+            ]), validator=lambda v: isinstance(v, (int, float)) and v >= 0),
+        "wait": {
+            "strategy": ConfigSetting("backoff", help_string='\n'.join([
+                    "'fixed' or 'backoff', to double the wait time after each",
+                    "attempt; default 'backoff'"
+                ]), validator=lambda v: v in ('fixed', 'backoff')),
+            "time": ConfigSetting(5*60, help_string='\n'.join([
+                    "Number of seconds to wait before checking again for a fire's",
+                    "missing met; default 300"
+                ])),
+            "max_attempts": ConfigSetting(6, help_string='\n'.join([
+                    "Max number of times to check for a fire's met before",
+                    "giving up on running it; default 6"
+                ]))
         }
     },
 
+    "scheduling": {
+        "policy": ConfigSetting("fifo", help_string='\n'.join([
+                "Order in which fires are run when there are more fires than instances:",
+                " - 'fifo' - fires are run in the order they're specified in the input data",
+                " - 'longest_first' - fires are run in descending order of estimated",
+                "        run time (based on area, number of locations, and whether or",
+                "        not dispersion is run), to minimize the time until the last",
+                "        instance finishes"
+            ]), validator=lambda v: v in ('fifo', 'longest_first'),
+            example="longest_first")
+    },
+
+    "cache": {
+        "enabled": ConfigSetting(False, help_string='\n'.join([
+                "Whether or not to reuse the results of earlier runs with the same",
+                "input data, merged bluesky config, bluesky version, modules, and",
+                "bluesky 'today'.  Their output and log are copied, in s3, into",
+                "the new request's paths, rather than re-running bluesky.",
+                "Results of successful runs are recorded under 'cache/' in the",
+                "bucket; default false"
+            ]), validator=lambda v: isinstance(v, bool)),
+        "ttl_hours": ConfigSetting(24, help_string='\n'.join([
+                "Number of hours for which results are reused; default 24"
+            ]), validator=lambda v: isinstance(v, (int, float)) and v > 0),
+        "invalidate_before": ConfigSetting(None, help_string='\n'.join([
+                "UTC timestamp, formatted '%Y-%m-%dT%H:%M:%S', before which",
+                "recorded results aren't reused, e.g. after fixing a problem with",
+                "the met data; default null"
+            ]), validator=lambda v: isinstance(v, str) and bool(
+                re.match(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}$', v)),
+            example="2020-02-01T12:00:00"),
+        "refresh": ConfigSetting(False, help_string='\n'.join([
+                "Re-run all fires, replacing any recorded results with the new",
+                "ones; default false"
+            ]), validator=lambda v: isinstance(v, bool))
+    },
+
+    "delta": {
+        "enabled": ConfigSetting(False, help_string='\n'.join([
+                "Whether or not to only run fires that were added or modified since",
+                "the previous request for the same bluesky 'today', found through",
+                "the request index.  The results of successful runs of unchanged",
+                "fires are carried forward into the new request's status, pointing",
+                "to the previous request's output and log.  All fires are run if",
+                "the previous request's bluesky config, bluesky version, or modules",
+                "differ.  Ignored if single_run is set; default false"
+            ]), validator=lambda v: isinstance(v, bool)),
+        "previous_request_id": ConfigSetting(None, help_string='\n'.join([
+                "Id of the request to compare against, rather than the most",
+                "recent one in the request index; default null"
+            ]), validator=lambda v: isinstance(v, str) and bool(v),
+            example="fires-20200201")
+    },
+
+    "archive": {
+        "codec": ConfigSetting("gzip", help_string='\n'.join([
+                "How each run's output is archived before being published to s3:",
+                " - 'gzip' - .tar.gz, compressed with single threaded gzip",
+                " - 'pigz' - .tar.gz, compressed with gzip in parallel, using all cores",
+                " - 'zstd' - .tar.zst, compressed with multi-threaded zstandard",
+                " - 'zip' - .zip",
+                " - 'none' - uncompressed .tar",
+                "Note that the admin app only supports downloading .tar.gz output;",
+                "pigz and zstd are installed on instances if not already present;",
+                "defaults to 'gzip'"
+            ]), validator=lambda v: v in ('gzip', 'pigz', 'zstd', 'zip', 'none'),
+            example="pigz"),
+        "level": ConfigSetting(None, help_string='\n'.join([
+                "Compression level passed to the compression utility (e.g. 1-9 for",
+                "gzip, pigz, and zip, 1-19 for zstd); defaults to the utility's default"
+            ]), validator=lambda v: v is None or isinstance(v, int),
+            example=6),
+        "threads": ConfigSetting(None, help_string='\n'.join([
+                "Number of threads used by pigz and zstd; defaults to all cores"
+            ]), validator=lambda v: v is None or (isinstance(v, int) and v > 0),
+            example=4),
+        "store_extensions": ConfigSetting([], help_string='\n'.join([
+                "Extensions of files that are already compressed.  With the 'zip'",
+                "codec, these files are stored without being recompressed.  With",
+                "the other codecs, which compress the entire tarball as a stream,",
+                "the output is archived as an uncompressed .tar if these files make",
+                "up at least 'store_fraction' of the output"
+            ]), validator=lambda v: isinstance(v, list),
+            example=[".png", ".kmz", ".zip", ".gz"]),
+        "store_fraction": ConfigSetting(0.9, help_string='\n'.join([
+                "See 'store_extensions'; defaults to 0.9"
+            ]), validator=lambda v: isinstance(v, (int, float)) and 0 <= v <= 1,
+            example=0.75)
+    },
+
+    "status": {
+        "flush_interval_seconds": ConfigSetting(None, help_string='\n'.join([
+                "If specified, status changes are written to s3 at most once",
+                "per this many seconds, plus whenever a run or the request",
+                "completes, rather than on every change.  Recommended for",
+                "requests with many fires; defaults to writing on every change"
+            ]), validator=lambda v: v is None or (
+                isinstance(v, (int, float)) and v > 0),
+            example=10),
+        "sharded": ConfigSetting(False, help_string='\n'.join([
+                "Whether or not to save status as a small manifest,",
+                "'status/<request_id>/manifest.json', plus one object per run,",
+                "'status/<request_id>/<run_id>.json', and per instance,",
+                "'status/<request_id>/instances/<ip>.json', so that the size of",
+                "each write doesn't grow with the number of fires; defaults to false"
+            ]), validator=lambda v: isinstance(v, bool)),
+        "write_combined": ConfigSetting(True, help_string='\n'.join([
+                "When status is sharded, whether or not to also save the combined",
+                "status object, 'status/<request_id>-status.json', which is what the",
+                "admin app reads; defaults to true",
+                "",
+                "The combined object is rewritten in full on every save, so leaving",
+                "this on keeps the admin app working at the cost of writes that",
+                "still grow with the number of fires and instances.  Turn it off",
+                "for large requests if nothing reads the combined object."
+            ]), validator=lambda v: isinstance(v, bool))
+    },
+
     # setting cleanup_output to False is only useful when using an
     # existing instance in dev, when you might want to inspect
     # the output on the instance after the run
@@ -159,7 +340,11 @@ CONFIG_SETTINGS = OrderedDict({
         },
         "ec2": {
             "max_num_instances": ConfigSetting(None,
-                help_string="the maximum number of new plus existing instances to use",
+                help_string='\n'.join([
+                    "the maximum number of new plus existing instances to use;",
+                    "if there are more fires than instances, the extra fires are",
+                    "queued and run on instances as they finish previous runs"
+                ]),
                 validator=lambda v: isinstance(v, int), example=50),
             "image_name_prefix_format": ConfigSetting("bluesky-aws-{request_id}", help_string='\n'.join([
                     "Prefix to use in name of each new instance",
@@ -183,6 +368,25 @@ CONFIG_SETTINGS = OrderedDict({
                 required=True, example="bluesky-v4.2.9-ubuntu"),
             "instance_type": ConfigSetting(None, help_string="instance type to use",
                 required=True, example="t2.small"),
+            "instance_type_ladder": ConfigSetting(None, help_string='\n'.join([
+                    "Instance types to run fires on by fire size and configured",
+                    "modules, so that small fires can run on smaller instances than",
+                    "large ones.  An array of rungs, each with an 'instance_type'",
+                    "and optionally a 'max_area' (acres) and 'modules'.  Each fire is",
+                    "run on the instance type of the first rung whose max_area it",
+                    "doesn't exceed and whose modules are all in `bluesky > modules`,",
+                    "and on `aws > ec2 > instance_type` if none apply.  Instances of",
+                    "each type are launched as needed for the fires assigned to it;",
+                    "default null (all fires run on `aws > ec2 > instance_type`)"
+                ]), validator=lambda v: isinstance(v, list) and all(
+                    isinstance(r, dict) and isinstance(r.get('instance_type'), str)
+                    and set(r).issubset(('instance_type', 'max_area', 'modules'))
+                    for r in v),
+                example=[
+                    {"max_area": 1000, "modules": ["dispersion"], "instance_type": "c5.xlarge"},
+                    {"modules": ["dispersion"], "instance_type": "c5.4xlarge"},
+                    {"max_area": 1000, "instance_type": "t3.small"}
+                ]),
             "key_pair_name": ConfigSetting(None,
                 help_string="Name of key pair in AWS to use for ssh",
                 required=True, example="foo_id_rsa"),
@@ -206,7 +410,78 @@ CONFIG_SETTINGS = OrderedDict({
                 help_string="Number of minutes to wait before instances shut themselves down; default: null (no auto-termination)",
                 validator=lambda v: isinstance(v, int), example=120),
             "instance_initiated_shutdown_behavior": ConfigSetting("terminate",
-                help_string="'terminate' or 'stop'; default 'terminate'")
+                help_string="'terminate' or 'stop'; default 'terminate'"),
+            "slots_per_instance": ConfigSetting(1, help_string='\n'.join([
+                    "Number of runs to execute concurrently on each instance, each",
+                    "in its own docker container; default 1",
+                    "",
+                    "If set to 'auto', the number of slots is set to the number of",
+                    "vCPUs on the instance divided by `bluesky > docker > cpus`",
+                    "(or 1 if not set).  Note that, with 'auto', the number of",
+                    "instances launched isn't reduced, since the number of vCPUs",
+                    "isn't known until the instances are running."
+                ]), validator=lambda v: v == 'auto' or (isinstance(v, int) and v > 0),
+                example=4),
+            "max_launch_attempts": ConfigSetting(3, help_string='\n'.join([
+                    "Number of times to try launching and initializing each new",
+                    "instance.  Instances that fail to launch or initialize are",
+                    "terminated and replaced, rather than aborting the request;",
+                    "default 3"
+                ]), validator=lambda v: isinstance(v, int) and v > 0),
+            "spot": {
+                "enabled": ConfigSetting(False, help_string='\n'.join([
+                        "Whether or not to launch new instances as one-time spot",
+                        "instances.  Runs on instances that receive interruption notices",
+                        "are put back on the work queue, and the instances are replaced;",
+                        "default false"
+                    ]), validator=lambda v: isinstance(v, bool)),
+                "max_price": ConfigSetting(None, help_string='\n'.join([
+                        "Maximum hourly price to pay for spot instances, in USD;",
+                        "default null (the on-demand price)"
+                    ]), validator=lambda v: v is None or isinstance(v, (int, float)),
+                    example=0.05),
+                "on_demand_fallback": ConfigSetting(True, help_string='\n'.join([
+                        "Whether or not to launch an on-demand instance when a spot",
+                        "instance can't be launched, e.g. for lack of capacity;",
+                        "default true"
+                    ]), validator=lambda v: isinstance(v, bool)),
+                "seconds_between_interruption_checks": ConfigSetting(5,
+                    help_string="Seconds between checks of instance metadata for interruption notices; default 5",
+                    validator=lambda v: isinstance(v, int) and v > 0),
+                "metadata_url": ConfigSetting("http://169.254.169.254/latest",
+                    help_string='\n'.join([
+                        "Base url of the instance metadata service, as reached from",
+                        "instances; default 'http://169.254.169.254/latest'.  Point at",
+                        "`dev/scripts/fake-instance-metadata` to test interruptions"
+                    ]), example="http://localhost:8111/latest")
+            },
+            "pool": {
+                "name": ConfigSetting(None, help_string='\n'.join([
+                        "Name of the pool of warm instances shared across requests;",
+                        "default null (no pool)",
+                        "",
+                        "When set, idle instances in the pool are leased for the request",
+                        "before launching any new ones, and leased and new instances are",
+                        "released to the pool, rather than terminated, when the request",
+                        "completes.  Rather than `minutes_until_auto_shutdown`, leased",
+                        "and new pooled instances are scheduled to shut down after",
+                        "`max_lease_minutes`, which is cancelled when they're released.",
+                        "Use `bin/maintain-instance-pool` to keep the pool warm."
+                    ]), example="bluesky-aws-pool"),
+                "size": ConfigSetting(0,
+                    help_string="Number of idle instances to keep warm in the pool; default 0",
+                    validator=lambda v: isinstance(v, int) and v >= 0, example=5),
+                "idle_timeout_minutes": ConfigSetting(60, help_string='\n'.join([
+                        "Minutes after which idle pooled instances, beyond the number",
+                        "to keep warm, are terminated; default 60"
+                    ]), validator=lambda v: isinstance(v, int)),
+                "max_lease_minutes": ConfigSetting(720, help_string='\n'.join([
+                        "Minutes after which leased pooled instances are assumed to have",
+                        "been orphaned by an aborted request, and are terminated by the",
+                        "pool or shut themselves down; default 720.  Set to null to keep",
+                        "leases indefinitely"
+                    ]), validator=lambda v: v is None or (isinstance(v, int) and v > 0))
+            }
         },
         "s3": {
             "bucket_name": ConfigSetting(None,
@@ -214,7 +489,31 @@ CONFIG_SETTINGS = OrderedDict({
                 required=True, example="bluesky-aws"),
             "output_path": ConfigSetting("output",
                 help_string="output path to nest output under within s3 bucket; defaults to 'output'",
-                required=True)
+                required=True),
+            "stream_output": ConfigSetting(False, help_string='\n'.join([
+                    "Whether or not to stream the output tarball directly from the",
+                    "instance to s3, rather than first writing it to disk; defaults to",
+                    "false"
+                ]), validator=lambda v: isinstance(v, bool)
+            ),
+            "backend": ConfigSetting("boto3", help_string='\n'.join([
+                    "Library used to make s3 requests:",
+                    " - 'boto3' - requests are made on a dedicated thread pool",
+                    " - 'aiobotocore' - requests are made natively on the event",
+                    "        loop, without tying up a thread per request; requires",
+                    "        aiobotocore",
+                    "defaults to 'boto3'"
+                ]), validator=lambda v: v in ('boto3', 'aiobotocore'),
+                example="aiobotocore"
+            ),
+            "max_concurrency": ConfigSetting(32, help_string='\n'.join([
+                    "Maximum number of s3 requests in flight at once, which is also",
+                    "the size of the client's connection pool; defaults to 32"
+                ]), validator=lambda v: isinstance(v, int) and v > 0, example=64),
+            "max_attempts": ConfigSetting(5, help_string='\n'.join([
+                    "Maximum number of attempts at each s3 request, retrying with",
+                    "exponential backoff, including on throttling; defaults to 5"
+                ]), validator=lambda v: isinstance(v, int) and v > 0, example=10)
         }
     },
     "bluesky": {
@@ -234,10 +533,56 @@ CONFIG_SETTINGS = OrderedDict({
                 "bluesky config file, if one is specified (see below)"
             ])
         ),
+        "completion_check_strategy": ConfigSetting("wait", help_string='\n'.join([
+                "How to detect that bsp has completed:",
+                " - 'wait' - a background process on the instance waits for the bsp",
+                "        container to exit and records its exit code, which is picked",
+                "        up as soon as it's written",
+                " - 'poll' - periodically check if the bsp container is still running"
+            ]), validator=lambda v: v in ('wait', 'poll')
+        ),
+        "seconds_per_completion_wait": ConfigSetting(300, help_string='\n'.join([
+                "With the 'wait' completion check strategy, the maximum number of",
+                "seconds that each remote wait for the exit code blocks"
+            ]), validator=lambda v: isinstance(v, int) and v > 0
+        ),
         "seconds_between_completion_checks": ConfigSetting(30,
-            help_string="Seconds to wait between checking for run completion",
+            help_string="With the 'poll' completion check strategy, seconds to wait between checking for run completion",
             validator=lambda v: isinstance(v, int)
         ),
+        "docker": {
+            "cpus": ConfigSetting(None,
+                help_string="Number of cpus each bluesky container is limited to (docker's `--cpus`); default no limit",
+                validator=lambda v: v is None or (isinstance(v, (int, float)) and v > 0),
+                example=1.5),
+            "memory": ConfigSetting(None,
+                help_string="Memory each bluesky container is limited to (docker's `--memory`); default no limit",
+                example="2g"),
+            "image_digest": ConfigSetting(None, help_string='\n'.join([
+                    "Expected digest of the pnwairfire/bluesky:<bluesky_version> image.",
+                    "The image is pulled once per instance, as instances are",
+                    "initialized, unless the image already on the instance (e.g.",
+                    "baked into the AMI) has this digest; default none, meaning",
+                    "the image is always pulled"
+                ]), validator=lambda v: v is None or (isinstance(v, str)
+                    and 'sha256:' in v),
+                example="sha256:6b0d1b8fb4e1dc7c7d2b4a7b1a0f0e4f0c6a1d5e1e6f3a2b9c8d7e6f5a4b3c2d")
+        },
+        "staged_config": {
+            "cache_dir": ConfigSetting(None, help_string='\n'.join([
+                    "Absolute path of the directory in which the bluesky config is",
+                    "cached on instances, by hash, so that it's only transferred to",
+                    "each instance once per request rather than once per run.  Set",
+                    "to a dir on a shared efs volume to share the cache across",
+                    "instances; defaults to $HOME/data/bluesky/staged"
+                ]), example="/data/bluesky-aws/staged"),
+            "fetch_from_s3": ConfigSetting(False, help_string='\n'.join([
+                    "Whether or not to store the bluesky config in s3, by hash, once",
+                    "per request, for instances to fetch if not already cached,",
+                    "rather than transferring it over ssh.  Requires that instances",
+                    "have s3 access, e.g. via iam_instance_profile; defaults to false"
+                ]), validator=lambda v: isinstance(v, bool))
+        }
     },
     "notifications": {
         "email": {
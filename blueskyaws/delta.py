@@ -0,0 +1,189 @@
+import hashlib
+import json
+import logging
+import os
+
+from .status import Status
+
+__all__ = [
+    "get_run_settings",
+    "hash_fire",
+    "PreviousRequest"
+]
+
+def hash_fire(fire):
+    return hashlib.sha256(json.dumps(fire, sort_keys=True).encode()).hexdigest()
+
+def get_run_settings(config, bluesky_config):
+    """Returns the settings, other than the fires and bluesky 'today', that
+    determine the results of a request's runs - the merged bluesky config,
+    bluesky version, and modules - given its bluesky-aws config and merged
+    bluesky config, either as used or as recorded in s3
+    """
+    if hasattr(config, 'to_dict'):
+        config = config.to_dict()
+    # Round tripped so that settings compare equal to recorded ones
+    return json.loads(json.dumps({
+        'bluesky_config': bluesky_config,
+        'bluesky_version': config.get('bluesky_version'),
+        'modules': (config.get('bluesky') or {}).get('modules')
+    }))
+
+
+class PreviousRequest(object):
+    """An earlier request for the same bluesky 'today', found through the
+    request index, along with its input fires and the successful runs of
+    them, so that the results of fires that haven't changed since can be
+    carried forward rather than re-run.
+    """
+
+    def __init__(self, request_id, fire_hashes, runs):
+        """
+        Args:
+
+         - fire_hashes - hash of each of the request's fires, by fire id
+         - runs - status of each of the request's successful runs, by
+           fire id
+        """
+        self.request_id = request_id
+        self._fire_hashes = fire_hashes
+        self._runs = runs
+
+    @classmethod
+    async def load(cls, s3_client, bucket, bluesky_today, request_id,
+            settings, previous_request_id=None):
+        """Loads the most recent request, other than the given one, in
+        bluesky_today's request index, or the given previous request.
+        Returns None if there isn't one, or if it was for a different
+        bluesky 'today' or its recorded config differs from the given
+        settings, as returned by `get_run_settings`, since its results
+        would then differ even for unchanged fires.
+        """
+        if previous_request_id:
+            if not await cls._is_indexed(s3_client, bucket, bluesky_today,
+                    previous_request_id):
+                logging.info("Previous request %s wasn't for %s",
+                    previous_request_id, bluesky_today.strftime('%Y-%m-%d'))
+                return None
+        else:
+            previous_request_id = await cls._find(
+                s3_client, bucket, bluesky_today, request_id)
+            if not previous_request_id:
+                return None
+
+        if not await cls._has_settings(s3_client, bucket,
+                previous_request_id, settings):
+            return None
+
+        response = await s3_client.get_object(Bucket=bucket,
+            Key=os.path.join('requests', previous_request_id + '.json'))
+        fire_hashes = {f.get('id'): hash_fire(f)
+            for f in json.loads(response['Body'])['fires']}
+
+        runs = {}
+        for run_id, run_status in (await cls._load_run_statuses(
+                s3_client, bucket, previous_request_id)).items():
+            if run_status.get('status') == Status.SUCCESS:
+                # Runs recorded before fire ids were included in run
+                # status are matched by the default run id format
+                fire_id = run_status.get('fire_id') or (
+                    run_id[5:] if run_id.startswith('fire-') else None)
+                runs[fire_id] = dict(run_status, run_id=run_id)
+
+        return cls(previous_request_id, fire_hashes, runs)
+
+    ## Public Interface
+
+    def get_unchanged_run(self, fire):
+        """Returns the status of the successful run of the fire, if the
+        fire is unchanged since the previous request, or otherwise None
+        """
+        fire_id = fire.get('id')
+        if (fire_id is None or fire_id not in self._runs
+                or self._fire_hashes.get(fire_id) != hash_fire(fire)):
+            return None
+        return self._runs[fire_id]
+
+    ## Helpers
+
+    @staticmethod
+    async def _find(s3_client, bucket, bluesky_today, request_id):
+        prefix = os.path.join('request-index',
+            bluesky_today.strftime("%Y%m%d")) + '/'
+        latest = None
+        kwargs = dict(Bucket=bucket, Prefix=prefix)
+        while True:
+            response = await s3_client.list_objects_v2(**kwargs)
+            for obj in response.get('Contents', []):
+                if (obj['Key'] != prefix + request_id and (not latest
+                        or obj['LastModified'] > latest['LastModified'])):
+                    latest = obj
+            if not response.get('IsTruncated'):
+                break
+            kwargs['ContinuationToken'] = response['NextContinuationToken']
+
+        if latest:
+            return latest['Key'][len(prefix):]
+
+    @staticmethod
+    async def _is_indexed(s3_client, bucket, bluesky_today, request_id):
+        key = os.path.join('request-index',
+            bluesky_today.strftime("%Y%m%d"), request_id)
+        response = await s3_client.list_objects_v2(Bucket=bucket, Prefix=key)
+        return any(obj['Key'] == key for obj in response.get('Contents', []))
+
+    CONFIG_TYPES = ('bluesky-aws', 'bluesky')
+
+    @classmethod
+    async def _has_settings(cls, s3_client, bucket, request_id, settings):
+        """Returns whether the request's recorded config has the given
+        settings, logging why not if it doesn't
+        """
+        recorded = {}
+        for config_type in cls.CONFIG_TYPES:
+            key = os.path.join('config',
+                request_id + '-config-' + config_type + '.json')
+            try:
+                response = await s3_client.get_object(Bucket=bucket, Key=key)
+            except Exception as e:
+                logging.info("No recorded %s config for previous request %s: %s",
+                    config_type, request_id, e)
+                return False
+            recorded[config_type] = json.loads(response['Body'])
+
+        if get_run_settings(recorded['bluesky-aws'], recorded['bluesky']) != settings:
+            logging.info("bluesky config, version, or modules changed since "
+                "previous request %s", request_id)
+            return False
+
+        return True
+
+    @staticmethod
+    async def _load_run_statuses(s3_client, bucket, request_id):
+        """Returns the request's run statuses, by run id, from its
+        combined status object or, if it wasn't written, from its
+        per-run status objects
+        """
+        try:
+            response = await s3_client.get_object(Bucket=bucket,
+                Key=os.path.join('status', request_id + '-status.json'))
+            return json.loads(response['Body'])['runs']
+        except Exception as e:
+            logging.debug("No combined status for %s: %s", request_id, e)
+
+        prefix = os.path.join('status', request_id) + '/'
+        runs = {}
+        kwargs = dict(Bucket=bucket, Prefix=prefix)
+        while True:
+            response = await s3_client.list_objects_v2(**kwargs)
+            for obj in response.get('Contents', []):
+                run_id = obj['Key'][len(prefix):-len('.json')]
+                # Instance statuses are in a subdirectory
+                if run_id != 'manifest' and '/' not in run_id:
+                    runs[run_id] = json.loads((await s3_client.get_object(
+                        Bucket=bucket, Key=obj['Key']))['Body'])
+            if not response.get('IsTruncated'):
+                break
+            kwargs['ContinuationToken'] = response['NextContinuationToken']
+
+        return runs
@@ -0,0 +1,196 @@
+import array
+import datetime
+import logging
+import math
+
+try:
+    import numpy
+except ImportError:
+    # Columns are returned as python arrays if numpy isn't installed
+    numpy = None
+
+__all__ = [
+    "get_fire_info",
+    "FireMetadataIndex"
+]
+
+def get_fire_info(fire):
+    """Parses area, location, and number of locations from a fire's
+    activity data.
+
+    Failures to parse are logged and result in partially filled in info.
+    """
+    metadata = _parse_fire(fire)
+    if metadata['error']:
+        logging.warning("Failed to parse fire info from input file")
+    return {k: metadata[k] for k in
+        ('area', 'lat', 'lng', 'num_points', 'num_perimeters')}
+
+
+class FireMetadataIndex(object):
+    """Table of metadata about each fire in the input, built once, when
+    the input is loaded, so that scheduling, run naming, and status
+    don't each need to walk each fire's activity data.
+
+    Metadata are stored column-wise, and rows are in input order.  Float
+    columns use NaN for values that couldn't be parsed.
+    """
+
+    FLOAT_COLUMNS = (
+        'area',
+        # first location, for consistency with status recorded by
+        # earlier versions of bluesky-aws
+        'lat', 'lng',
+        'centroid_lat', 'centroid_lng',
+        'min_lat', 'min_lng', 'max_lat', 'max_lng',
+        # earliest start and latest end of activity, in seconds since
+        # the epoch, UTC
+        'start', 'end'
+    )
+    COUNT_COLUMNS = ('num_points', 'num_perimeters')
+
+    def __init__(self):
+        self._ids = []
+        self._errors = []
+        self._columns = {c: array.array('d') for c in self.FLOAT_COLUMNS}
+        self._columns.update({c: array.array('l') for c in self.COUNT_COLUMNS})
+
+    @classmethod
+    def build(cls, fires):
+        index = cls()
+        for fire in fires:
+            index.add(fire)
+        return index
+
+    ## Public Interface
+
+    def __len__(self):
+        return len(self._ids)
+
+    @property
+    def ids(self):
+        return self._ids
+
+    @property
+    def errors(self):
+        """Parse errors, by row; None for fires that were parsed"""
+        return self._errors
+
+    @property
+    def num_errors(self):
+        return sum(1 for e in self._errors if e)
+
+    def add(self, fire):
+        """Parses the fire and appends a row, returning its index"""
+        metadata = _parse_fire(fire)
+        self._ids.append(fire.get('id') if hasattr(fire, 'get') else None)
+        self._errors.append(metadata['error'])
+        for c in self.FLOAT_COLUMNS:
+            self._columns[c].append(
+                float('nan') if metadata[c] is None else metadata[c])
+        for c in self.COUNT_COLUMNS:
+            self._columns[c].append(metadata[c])
+        return len(self._ids) - 1
+
+    def column(self, name):
+        """Returns the column as a numpy array, if numpy is installed,
+        or otherwise as a python array
+        """
+        if numpy is not None:
+            return numpy.frombuffer(self._columns[name],
+                dtype=self._columns[name].typecode)
+        return self._columns[name]
+
+    def row(self, i):
+        row = {'id': self._ids[i], 'error': self._errors[i]}
+        for c in self.FLOAT_COLUMNS:
+            v = self._columns[c][i]
+            row[c] = None if math.isnan(v) else v
+        for c in self.COUNT_COLUMNS:
+            row[c] = self._columns[c][i]
+        return row
+
+
+## Helpers
+
+def _parse_fire(fire):
+    metadata = dict({c: None for c in FireMetadataIndex.FLOAT_COLUMNS},
+        num_points=0, num_perimeters=0, error=None)
+    coords = []
+    times = []
+    try:
+        area = 0
+        for a in fire['activity']:
+            for aa in a['active_areas']:
+                times.extend(_get_active_area_times(aa))
+                if 'specified_points' in aa:
+                    for sp in aa['specified_points']:
+                        area += sp['area']
+                        metadata['num_points'] += 1
+                        coords.append((sp['lat'], sp['lng']))
+
+                elif 'perimeter' in aa:
+                    area += aa['perimeter'].get('area', 0)
+                    metadata['num_perimeters'] += 1
+                    coords.extend(_get_perimeter_coords(aa['perimeter']))
+
+        metadata['area'] = area
+
+    except Exception as e:
+        metadata['error'] = "{}: {}".format(e.__class__.__name__, e)
+
+    if coords:
+        lats = [c[0] for c in coords]
+        lngs = [c[1] for c in coords]
+        metadata.update(lat=lats[0], lng=lngs[0],
+            centroid_lat=sum(lats) / len(lats),
+            centroid_lng=sum(lngs) / len(lngs),
+            min_lat=min(lats), min_lng=min(lngs),
+            max_lat=max(lats), max_lng=max(lngs))
+
+    if times:
+        metadata.update(start=min(t[0] for t in times),
+            end=max(t[1] for t in times))
+
+    return metadata
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+def _get_active_area_times(active_area):
+    """Returns the active area's [(start, end)], in seconds since the
+    epoch, or [] if they're not specified or can't be parsed
+    """
+    try:
+        utc_offset = _parse_utc_offset(active_area.get('utc_offset'))
+        return [tuple(
+            (datetime.datetime.strptime(active_area[k][:19], '%Y-%m-%dT%H:%M:%S')
+                - utc_offset - EPOCH).total_seconds()
+            for k in ('start', 'end')
+        )]
+    except Exception:
+        return []
+
+def _parse_utc_offset(utc_offset):
+    """Parses offsets like '-07:00', or numbers of hours"""
+    if not utc_offset:
+        return datetime.timedelta(0)
+    if isinstance(utc_offset, (int, float)):
+        return datetime.timedelta(hours=utc_offset)
+    sign = -1 if utc_offset.startswith('-') else 1
+    hours, minutes = utc_offset.lstrip('+-').split(':')
+    return sign * datetime.timedelta(hours=int(hours), minutes=int(minutes))
+
+def _get_perimeter_coords(perimeter):
+    """Returns (lat, lng) of each vertex of the perimeter's outer ring(s)"""
+    rings = []
+    if 'polygon' in perimeter:
+        rings = [perimeter['polygon']]
+
+    elif 'geometry' in perimeter:
+        geometry = perimeter['geometry']
+        if geometry['type'] == 'MultiPolygon':
+            rings = [polygon[0] for polygon in geometry['coordinates']]
+        elif geometry['type'] == 'Polygon':
+            rings = [geometry['coordinates'][0]]
+
+    return [(c[1], c[0]) for ring in rings for c in ring]
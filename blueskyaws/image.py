@@ -0,0 +1,90 @@
+import json
+
+__all__ = [
+    "get_bluesky_image",
+    "form_image_script",
+    "parse_image_result"
+]
+
+# Installs any missing dependencies - awscli, docker, and the given
+# packages - and makes sure the bluesky image is on the instance, pulling
+# it unless the local image already has the expected digest.  This is
+# done once per instance, when it's initialized, rather than by each
+# run, since concurrent runs' apt installs would fail on apt's lock.
+# Failed installs and pulls are reported, not raised; runs check that
+# dependencies are installed, and pull the image if it's missing.
+# The installation commands are ubuntu/debian specific.
+IMAGE_SCRIPT_TEMPLATE = """LOG_FILE="$HOME/data/bluesky/install.log"
+mkdir -p "$HOME/data/bluesky"
+INSTALLED=""
+INSTALL_FAILED=""
+if ! which aws > /dev/null 2>&1; then
+    sudo apt -y install awscli >> "$LOG_FILE" 2>&1 \\
+        && INSTALLED="$INSTALLED awscli" || INSTALL_FAILED="$INSTALL_FAILED awscli"
+fi
+if ! which docker > /dev/null 2>&1; then
+    (
+        sudo apt update \\
+        && sudo apt install -y apt-transport-https ca-certificates curl software-properties-common \\
+        && curl -fsSL https://download.docker.com/linux/ubuntu/gpg | sudo apt-key add - \\
+        && sudo add-apt-repository "deb [arch=amd64] https://download.docker.com/linux/ubuntu bionic stable" \\
+        && sudo apt update \\
+        && sudo apt install -y docker-ce
+    ) >> "$LOG_FILE" 2>&1 \\
+        && INSTALLED="$INSTALLED docker" || INSTALL_FAILED="$INSTALL_FAILED docker"
+fi
+for PACKAGE in {packages}; do
+    if ! which $PACKAGE > /dev/null 2>&1; then
+        sudo apt -y install $PACKAGE >> "$LOG_FILE" 2>&1 \\
+            && INSTALLED="$INSTALLED $PACKAGE" || INSTALL_FAILED="$INSTALL_FAILED $PACKAGE"
+    fi
+done
+
+if ! which docker > /dev/null 2>&1; then
+    HAS_DOCKER=""
+else
+    HAS_DOCKER=1
+    LOCAL_DIGEST=$(docker image inspect --format '{{{{index .RepoDigests 0}}}}' {image} 2> /dev/null || true)
+    if [ -z "{expected_digest}" ] || [ "${{LOCAL_DIGEST#*@}}" != "{expected_digest}" ]; then
+        START=$(date +%s.%N)
+        docker pull {image} > /dev/null 2>&1 && PULLED=1 || PULL_FAILED=1
+        END=$(date +%s.%N)
+    fi
+    IMAGE_DIGEST=$(docker image inspect --format '{{{{index .RepoDigests 0}}}}' {image} 2> /dev/null || true)
+fi
+export INSTALLED INSTALL_FAILED HAS_DOCKER IMAGE_DIGEST PULLED PULL_FAILED START END
+python3 -c 'import json, os; print(json.dumps({{
+    "installed": os.environ["INSTALLED"].split(),
+    "install_failed": os.environ["INSTALL_FAILED"].split(),
+    "has_docker": bool(os.environ["HAS_DOCKER"]),
+    "image_digest": os.environ.get("IMAGE_DIGEST") or None,
+    "pulled": bool(os.environ.get("PULLED")),
+    "pull_failed": bool(os.environ.get("PULL_FAILED")),
+    "pull_seconds": round(float(os.environ["END"]) - float(os.environ["START"]), 3)
+        if os.environ.get("START") else None
+}}))'
+"""
+
+def get_bluesky_image(config):
+    return "pnwairfire/bluesky:{}".format(config('bluesky_version'))
+
+def form_image_script(image, expected_digest=None, packages=None):
+    """Returns a bash script that installs any missing dependencies and
+    pulls the image, unless it's already on the instance with the
+    expected digest, and prints a json object summarizing what was done.
+
+    Args:
+
+     - image - bluesky docker image, with tag
+     - expected_digest - e.g. 'sha256:abc123...', optionally prefixed
+       with the repository, as in 'pnwairfire/bluesky@sha256:abc123...';
+       if not specified, the image is always pulled
+     - packages - additional packages to install, if missing; each
+       package is assumed to provide an executable of the same name
+    """
+    expected_digest = (expected_digest or '').split('@')[-1]
+    return IMAGE_SCRIPT_TEMPLATE.format(image=image,
+        expected_digest=expected_digest, packages=' '.join(packages or []))
+
+def parse_image_result(stdout):
+    return json.loads(stdout.strip().split('\n')[-1])
@@ -9,6 +9,13 @@ import urllib
 
 from afaws.asyncutils import run_in_loop_executor
 
+try:
+    import ijson
+except ImportError:
+    # Only needed for streaming input
+    ijson = None
+
+from .fires import FireMetadataIndex
 from .status import SystemState, SystemErrors
 
 class InputLoadFailure(Exception):
@@ -22,10 +29,19 @@ class InputLoader(object):
         Args:
 
          - input_file_name` - local file path name or url of remote resource
+
+        If 'input' > 'streaming' is set, the input file is parsed
+        incrementally.  Only the number of fires and the bluesky config
+        are loaded up front, and fires are read one at a time via
+        iter_fires, so that the full input never needs to be held
+        in memory.
         """
         self._config = config
         self._orig_input_file_name = input_file_name
         self._status_tracker = status_tracker
+        self._streaming = config('input', 'streaming')
+        if self._streaming and not ijson:
+            raise InputLoadFailure("ijson must be installed for streaming input")
 
     async def __aenter__(self):
         try:
@@ -58,14 +74,45 @@ class InputLoader(object):
     def local_input_file_name(self):
         return self._local_input_file_name
 
+    @property
+    def streaming(self):
+        return self._streaming
+
     @property
     def fires(self):
+        """All fires, or None if streaming"""
         return self._fires
 
+    @property
+    def num_fires(self):
+        return self._num_fires
+
+    @property
+    def fire_index(self):
+        """FireMetadataIndex of all fires, in input order"""
+        return self._fire_index
+
     @property
     def bluesky_config(self):
         return self._bluesky_config
 
+    async def iter_fires(self):
+        """Yields fires one at a time, reading them from the input
+        file if streaming
+        """
+        if not self._streaming:
+            for fire in self._fires:
+                yield fire
+            return
+
+        with open(self._local_input_file_name, 'rb') as f:
+            fires = ijson.items(f, 'fires.item', use_float=True)
+            while True:
+                fire = await run_in_loop_executor(next, fires, None)
+                if fire is None:
+                    return
+                yield fire
+
 
     ## Helper
 
@@ -90,15 +137,60 @@ class InputLoader(object):
     async def _load_input(self):
         @wait_to_retry(self._config, FileNotFoundError, self._status_tracker)
         async def _():
+            if self._streaming:
+                await run_in_loop_executor(self._scan_input)
+                return
+
             with open(self._local_input_file_name, 'r') as f:
                 # reset point to beginning of file and load json data
                 f.seek(0)
-                self._data = json.loads(f.read())
-                self._fires = self._data['fires']
-                self._bluesky_config = (self._data.get('run_config')
-                    or self._data.get('bluesky_config') or {})
+                data = json.loads(f.read())
+                self._fires = data['fires']
+                self._fire_index = FireMetadataIndex.build(self._fires)
+                self._bluesky_config = (data.get('run_config')
+                    or data.get('bluesky_config') or {})
         await _()
 
+        self._num_fires = len(self._fire_index)
+        if self._fire_index.num_errors:
+            logging.warning("Failed to parse activity data of %s of %s fires",
+                self._fire_index.num_errors, self._num_fires)
+
+    CONFIG_KEYS = ('run_config', 'bluesky_config')
+
+    def _scan_input(self):
+        """Indexes fires and builds the bluesky config, if specified,
+        in a single pass over the input, holding at most one fire in
+        memory at a time
+        """
+        self._fires = None
+        fire_index = None
+        fire_builder = None
+        builders = {}
+        with open(self._local_input_file_name, 'rb') as f:
+            for prefix, event, value in ijson.parse(f, use_float=True):
+                key = prefix.split('.', 1)[0]
+                if key == 'fires':
+                    fire_index = fire_index or FireMetadataIndex()
+                    if prefix == 'fires.item' and event == 'start_map':
+                        fire_builder = ijson.ObjectBuilder()
+                    if fire_builder:
+                        fire_builder.event(event, value)
+                    if prefix == 'fires.item' and event == 'end_map':
+                        fire_index.add(fire_builder.value)
+                        fire_builder = None
+                elif key in self.CONFIG_KEYS:
+                    builders.setdefault(key, ijson.ObjectBuilder()).event(
+                        event, value)
+
+        if fire_index is None:
+            raise KeyError('fires')
+
+        self._fire_index = fire_index
+        configs = {k: b.value for k, b in builders.items()}
+        self._bluesky_config = (configs.get('run_config')
+            or configs.get('bluesky_config') or {})
+
 
 def wait_to_retry(config, exc_class, status_tracker, check_func=lambda e: True):
 
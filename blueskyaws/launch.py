@@ -2,47 +2,108 @@ import asyncio
 import logging
 import signal
 import uuid
+from collections import Counter
 
 from afaws.config import Config as AwsConfig
 from afaws.ec2.launch import Ec2Launcher, PostLaunchFailure
-from afaws.ec2.initialization import InstanceInitializerSsh
-from afaws.ec2.shutdown import AutoShutdownScheduler
 #from afaws.ec2.execute import FailedToSshError, Ec2SshExecuter
 from afaws.ec2.shutdown import Ec2Shutdown
 
 from .config import substitude_config_wildcards
+from .archive import get_archive_packages
+from .image import get_bluesky_image, form_image_script, parse_image_result
+from .spot import SpotLauncher
+from .ssh import SshConnectionPool
+from .timing import StageTimer
 
 class AbortRun(RuntimeError):
     pass
 
 class Ec2InstancesManager(object):
 
-    def __init__(self, config, num_total, request_id, existing=None):
+    def __init__(self, config, num_total, request_id, existing=None,
+            pool=None, pooled=None, ssh_pool=None, status_tracker=None,
+            instance_types=None):
+        """Launches and initializes as many new instances as are needed,
+        in addition to existing ones, to make num_total instances.
+
+        Args:
+
+         - pool - InstancePool to which new instances, and instances leased
+           from it, are released, rather than being terminated
+         - pooled - instances already leased from the pool
+         - ssh_pool - SshConnectionPool to use for connecting to new
+           instances, so that connections can be reused once instances
+           are initialized; if not specified, one is created and closed
+           when the manager exits
+         - status_tracker - StatusTracker in which to record how long
+           each instance took to get the bluesky image
+         - instance_types - the type of each of the num_total instances,
+           e.g. as allocated by the sizing policy; defaults to
+           `aws` > `ec2` > `instance_type` for all of them.  Existing and
+           pooled instances are assigned to the types they match, where
+           possible, and new instances are launched for the rest.
+        """
         self._config = config
         self._afaws_config = AwsConfig({
             "iam_instance_profile": self._config('aws', 'iam_instance_profile'),
             "default_efs_volumes": self._config('aws', 'ec2', 'efs_volumes')
         })
         self._num_total = num_total
+        self._instance_types = instance_types or (
+            [self._config("aws", "ec2", "instance_type")] * num_total)
+        # The type each instance is used for, by instance id
+        self._assigned_types = {}
+        # Number of instances of each type still being readied
+        self._num_preparing = Counter()
         self._request_id = request_id
-        self._existing_instances = existing
+        self._existing_instances = existing or []
+        self._pool = pool
+        self._pooled_instances = pooled or []
         self._new_instances = []
-        self._launched = False
+        self._num_launching = 0
+        self._stop_launching = False
+        self._stopped_types = set()
+        self._launchers = {}
+        self._spot_launcher = None
+        self._spot_instance_ids = set()
+        self._num_replacements = 0
+        self._num_additional = 0
+        self._owns_ssh_pool = ssh_pool is None
+        self._ssh_pool = ssh_pool or SshConnectionPool(self._config('ssh_key'))
+        self._status_tracker = status_tracker
 
     async def __aenter__(self):
+        """Starts getting instances ready - launching and initializing
+        each new instance in its own pipeline, and checking the bluesky
+        image on existing and pooled instances - without waiting for any
+        of them.  Use ready_instances to get them as they become ready.
+        """
         self._set_signal_handlers()
-        try:
-            await self._launch()
-            await self._schedule_auto_termination()
-            await self._initialize()
-        except:
-            await self._terminate()
-            raise
-
+        self._ready = asyncio.Queue()
+        existing = self.instances
+        new_types = self._assign_existing_instances(existing)
+        self._num_preparing.update(self._instance_types)
+        self._pipelines = [
+            asyncio.ensure_future(self._prepare_existing_instance(i))
+            for i in existing
+        ] + [
+            asyncio.ensure_future(self._launch_and_initialize_instance(
+                name, instance_type))
+            for name, instance_type in zip(
+                self._get_new_instance_names(len(new_types)), new_types)
+        ]
+        self._all_ready = asyncio.ensure_future(self._wait_for_pipelines())
         return self
 
     async def __aexit__(self, exc_type, exc_value, traceback):
-        await self._terminate()
+        # Instances still being launched are waited for, so that
+        # they're terminated along with the rest
+        self.stop_launching()
+        await self._all_ready
+        await self._release_or_terminate()
+        if self._owns_ssh_pool:
+            await self._ssh_pool.close()
         self._reset_signal_handlers()
 
     SIGNAMES = ('SIGINT', 'SIGTERM')
@@ -70,12 +131,13 @@ class Ec2InstancesManager(object):
             #     and returned.
             #
             # For now, at least, we're going with options 2)
-            while not self._launched:
+            self.stop_launching()
+            while self._num_launching:
                 logging.warn("Launch in progress. Waiting %s seconds before"
                     " terminating.", self.WAIT_FOR_LAUNCH_TIME)
                 await asyncio.sleep(self.WAIT_FOR_LAUNCH_TIME)
 
-            await self._terminate()
+            await self._release_or_terminate()
             raise AbortRun("Aborting execution")
 
         loop = asyncio.get_event_loop()
@@ -95,10 +157,91 @@ class Ec2InstancesManager(object):
     def instances(self):
         # Explicitly returns the first self._num_total instances in case the
         # number of existing is more than are needed
-        return (self._existing_instances + self._new_instances)[:self._num_total]
+        return (self._existing_instances + self._pooled_instances
+            + self._new_instances)[:self._num_total]
+
+    async def ready_instances(self):
+        """Yields instances as each becomes ready to run on, until all
+        have either become ready or failed
+        """
+        while True:
+            instance = await self._ready.get()
+            if instance is self.END_OF_INSTANCES:
+                # Leave it for any other consumers
+                self._ready.put_nowait(instance)
+                break
+            yield instance
+
+    def is_spot(self, instance):
+        return instance.id in self._spot_instance_ids
+
+    def get_instance_type(self, instance):
+        """Returns the type the instance is used for - its own type,
+        unless it's an existing or pooled instance that was assigned to
+        another type for lack of one that matched
+        """
+        return self._assigned_types.get(instance.id,
+            self._config("aws", "ec2", "instance_type"))
+
+    def is_preparing(self, instance_type):
+        """Returns whether or not any instances of the given type are
+        still being launched or initialized, or having their bluesky
+        image checked
+        """
+        return self._num_preparing[instance_type] > 0
+
+    async def replace_instance(self, instance):
+        """Terminates the instance - e.g. a spot instance that's about
+        to be reclaimed - and launches and initializes a new one in its
+        place, returning it, or None if one couldn't be launched
+        """
+        instance_type = self.get_instance_type(instance)
+        await self._terminate_failed([instance])
+        self._num_replacements += 1
+        return await self._get_new_instance('{}-r{}'.format(
+            self._name_prefix, self._num_replacements), instance_type,
+            replacing=True)
+
+    async def launch_instance(self, instance_type):
+        """Launches and initializes a new instance of the given type, in
+        addition to those launched on entry - e.g. for fires that became
+        ready to run after the instances of their type were released -
+        returning it, or None if one couldn't be launched
+        """
+        self._num_preparing[instance_type] += 1
+        try:
+            self._num_additional += 1
+            return await self._get_new_instance('{}-a{}'.format(
+                self._name_prefix, self._num_additional), instance_type)
+        finally:
+            self._num_preparing[instance_type] -= 1
+
+    def stop_launching(self, instance_type=None):
+        """Keeps failed instances - of the given type, or of any type if
+        not specified - from being replaced, e.g. once there are no more
+        runs left for them.  First attempts at launching each of the
+        instances needed are not affected.
+        """
+        if instance_type:
+            self._stopped_types.add(instance_type)
+        else:
+            self._stop_launching = True
+
+    async def terminate_instance(self, instance, failed=False):
+        """Releases the instance to the pool, if there is one, or
+        otherwise terminates it, if it's new.  Instances that failed are
+        terminated, even if leased from the pool, so that they're not
+        leased by other requests.  Existing instances are left running.
+        """
+        if failed and (instance in self._new_instances
+                or instance in self._pooled_instances):
+            await self._terminate_failed([instance])
+
+        elif self._pool and (instance in self._new_instances
+                or instance in self._pooled_instances):
+            await self._release_to_pool([instance])
 
-    async def terminate_instance(self, instance):
-        if instance in self._new_instances:
+        elif instance in self._new_instances:
             logging.info("Terminating new instance %s",
                 instance.classic_address.public_ip)
             shutdowner = Ec2Shutdown()
@@ -108,53 +251,323 @@ class Ec2InstancesManager(object):
 
     ## Helpers
 
-    async def _launch(self):
-        num_new = self._num_total - len(self._existing_instances)
-        if num_new > 0:
+    # Marks the end of the ready instances
+    END_OF_INSTANCES = None
+
+    async def _wait_for_pipelines(self):
+        await asyncio.gather(*self._pipelines)
+        await self._ready.put(self.END_OF_INSTANCES)
+
+    def _assign_existing_instances(self, instances):
+        """Assigns existing and pooled instances to the instance types
+        needed - to their own types where possible, and otherwise to
+        `aws` > `ec2` > `instance_type`, if needed, or to whichever other
+        type is - returning the types for which new instances are needed
+        """
+        needed = list(self._instance_types)
+        unmatched = []
+        for instance in instances:
+            instance_type = getattr(instance, 'instance_type', None)
+            if instance_type in needed:
+                self._assign_instance_type(instance, instance_type, needed)
+            else:
+                unmatched.append(instance)
+
+        default_type = self._config("aws", "ec2", "instance_type")
+        for instance in unmatched:
+            self._assign_instance_type(instance, default_type
+                if default_type in needed else needed[0], needed)
+
+        return needed
+
+    def _assign_instance_type(self, instance, instance_type, needed):
+        self._assigned_types[instance.id] = instance_type
+        needed.remove(instance_type)
+
+    async def _prepare_existing_instance(self, instance):
+        try:
+            if instance in self._pooled_instances:
+                try:
+                    await self._schedule_instance_auto_termination(instance)
+                except Exception as e:
+                    # The pool's reaper still terminates orphaned leases
+                    logging.warning("Failed to schedule auto-shutdown of "
+                        "pooled instance %s: %s",
+                        instance.classic_address.public_ip, e)
+            timer = StageTimer()
+            with timer.time('prepare_image'):
+                await self._prepare_image(instance)
+            await self._record_timings(instance, timer)
+            await self._ready.put(instance)
+        finally:
+            self._num_preparing[self.get_instance_type(instance)] -= 1
+
+    def _get_new_instance_names(self, num_new):
+        name_prefix = substitude_config_wildcards(self._config, "aws",
+            "ec2", "image_name_prefix_format", request_id=self._request_id)
+        self._name_prefix = (name_prefix + '-' + str(uuid.uuid4())[:8]).strip('-')
+        return ['{}-{}'.format(self._name_prefix, n) for n in range(num_new)]
+
+    async def _launch_and_initialize_instance(self, name, instance_type):
+        try:
+            instance = await self._get_new_instance(name, instance_type)
+            if instance:
+                await self._ready.put(instance)
+        finally:
+            self._num_preparing[instance_type] -= 1
+
+    async def _get_new_instance(self, name, instance_type, replacing=False):
+        """Launches, schedules auto-termination of, and initializes a new
+        instance of the given type, replacing it if any step fails, up to
+        the configured number of attempts.  Returns the instance, or None
+        if all attempts failed or launching was stopped before a retry
+        (which doesn't apply to replacements).
+        """
+        max_attempts = self._config("aws", "ec2", "max_launch_attempts")
+        for attempt in range(1, max_attempts + 1):
+            if (attempt > 1 and not replacing and (self._stop_launching
+                    or instance_type in self._stopped_types)):
+                return None
+
+            instance = None
+            timer = StageTimer()
+            try:
+                with timer.time('launch'):
+                    instance = await self._launch_instance(
+                        name if attempt == 1 else '{}-{}'.format(name, attempt),
+                        instance_type)
+                with timer.time('schedule_auto_termination'):
+                    await self._schedule_instance_auto_termination(instance)
+                with timer.time('initialize'):
+                    await self._initialize_instance(instance, timer)
+
+            except Exception as e:
+                logging.error("Failed to launch and initialize %s (attempt "
+                    "%s of %s): %s", name, attempt, max_attempts, e)
+                if instance:
+                    await self._record_timings(instance, timer)
+                    await self._terminate_failed([instance])
+
+            else:
+                await self._record_timings(instance, timer)
+                return instance
+
+        logging.error("Giving up on launching %s", name)
+        return None
+
+    async def _launch_instance(self, name, instance_type):
+        self._num_launching += 1
+        try:
+            instances = None
+            if self._config("aws", "ec2", "spot", "enabled"):
+                instances = await self._launch_spot_instance(name,
+                    instance_type)
+            if not instances:
+                instances = await self._get_launcher(instance_type).launch(
+                    [name])
+        except PostLaunchFailure as e:
+            # Keep track of them until they're terminated, in case
+            # of SIGINT or SIGTERM
+            self._new_instances.extend(e.instances)
+            await self._terminate_failed(e.instances)
+            raise
+        finally:
+            self._num_launching -= 1
+
+        self._new_instances.extend(instances)
+        self._assigned_types[instances[0].id] = instance_type
+        if self._status_tracker:
+            await self._status_tracker.set_instance_status(
+                instances[0].classic_address.public_ip,
+                market='spot' if self.is_spot(instances[0]) else 'on_demand',
+                instance_type=instance_type)
+        return instances[0]
+
+    async def _launch_spot_instance(self, name, instance_type):
+        """Launches a spot instance, returning None rather than raising
+        an exception if it fails and on-demand fallback is enabled
+        """
+        if not self._spot_launcher:
+            self._spot_launcher = SpotLauncher(self._config)
+
+        try:
+            instances = await self._spot_launcher.launch([name],
+                instance_type=instance_type)
+        except Exception as e:
+            if not self._config("aws", "ec2", "spot", "on_demand_fallback"):
+                raise
+            logging.warning("Failed to launch spot instance %s. Launching "
+                "on-demand instance instead: %s", name, e)
+            return None
+
+        self._spot_instance_ids.update([i.id for i in instances])
+        return instances
+
+    def _get_launcher(self, instance_type):
+        if instance_type not in self._launchers:
             # create config object specifically for afaws package
             options = {
-                'instance_type': self._config("aws", "ec2", "instance_type"),
+                'instance_type': instance_type,
                 'key_pair_name': self._config("aws", "ec2", "key_pair_name"),
                 'security_groups': self._config("aws", "ec2", "security_groups"),
                 'ebs_volume_size': self._config("aws", "ec2", "ebs", "volume_size"),
                 'ebs_device_name': self._config("aws", "ec2", "ebs", "device_name"),
                 'instance_initiated_shutdown_behavior': self._config("aws", "ec2", "instance_initiated_shutdown_behavior"),
             }
-            launcher = Ec2Launcher(
+            self._launchers[instance_type] = Ec2Launcher(
                 self._config("aws", "ec2", "image_id"),
                 self._afaws_config, **options)
+        return self._launchers[instance_type]
 
-            name_prefix = substitude_config_wildcards(self._config, "aws",
-                "ec2", "image_name_prefix_format", request_id=self._request_id)
-            name_prefix = (name_prefix + '-' + str(uuid.uuid4())[:8]).strip('-')
-            new_instance_names = [
-                '{}-{}'.format(name_prefix, n) for n in range(num_new)
-            ]
+    async def _terminate_failed(self, instances):
+        """Terminates instances that failed to launch, initialize, or
+        run, or that were interrupted, rather than releasing them to the
+        pool
+        """
+        for instance in instances:
+            if instance in self._new_instances:
+                self._new_instances.remove(instance)
+            if instance in self._pooled_instances:
+                self._pooled_instances.remove(instance)
+            await self._ssh_pool.close(instance.classic_address.public_ip)
 
-            try:
-                self._new_instances = await launcher.launch(new_instance_names)
-            except PostLaunchFailure as e:
-                # set self._new_instances so that _terminate will work
-                self._new_instances = e.instances
-                # raise excpetion so that _terminate will be called
-                raise
+        if instances:
+            logging.info("Terminating %s failed instance(s)", len(instances))
+            terminate = 'stop' != self._config("aws", "ec2",
+                "instance_initiated_shutdown_behavior")
+            await Ec2Shutdown().shutdown(instances, terminate=terminate)
 
-        # whether or not any instances were launched, self._launched
-        # is used in signal handlers
-        self._launched = True
+    # Removes all jobs scheduled with 'at', i.e. any scheduled shutdown
+    CANCEL_AUTO_SHUTDOWN_CMD = "atrm $(atq | cut -f1) > /dev/null 2>&1; true"
 
-    async def _schedule_auto_termination(self):
-        minutes = self._config("aws", "ec2", "minutes_until_auto_shutdown")
-        if self._new_instances and minutes:
-            auto_terminator = AutoShutdownScheduler(self._config('ssh_key'))
-            await auto_terminator.schedule_termination(
-                self._new_instances, minutes)
+    async def _schedule_instance_auto_termination(self, instance):
+        # Pooled instances shut themselves down only if they're not released
+        # within the maximum lease time, e.g. if the request was killed;
+        # the shutdown is cancelled when they're released to the pool
+        minutes = (self._config("aws", "ec2", "pool", "max_lease_minutes")
+            if self._pool else
+            self._config("aws", "ec2", "minutes_until_auto_shutdown"))
+        if not minutes:
+            return
 
-    async def _initialize(self):
-        if self._new_instances:
-            initializer = InstanceInitializerSsh(self._config('ssh_key'),
-                self._afaws_config)
-            await initializer.initialize(self._new_instances)
+        ip = instance.classic_address.public_ip
+        logging.info("Scheduling %s to shut down in %s minutes", ip, minutes)
+        ssh_client = await self._ssh_pool.get(ip)
+        # Pooled instances may have been scheduled by a previous lease.
+        # 'at' writes the scheduled job to stderr
+        result = await ssh_client.execute(("{}; echo 'sudo shutdown -h now' "
+            "| at now + {} minutes 2>&1").format(
+            self.CANCEL_AUTO_SHUTDOWN_CMD, minutes))
+        if 'job' not in result.stdout:
+            raise RuntimeError("Failed to schedule auto-shutdown of {}: {}".format(
+                ip, result.stdout + result.stderr))
+
+    # Options recommended by AWS for mounting EFS
+    EFS_MOUNT_OPTIONS = "nfsvers=4.1,rsize=1048576,wsize=1048576,hard,timeo=600,retrans=2,noresvport"
+
+    async def _initialize_instance(self, instance, timer):
+        # The image is pulled while volumes are mounted
+        await asyncio.gather(
+            self._time(timer, 'mount_efs_volumes', self._mount_efs_volumes(instance)),
+            self._time(timer, 'prepare_image', self._prepare_image(instance)))
+
+    async def _time(self, timer, stage, coro):
+        with timer.time(stage):
+            await coro
+
+    async def _record_timings(self, instance, timer):
+        if self._status_tracker:
+            await self._status_tracker.set_instance_status(
+                instance.classic_address.public_ip, timings=timer.timings)
+
+    async def _mount_efs_volumes(self, instance):
+        ip = instance.classic_address.public_ip
+        ssh_client = await self._ssh_pool.get(ip)
+        for host, mount_path in (self._config('aws', 'ec2', 'efs_volumes') or []):
+            logging.info("Mounting %s at %s on %s", host, mount_path, ip)
+            result = await ssh_client.execute(("mountpoint -q {path} || "
+                "(sudo mkdir -p {path} && sudo mount -t nfs4 -o {options}"
+                " {host} {path})").format(path=mount_path, host=host,
+                options=self.EFS_MOUNT_OPTIONS))
+            if result.stderr:
+                raise RuntimeError("Failed to mount {} on {}: {}".format(
+                    host, ip, result.stderr))
+
+    IMAGE_SCRIPT_DELIMITER = "__BLUESKY_AWS_IMAGE_EOF__"
+
+    async def _prepare_image(self, instance):
+        """Installs any missing dependencies, and pulls the bluesky image,
+        unless it's already on the instance with the expected digest, so
+        that runs don't each need to.
+
+        Failures are logged but otherwise ignored, since the image is
+        pulled when runs are bootstrapped if it's not on the instance, and
+        runs fail if dependencies are still missing.
+        """
+        ip = instance.classic_address.public_ip
+        try:
+            ssh_client = await self._ssh_pool.get(ip)
+            script = form_image_script(get_bluesky_image(self._config),
+                self._config('bluesky', 'docker', 'image_digest'),
+                packages=get_archive_packages(self._config))
+            result = await ssh_client.execute("bash << '{d}'\n{script}\n{d}".format(
+                script=script, d=self.IMAGE_SCRIPT_DELIMITER))
+            result = parse_image_result(result.stdout)
+
+        except Exception as e:
+            logging.warning("Failed to prepare bluesky image on %s: %s", ip, e)
+            return
+
+        if result['installed']:
+            logging.info("Installed %s on %s", ', '.join(result['installed']),
+                ip)
+        if result['install_failed']:
+            logging.warning("Failed to install %s on %s",
+                ', '.join(result['install_failed']), ip)
+        if result['pull_failed']:
+            logging.warning("Failed to pull bluesky image on %s", ip)
+        elif result['pulled']:
+            logging.info("Pulled bluesky image on %s in %s seconds", ip,
+                result['pull_seconds'])
+        elif result['has_docker']:
+            logging.info("Bluesky image already on %s", ip)
+
+        if self._status_tracker:
+            await self._status_tracker.set_instance_status(ip, image=result)
+
+    async def _release_or_terminate(self):
+        if self._pool:
+            await self._release_to_pool(self._pooled_instances + self._new_instances)
+        else:
+            await self._terminate()
+
+    async def _release_to_pool(self, instances):
+        """Cancels the instances' scheduled shutdowns and releases them to
+        the pool.  Instances whose shutdowns can't be cancelled are
+        terminated instead, since they'd otherwise shut down while idle
+        in the pool.
+        """
+        released = []
+        failed = []
+        for instance in instances:
+            ip = instance.classic_address.public_ip
+            try:
+                ssh_client = await self._ssh_pool.get(ip)
+                await ssh_client.execute(self.CANCEL_AUTO_SHUTDOWN_CMD)
+                released.append(instance)
+            except Exception as e:
+                logging.warning("Failed to cancel auto-shutdown of %s: %s", ip, e)
+                failed.append(instance)
+
+        await self._terminate_failed(failed)
+        # Released instances may be leased by other requests right away,
+        # and so mustn't be released again on exit
+        for instance in released:
+            if instance in self._new_instances:
+                self._new_instances.remove(instance)
+            if instance in self._pooled_instances:
+                self._pooled_instances.remove(instance)
+        await self._pool.release(released)
 
     async def _terminate(self):
         if self._new_instances:
@@ -0,0 +1,187 @@
+import asyncio
+import datetime
+import logging
+import math
+import os
+import time
+
+from afaws.asyncutils import run_in_loop_executor
+
+from .status import SystemState, SystemErrors
+
+__all__ = [
+    "get_met_domain",
+    "get_required_met_files",
+    "MetDirectoryIndex",
+    "MetReadinessGate"
+]
+
+def get_met_domain(domains, lat, lng):
+    """Returns the name of the first of the configured met domains whose
+    boundary contains the location, or None if none do
+    """
+    if lat is None or lng is None:
+        return None
+
+    for name, domain in (domains or {}).items():
+        boundary = domain['boundary']
+        if (boundary['sw']['lat'] <= lat <= boundary['ne']['lat']
+                and boundary['sw']['lng'] <= lng <= boundary['ne']['lng']):
+            return name
+
+def get_required_met_files(domain, start, end):
+    """Returns the names of the domain's met files covering start through
+    end, given in seconds since the epoch, UTC.
+
+    Each file is assumed to cover 'hours_per_file' hours, starting at a
+    multiple of that many hours after 00Z, and to be named by formatting
+    its start time with the domain's 'file_name_format'.
+    """
+    seconds_per_file = domain.get('hours_per_file', 24) * 3600
+    file_start = math.floor(start / seconds_per_file) * seconds_per_file
+    file_names = []
+    while file_start < end or not file_names:
+        file_names.append(datetime.datetime.utcfromtimestamp(
+            file_start).strftime(domain['file_name_format']))
+        file_start += seconds_per_file
+    return file_names
+
+
+class MetDirectoryIndex(object):
+    """Cached listings of met directories, so that checking the met files
+    of any number of fires lists each directory at most once per
+    'ttl_seconds'
+    """
+
+    def __init__(self, ttl_seconds):
+        self._ttl_seconds = ttl_seconds
+        self._listings = {}
+        self._locks = {}
+
+    async def get_missing(self, dir_name, file_names):
+        """Returns those of the files that aren't in the directory"""
+        listing = await self._get_listing(dir_name)
+        return [f for f in file_names if f not in listing]
+
+    async def _get_listing(self, dir_name):
+        lock = self._locks.setdefault(dir_name, asyncio.Lock())
+        async with lock:
+            listed_at, listing = self._listings.get(dir_name, (None, None))
+            if (listed_at is None
+                    or time.monotonic() - listed_at >= self._ttl_seconds):
+                listing = await run_in_loop_executor(
+                    lambda: self._list(dir_name))
+                self._listings[dir_name] = (time.monotonic(), listing)
+            return listing
+
+    def _list(self, dir_name):
+        try:
+            return set(os.listdir(dir_name))
+        except FileNotFoundError:
+            return set()
+
+
+class MetReadinessGate(object):
+    """Checks that the met files each fire needs - determined by the met
+    domain containing the fire and the fire's date range - are available,
+    waiting for them, if not, with the configured strategy.
+
+    While any fires are waiting, the system state is set to 'waiting',
+    with error WAITING_FOR_MET.  Fires not in any configured domain,
+    and all fires if no domains are configured, are considered ready.
+    """
+
+    def __init__(self, config, fire_index, bluesky_today, status_tracker):
+        self._config = config
+        self._fire_index = fire_index
+        self._bluesky_today = bluesky_today
+        self._status_tracker = status_tracker
+        self._domains = config('met', 'domains') or {}
+        self._dir_index = MetDirectoryIndex(
+            config('met', 'index_ttl_seconds'))
+        self._num_waiting = 0
+
+    ## Public Interface
+
+    @property
+    def max_wait_seconds(self):
+        """Longest that fires wait for met before they're aborted"""
+        wait_time = self._config('met', 'wait', 'time')
+        num_waits = self._config('met', 'wait', 'max_attempts') - 1
+        if self._config('met', 'wait', 'strategy') == 'backoff':
+            return wait_time * (2 ** num_waits - 1)
+        return wait_time * num_waits
+
+    async def get_missing(self, indices):
+        """Returns the met files that the fires, given by their indices
+        in the FireMetadataIndex, need but that aren't available yet
+        """
+        missing = []
+        for dir_name, file_names in self._get_required(indices).items():
+            missing.extend(os.path.join(dir_name, f) for f in
+                await self._dir_index.get_missing(dir_name, file_names))
+        return missing
+
+    async def wait(self, indices):
+        """Waits for the fires' met files, returning those still missing
+        once the maximum number of attempts is reached, or [] once they're
+        all available
+        """
+        wait_time = self._config('met', 'wait', 'time')
+        max_attempts = self._config('met', 'wait', 'max_attempts')
+        missing = await self.get_missing(indices)
+        if not missing:
+            return missing
+
+        await self._set_waiting(1)
+        try:
+            attempts = 1
+            while missing and attempts < max_attempts:
+                logging.info("Waiting %s seconds for met: %s", wait_time,
+                    ', '.join(missing))
+                await asyncio.sleep(wait_time)
+                attempts += 1
+                if self._config('met', 'wait', 'strategy') == 'backoff':
+                    wait_time *= 2
+                missing = await self.get_missing(indices)
+
+        finally:
+            await self._set_waiting(-1)
+
+        return missing
+
+    ## Helpers
+
+    def _get_required(self, indices):
+        """Returns the met files required by the fires, by directory"""
+        required = {}
+        for i in indices:
+            row = self._fire_index.row(i)
+            name = get_met_domain(self._domains,
+                row['centroid_lat'], row['centroid_lng'])
+            if not name:
+                continue
+
+            start, end = row['start'], row['end']
+            if start is None or end is None:
+                start = (self._bluesky_today.replace(hour=0, minute=0,
+                    second=0, microsecond=0) - datetime.datetime(1970, 1, 1)
+                    ).total_seconds()
+                end = start + self._config('met', 'default_num_hours') * 3600
+
+            domain = self._domains[name]
+            file_names = required.setdefault(domain['dir'], [])
+            for f in get_required_met_files(domain, start, end):
+                if f not in file_names:
+                    file_names.append(f)
+
+        return required
+
+    async def _set_waiting(self, change):
+        self._num_waiting += change
+        if change > 0 and self._num_waiting == 1:
+            await self._status_tracker.set_system_state(SystemState.WAITING,
+                system_error=SystemErrors.WAITING_FOR_MET)
+        elif change < 0 and self._num_waiting == 0:
+            await self._status_tracker.set_system_state(SystemState.RUNNING,
+                system_error=None)
@@ -0,0 +1,165 @@
+import asyncio
+import datetime
+import logging
+import uuid
+
+import boto3
+from afaws.asyncutils import run_in_loop_executor
+from afaws.ec2.shutdown import Ec2Shutdown
+
+from .launch import Ec2InstancesManager
+
+__all__ = [
+    "InstancePool"
+]
+
+class InstancePool(object):
+    """Pool of running, initialized instances that are shared across
+    requests.
+
+    Pool membership and state are recorded in ec2 instance tags, so that
+    the pool persists across separate bluesky-aws processes.  Idle
+    instances are leased to requests, which release them back to the pool
+    when they're done with them.  Instances that have been idle longer
+    than the configured timeout, beyond the number that are to be kept
+    warm, are terminated by `reap`.
+    """
+
+    POOL_TAG = 'bluesky-aws-pool'
+    STATE_TAG = 'bluesky-aws-pool-state'
+    SINCE_TAG = 'bluesky-aws-pool-since'
+
+    IDLE = 'idle'
+    LEASED_PREFIX = 'leased:'
+
+    # Seconds to wait after tagging instances as leased before checking
+    # that another process didn't lease them at the same time
+    LEASE_CONFIRMATION_WAIT = 2
+
+    def __init__(self, config):
+        self._config = config
+        self._name = config('aws', 'ec2', 'pool', 'name')
+        self._ec2 = boto3.resource('ec2')
+
+    ## Public Interface
+
+    async def lease(self, num, request_id):
+        """Leases up to `num` idle instances for the given request
+        """
+        if num <= 0:
+            return []
+
+        lease_id = '{}{}-{}'.format(self.LEASED_PREFIX, request_id,
+            str(uuid.uuid4())[:8])
+        idle = await self._find(self.IDLE)
+        candidates = idle[:num]
+        if not candidates:
+            logging.info("No idle instances in pool %s", self._name)
+            return []
+
+        await self._tag(candidates, lease_id)
+        await asyncio.sleep(self.LEASE_CONFIRMATION_WAIT)
+
+        # Tags are last-writer-wins, so re-read them to make sure that
+        # no other request leased the same instances
+        leased = []
+        for instance in candidates:
+            await run_in_loop_executor(instance.reload)
+            if self._get_tag(instance, self.STATE_TAG) == lease_id:
+                leased.append(instance)
+
+        logging.info("Leased %s instances from pool %s", len(leased), self._name)
+        return leased
+
+    async def release(self, instances):
+        """Returns instances to the pool, marking them as idle
+        """
+        if instances:
+            logging.info("Releasing %s instances to pool %s",
+                len(instances), self._name)
+            await self._tag(instances, self.IDLE)
+
+    async def reap(self):
+        """Terminates instances that have been idle longer than the idle
+        timeout, except for the number that are to be kept warm, as well
+        as instances whose leases have outlived the maximum lease time,
+        which are assumed to have been orphaned by aborted requests.
+
+        Returns the number of idle instances that remain in the pool.
+        """
+        now = datetime.datetime.utcnow()
+        idle_timeout = datetime.timedelta(minutes=self._config(
+            'aws', 'ec2', 'pool', 'idle_timeout_minutes'))
+        size = self._config('aws', 'ec2', 'pool', 'size')
+
+        # Most recently used instances are kept warm
+        idle = sorted(await self._find(self.IDLE),
+            key=lambda i: self._get_since(i) or now, reverse=True)
+        to_terminate = [i for i in idle[size:]
+            if now - (self._get_since(i) or now) > idle_timeout]
+
+        max_lease_minutes = self._config('aws', 'ec2', 'pool', 'max_lease_minutes')
+        if max_lease_minutes:
+            max_lease = datetime.timedelta(minutes=max_lease_minutes)
+            to_terminate.extend([i for i in await self._find(None)
+                if self._is_leased(i)
+                and now - (self._get_since(i) or now) > max_lease])
+
+        if to_terminate:
+            logging.info("Terminating %s instances from pool %s",
+                len(to_terminate), self._name)
+            await Ec2Shutdown().shutdown(to_terminate, terminate=True)
+
+        return len(idle) - len([i for i in to_terminate if i in idle])
+
+    async def maintain(self):
+        """Reaps expired instances and then launches and initializes as
+        many new instances as are needed to keep the configured number
+        of idle instances warm.
+        """
+        num_idle = await self.reap()
+        num_new = self._config('aws', 'ec2', 'pool', 'size') - num_idle
+        if num_new > 0:
+            logging.info("Launching %s instances for pool %s", num_new,
+                self._name)
+            # New instances are added to the pool when the manager exits
+            async with Ec2InstancesManager(self._config, num_new,
+                    'pool-' + self._name, existing=[], pool=self):
+                pass
+
+    ## Helpers
+
+    async def _find(self, state):
+        filters = [
+            {'Name': 'instance-state-name', 'Values': ['running']},
+            {'Name': 'tag:' + self.POOL_TAG, 'Values': [self._name]}
+        ]
+        if state:
+            filters.append({'Name': 'tag:' + self.STATE_TAG, 'Values': [state]})
+
+        return await run_in_loop_executor(
+            lambda: list(self._ec2.instances.filter(Filters=filters)))
+
+    async def _tag(self, instances, state):
+        since = datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S')
+        await run_in_loop_executor(self._ec2.create_tags,
+            Resources=[i.id for i in instances],
+            Tags=[
+                {'Key': self.POOL_TAG, 'Value': self._name},
+                {'Key': self.STATE_TAG, 'Value': state},
+                {'Key': self.SINCE_TAG, 'Value': since}
+            ])
+
+    def _get_tag(self, instance, key):
+        for tag in (instance.tags or []):
+            if tag['Key'] == key:
+                return tag['Value']
+
+    def _get_since(self, instance):
+        since = self._get_tag(instance, self.SINCE_TAG)
+        if since:
+            return datetime.datetime.strptime(since, '%Y-%m-%dT%H:%M:%S')
+
+    def _is_leased(self, instance):
+        return (self._get_tag(instance, self.STATE_TAG) or '').startswith(
+            self.LEASED_PREFIX)
@@ -0,0 +1,255 @@
+import asyncio
+import concurrent.futures
+import contextlib
+import functools
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import defaultdict
+
+import boto3
+import botocore.config
+
+try:
+    from aiobotocore.config import AioConfig
+    from aiobotocore.session import get_session
+except ImportError:
+    # Only needed for the 'aiobotocore' backend
+    get_session = None
+
+__all__ = [
+    "S3Backend",
+    "S3Client",
+    "AioS3Client",
+    "get_s3_client"
+]
+
+class S3Backend(object):
+    """Encapsulates string constants representing s3 client backends"""
+
+    # boto3 calls run on a dedicated thread pool
+    BOTO3 = 'boto3'
+    # calls are made natively on the event loop
+    AIOBOTOCORE = 'aiobotocore'
+
+    ALL = (BOTO3, AIOBOTOCORE)
+
+
+class S3Client(object):
+    """Async wrapper around a single boto3 s3 client, to be shared by
+    everything in the process that accesses s3.
+
+    boto3 clients are thread safe but expensive to create, so one is
+    created per process, with a connection pool large enough for the
+    configured concurrency.  Calls are run on a dedicated thread pool,
+    so that they don't compete with ssh and ec2 calls for the loop's
+    default executor, and the number in flight is bounded by a
+    semaphore.  Request counts, bytes transferred, and latencies are
+    tracked per operation.
+    """
+
+    MAX_CONCURRENCY = 32
+    # Retries use botocore's 'standard' mode, which backs off
+    # exponentially and retries throttling errors
+    MAX_ATTEMPTS = 5
+
+    def __init__(self, max_concurrency=MAX_CONCURRENCY,
+            max_attempts=MAX_ATTEMPTS, endpoint_url=None):
+        self._max_concurrency = max_concurrency
+        self._max_attempts = max_attempts
+        self._endpoint_url = endpoint_url
+        # asyncio semaphores are bound to the loop they're first used in
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._stats_lock = threading.Lock()
+        self._stats = defaultdict(lambda: {
+            'requests': 0,
+            'errors': 0,
+            'bytes_sent': 0,
+            'bytes_received': 0,
+            'seconds': 0.0,
+            'max_seconds': 0.0
+        })
+        self._create_client()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    ## Public Interface
+
+    @property
+    def stats(self):
+        """Returns request counts, bytes, and latencies, per operation"""
+        with self._stats_lock:
+            return {op: dict(s, seconds=round(s['seconds'], 3),
+                max_seconds=round(s['max_seconds'], 3))
+                for op, s in self._stats.items()}
+
+    async def put_object(self, **kwargs):
+        body = kwargs.get('Body') or b''
+        if isinstance(body, str):
+            body = body.encode()
+        return await self._request('put_object', kwargs,
+            bytes_sent=len(body))
+
+    async def get_object(self, **kwargs):
+        """Returns the response, with 'Body' already read into bytes"""
+        return await self._request('get_object', kwargs,
+            bytes_received=lambda r: len(r['Body']))
+
+    async def head_object(self, **kwargs):
+        return await self._request('head_object', kwargs)
+
+    async def delete_object(self, **kwargs):
+        return await self._request('delete_object', kwargs)
+
+    async def copy_object(self, **kwargs):
+        return await self._request('copy_object', kwargs)
+
+    async def list_objects_v2(self, **kwargs):
+        return await self._request('list_objects_v2', kwargs)
+
+    async def upload_file(self, filename, bucket, key):
+        return await self._request('upload_file',
+            dict(Filename=filename, Bucket=bucket, Key=key),
+            bytes_sent=os.path.getsize(filename))
+
+    async def close(self):
+        """Releases any resources bound to the current event loop.
+        The client may still be used afterwards.
+        """
+        pass
+
+    ## Backend
+
+    def _create_client(self):
+        self._client = boto3.client('s3', endpoint_url=self._endpoint_url,
+            config=botocore.config.Config(
+                max_pool_connections=self._max_concurrency,
+                retries={'max_attempts': self._max_attempts, 'mode': 'standard'}))
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self._max_concurrency, thread_name_prefix='s3')
+
+    async def _send(self, operation, kwargs):
+        return await asyncio.get_event_loop().run_in_executor(self._executor,
+            functools.partial(self._send_sync, operation, kwargs))
+
+    def _send_sync(self, operation, kwargs):
+        response = getattr(self._client, operation)(**kwargs)
+        if operation == 'get_object':
+            response['Body'] = response['Body'].read()
+        return response
+
+    ## Helpers
+
+    def _get_semaphore(self):
+        loop = asyncio.get_event_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self._max_concurrency)
+        return self._semaphores[loop]
+
+    async def _request(self, operation, kwargs, bytes_sent=0,
+            bytes_received=None):
+        async with self._get_semaphore():
+            start = time.monotonic()
+            try:
+                response = await self._send(operation, kwargs)
+            except Exception:
+                self._record(operation, time.monotonic() - start, error=True)
+                raise
+
+            self._record(operation, time.monotonic() - start,
+                bytes_sent=bytes_sent,
+                bytes_received=bytes_received(response) if bytes_received else 0)
+            return response
+
+    def _record(self, operation, seconds, error=False, bytes_sent=0,
+            bytes_received=0):
+        with self._stats_lock:
+            stats = self._stats[operation]
+            stats['requests'] += 1
+            stats['errors'] += int(error)
+            stats['bytes_sent'] += bytes_sent
+            stats['bytes_received'] += bytes_received
+            stats['seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+
+
+class AioS3Client(S3Client):
+    """S3Client that uses aiobotocore to make requests natively on the
+    event loop, rather than tying up a thread per request in flight.
+
+    aiobotocore clients are bound to the loop they're created in, so
+    one is created per loop, on first use.
+    """
+
+    ## Public Interface
+
+    async def close(self):
+        exit_stack = self._exit_stacks.pop(asyncio.get_event_loop(), None)
+        if exit_stack:
+            await exit_stack.aclose()
+
+    ## Backend
+
+    def _create_client(self):
+        if not get_session:
+            raise RuntimeError("aiobotocore must be installed to use "
+                "the aiobotocore s3 backend")
+
+        self._session = get_session()
+        self._clients = weakref.WeakKeyDictionary()
+        self._exit_stacks = weakref.WeakKeyDictionary()
+
+    async def _get_client(self):
+        loop = asyncio.get_event_loop()
+        if loop not in self._clients:
+            exit_stack = contextlib.AsyncExitStack()
+            self._clients[loop] = await exit_stack.enter_async_context(
+                self._session.create_client('s3',
+                    endpoint_url=self._endpoint_url,
+                    config=AioConfig(
+                        max_pool_connections=self._max_concurrency,
+                        retries={'max_attempts': self._max_attempts,
+                            'mode': 'standard'})))
+            self._exit_stacks[loop] = exit_stack
+        return self._clients[loop]
+
+    async def _send(self, operation, kwargs):
+        client = await self._get_client()
+
+        if operation == 'upload_file':
+            # aiobotocore doesn't implement boto3's managed transfers,
+            # so the file is uploaded with a single put
+            with open(kwargs['Filename'], 'rb') as f:
+                return await client.put_object(Body=f,
+                    Bucket=kwargs['Bucket'], Key=kwargs['Key'])
+
+        response = await getattr(client, operation)(**kwargs)
+        if operation == 'get_object':
+            async with response['Body'] as stream:
+                response['Body'] = await stream.read()
+        return response
+
+
+_s3_clients = {}
+_s3_clients_lock = threading.Lock()
+
+def get_s3_client(backend=S3Backend.BOTO3,
+        max_concurrency=S3Client.MAX_CONCURRENCY,
+        max_attempts=S3Client.MAX_ATTEMPTS):
+    """Returns the process' S3Client for the given backend and settings,
+    creating it if necessary
+    """
+    key = (backend, max_concurrency, max_attempts)
+    with _s3_clients_lock:
+        if key not in _s3_clients:
+            logging.debug("Creating %s s3 client", backend)
+            klass = AioS3Client if backend == S3Backend.AIOBOTOCORE else S3Client
+            _s3_clients[key] = klass(max_concurrency=max_concurrency,
+                max_attempts=max_attempts)
+        return _s3_clients[key]
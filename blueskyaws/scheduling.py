@@ -0,0 +1,159 @@
+import asyncio
+import collections
+import heapq
+import logging
+import math
+
+from .fires import get_fire_info, FireMetadataIndex
+
+__all__ = [
+    "SchedulingPolicy",
+    "WorkQueue",
+    "estimate_cost",
+    "estimate_costs",
+    "order_fires",
+    "order_fire_indices",
+    "simulate_makespan"
+]
+
+class SchedulingPolicy(object):
+    """Encapsulates string constants representing the policies for
+    ordering fires on the work queue.
+    """
+
+    # Fires are run in the order they're specified in the input data
+    FIFO = 'fifo'
+    # Fires with the highest estimated cost are run first, so that each
+    # instance picks up the longest remaining run when it frees up
+    # (i.e. the longest-processing-time heuristic).
+    LONGEST_FIRST = 'longest_first'
+
+    ALL = (FIFO, LONGEST_FIRST)
+
+
+class WorkQueue(object):
+    """Work queue to which items can be put back, to be retried before
+    any others - e.g. when the instance running them is interrupted.
+
+    Items put back are kept apart from the rest, and taken first, so
+    that putting them back never blocks; they don't count against
+    maxsize.
+    """
+
+    def __init__(self, maxsize=0):
+        self._queue = asyncio.Queue(maxsize)
+        self._put_back = collections.deque()
+        self._put_back_event = asyncio.Event()
+
+    ## Public Interface
+
+    def qsize(self):
+        return self._queue.qsize() + len(self._put_back)
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def full(self):
+        return self._queue.full()
+
+    async def put(self, item):
+        await self._queue.put(item)
+
+    def put_nowait(self, item):
+        self._queue.put_nowait(item)
+
+    def put_back(self, item):
+        self._put_back.append(item)
+        self._put_back_event.set()
+
+    async def get(self):
+        while not self._put_back:
+            if not self._queue.empty():
+                return self._queue.get_nowait()
+
+            get = asyncio.ensure_future(self._queue.get())
+            put_back = asyncio.ensure_future(self._put_back_event.wait())
+            try:
+                await asyncio.wait([get, put_back],
+                    return_when=asyncio.FIRST_COMPLETED)
+                if get.done():
+                    return get.result()
+            finally:
+                put_back.cancel()
+                # Items aren't lost when a pending get is cancelled
+                get.cancel()
+
+        item = self._put_back.popleft()
+        if not self._put_back:
+            self._put_back_event.clear()
+        return item
+
+
+# The following weights are rough, relative estimates.  Each run has
+# a fixed overhead (starting the container, exporting, tarballing, and
+# publishing output), and then scales with area and number of locations.
+RUN_OVERHEAD = 1.0
+AREA_WEIGHT = 1.0 / 1000 # per acre
+LOCATION_WEIGHT = 0.1 # per specified point or perimeter
+# Dispersion (and the visualization of its output) dominates run time
+# when configured
+DISPERSION_MODULES = ('dispersion', 'visualization')
+DISPERSION_FACTOR = 10.0
+
+def estimate_cost(fire, modules):
+    """Returns the estimated relative cost of running bluesky on the fire
+    """
+    fire_info = get_fire_info(fire)
+    return _estimate_cost(fire_info['area'] or 0,
+        fire_info['num_points'] + fire_info['num_perimeters'], modules)
+
+def estimate_costs(fire_index, modules):
+    """Returns the estimated relative cost of running bluesky on each
+    fire in the FireMetadataIndex
+    """
+    areas = fire_index.column('area')
+    num_points = fire_index.column('num_points')
+    num_perimeters = fire_index.column('num_perimeters')
+    return [
+        _estimate_cost(0 if math.isnan(areas[i]) else areas[i],
+            num_points[i] + num_perimeters[i], modules)
+        for i in range(len(fire_index))
+    ]
+
+def order_fires(fires, config):
+    """Returns the fires in the order in which they should be put on the
+    work queue, according to the configured scheduling policy
+    """
+    order = order_fire_indices(FireMetadataIndex.build(fires), config)
+    return [fires[i] for i in order]
+
+def order_fire_indices(fire_index, config):
+    """Returns the indices of the fires in the FireMetadataIndex in the
+    order in which they should be put on the work queue, according to
+    the configured scheduling policy
+    """
+    order = list(range(len(fire_index)))
+    policy = config('scheduling', 'policy')
+    if policy == SchedulingPolicy.LONGEST_FIRST:
+        costs = estimate_costs(fire_index, config('bluesky', 'modules'))
+        order.sort(key=lambda i: -costs[i])
+        logging.debug("Fires ordered by estimated cost: %s",
+            [costs[i] for i in order])
+
+    return order
+
+def _estimate_cost(area, num_locations, modules):
+    cost = area * AREA_WEIGHT + num_locations * LOCATION_WEIGHT
+    if set(modules or []).intersection(DISPERSION_MODULES):
+        cost *= DISPERSION_FACTOR
+    return RUN_OVERHEAD + cost
+
+def simulate_makespan(costs, num_instances):
+    """Returns the time at which the last instance would finish if
+    runs with the given costs were pulled off the work queue in order
+    by whichever instance is free first.
+    """
+    finish_times = [0.0] * max(1, min(num_instances, len(costs)))
+    for cost in costs:
+        heapq.heappush(finish_times, heapq.heappop(finish_times) + cost)
+    return max(finish_times)
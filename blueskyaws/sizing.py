@@ -0,0 +1,80 @@
+import logging
+import math
+from collections import Counter
+
+__all__ = [
+    "get_instance_type",
+    "get_instance_types",
+    "allocate_instances"
+]
+
+def get_instance_type(area, config):
+    """Returns the instance type to run a fire of the given area on,
+    according to `aws` > `ec2` > `instance_type_ladder`.
+
+    The first rung of the ladder whose 'max_area' isn't exceeded and
+    whose 'modules' are all configured is used.  If the ladder isn't
+    configured, or if no rung applies, `aws` > `ec2` > `instance_type`
+    is used.
+    """
+    area = 0 if area is None or math.isnan(area) else area
+    modules = set(config('bluesky', 'modules') or [])
+    for rung in config('aws', 'ec2', 'instance_type_ladder') or []:
+        if rung.get('max_area') is not None and area > rung['max_area']:
+            continue
+        if not modules.issuperset(rung.get('modules') or []):
+            continue
+        return rung['instance_type']
+
+    return config('aws', 'ec2', 'instance_type')
+
+def get_instance_types(fire_index, config):
+    """Returns the instance type to run each fire in the FireMetadataIndex
+    on, as a list in index order
+    """
+    if not config('aws', 'ec2', 'instance_type_ladder'):
+        return [config('aws', 'ec2', 'instance_type')] * len(fire_index)
+    return [get_instance_type(area, config)
+        for area in fire_index.column('area')]
+
+def allocate_instances(fire_instance_types, slots_per_instance,
+        max_num_instances=None):
+    """Returns the type of each instance needed to run the fires, given
+    the type each fire is to be run on - enough instances of each type to
+    run all of its fires at once, unless that would exceed
+    max_num_instances, in which case the maximum is apportioned among the
+    types by how many instances they'd otherwise need, with each getting
+    at least one, as far as possible.
+
+    Note that, when slots_per_instance is 'auto', the number of slots
+    isn't known until instances are launched, so one is assumed.
+    """
+    num_fires = Counter(fire_instance_types)
+    slots = 1 if slots_per_instance == 'auto' else slots_per_instance
+    needed = {t: math.ceil(n / slots) for t, n in num_fires.items()}
+    total = sum(needed.values())
+    if not max_num_instances or total <= max_num_instances:
+        return _expand(needed, num_fires)
+
+    # Types that need the most instances are given one first
+    by_need = sorted(needed, key=lambda t: -needed[t])
+    allocated = {t: 1 for t in by_need[:max_num_instances]}
+    num_left = max_num_instances - len(allocated)
+    if num_left > 0:
+        # The rest are apportioned by largest remainder
+        extra_needed = total - len(allocated)
+        shares = {t: num_left * (needed[t] - 1) / extra_needed
+            for t in allocated}
+        for t in allocated:
+            allocated[t] += int(shares[t])
+        num_left -= sum(int(s) for s in shares.values())
+        for t in sorted(shares, key=lambda t: int(shares[t]) - shares[t])[:num_left]:
+            allocated[t] += 1
+
+    logging.info("Allocated %s instances, rather than the %s needed to run "
+        "all fires at once: %s", max_num_instances, total, allocated)
+    return _expand(allocated, num_fires)
+
+def _expand(num_instances, num_fires):
+    # Lists instance types in the order in which fires were assigned them
+    return [t for t in num_fires for i in range(num_instances.get(t, 0))]
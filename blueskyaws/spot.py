@@ -0,0 +1,141 @@
+import json
+import logging
+
+import boto3
+from afaws.asyncutils import run_in_loop_executor
+from afaws.ec2.shutdown import Ec2Shutdown
+
+__all__ = [
+    "SpotLauncher",
+    "form_interruption_check_script",
+    "parse_interruption_notice"
+]
+
+class SpotLauncher(object):
+    """Launches one-time spot instances, with the same options that
+    on-demand instances are launched with.
+
+    Instances that are created but fail to start running are terminated
+    before the error is raised, so that callers can simply fall back to
+    launching on-demand instances.
+    """
+
+    def __init__(self, config):
+        self._config = config
+        self._ec2 = boto3.resource('ec2')
+        self._image_id = None
+
+    ## Public Interface
+
+    async def launch(self, names, instance_type=None):
+        """Launches an instance for each of the names, of the given type
+        or, if not specified, of `aws` > `ec2` > `instance_type`
+        """
+        kwargs = await self._get_create_kwargs(len(names),
+            instance_type or self._config("aws", "ec2", "instance_type"))
+        instances = await run_in_loop_executor(self._ec2.create_instances,
+            **kwargs)
+        logging.info("Created spot instances %s",
+            ', '.join([i.id for i in instances]))
+
+        try:
+            for instance, name in zip(instances, names):
+                await run_in_loop_executor(instance.create_tags,
+                    Tags=[{'Key': 'Name', 'Value': name}])
+            for instance in instances:
+                await run_in_loop_executor(instance.wait_until_running)
+                await run_in_loop_executor(instance.reload)
+
+        except:
+            await Ec2Shutdown().shutdown(instances, terminate=True)
+            raise
+
+        return instances
+
+    ## Helpers
+
+    async def _get_create_kwargs(self, num, instance_type):
+        spot_options = {
+            'SpotInstanceType': 'one-time',
+            'InstanceInterruptionBehavior': 'terminate'
+        }
+        if self._config("aws", "ec2", "spot", "max_price"):
+            spot_options['MaxPrice'] = str(
+                self._config("aws", "ec2", "spot", "max_price"))
+
+        return dict(
+            ImageId=await self._get_image_id(),
+            MinCount=num,
+            MaxCount=num,
+            InstanceType=instance_type,
+            KeyName=self._config("aws", "ec2", "key_pair_name"),
+            SecurityGroups=self._config("aws", "ec2", "security_groups"),
+            IamInstanceProfile={
+                'Arn': self._config('aws', 'iam_instance_profile', 'Arn')
+            },
+            BlockDeviceMappings=[{
+                'DeviceName': self._config("aws", "ec2", "ebs", "device_name"),
+                'Ebs': {
+                    'VolumeSize': self._config("aws", "ec2", "ebs", "volume_size")
+                }
+            }],
+            InstanceMarketOptions={
+                'MarketType': 'spot',
+                'SpotOptions': spot_options
+            },
+            # one-time spot instances can't be stopped
+            InstanceInitiatedShutdownBehavior='terminate'
+        )
+
+    async def _get_image_id(self):
+        """Returns the id of the configured image, which may be
+        specified by name
+        """
+        if not self._image_id:
+            image = self._config("aws", "ec2", "image_id")
+            if image.startswith('ami-'):
+                self._image_id = image
+            else:
+                images = await run_in_loop_executor(lambda: list(
+                    self._ec2.images.filter(Filters=[
+                        {'Name': 'name', 'Values': [image]}])))
+                if not images:
+                    raise RuntimeError("Image {} not found".format(image))
+                self._image_id = sorted(images,
+                    key=lambda i: i.creation_date)[-1].id
+
+        return self._image_id
+
+
+# Polls instance metadata for a spot interruption notice, printing it and
+# exiting as soon as there is one, or printing nothing after the given
+# number of checks.  IMDSv2 tokens are used if available.
+INTERRUPTION_CHECK_SCRIPT_TEMPLATE = """for i in $(seq {num_checks}); do
+    TOKEN=$(curl -s -f -m 2 -X PUT "{metadata_url}/api/token" -H "X-aws-ec2-metadata-token-ttl-seconds: 60" || true)
+    NOTICE=$(curl -s -f -m 2 ${{TOKEN:+-H "X-aws-ec2-metadata-token: $TOKEN"}} "{metadata_url}/meta-data/spot/instance-action" || true)
+    if [ -n "$NOTICE" ]; then
+        echo "$NOTICE"
+        exit 0
+    fi
+    if [ $i -lt {num_checks} ]; then
+        sleep {seconds_between_checks}
+    fi
+done
+"""
+
+def form_interruption_check_script(metadata_url, seconds_between_checks,
+        num_checks):
+    return INTERRUPTION_CHECK_SCRIPT_TEMPLATE.format(
+        metadata_url=metadata_url.rstrip('/'),
+        seconds_between_checks=seconds_between_checks,
+        num_checks=num_checks)
+
+def parse_interruption_notice(stdout):
+    """Returns the interruption notice, e.g.
+    {"action": "terminate", "time": "2020-03-01T08:22:00Z"}, or None
+    if there wasn't one
+    """
+    lines = stdout.strip().split('\n')
+    if not lines[-1]:
+        return None
+    return json.loads(lines[-1])
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+from collections import defaultdict
+
+from afaws.asyncutils import run_in_loop_executor
+from afaws.ec2.ssh import SshClient
+
+__all__ = [
+    "SshConnectionPool"
+]
+
+class SshConnectionPool(object):
+    """Maintains one open ssh connection per instance ip, to be shared
+    by all phases of a request - auto-shutdown scheduling, initialization,
+    and runs - so that each instance only pays the cost of connecting
+    and authenticating once.
+
+    Connections are checked before being handed out, and are reopened
+    if they've been dropped.
+    """
+
+    # Newly launched instances may not be accepting ssh connections
+    # right away
+    CONNECT_ATTEMPTS = 5
+    SECONDS_BETWEEN_CONNECT_ATTEMPTS = 5
+
+    def __init__(self, ssh_key):
+        self._ssh_key = ssh_key
+        self._clients = {}
+        self._locks = defaultdict(asyncio.Lock)
+        self._stats = {
+            'opened': 0,
+            'reused': 0,
+            'reconnected': 0
+        }
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    ## Public Interface
+
+    @property
+    def stats(self):
+        return dict(self._stats)
+
+    async def get(self, ip):
+        """Returns an open connection to the given ip, opening a new one
+        if necessary.  Connections may be used concurrently.
+        """
+        async with self._locks[ip]:
+            client = self._clients.get(ip)
+            if client and self._is_healthy(client):
+                self._stats['reused'] += 1
+                return client
+
+            if client:
+                logging.warning("Ssh connection to %s was dropped. Reconnecting", ip)
+                self._stats['reconnected'] += 1
+                await self._close(client)
+
+            self._clients[ip] = await self._connect(ip)
+            self._stats['opened'] += 1
+            return self._clients[ip]
+
+    async def close(self, ip=None):
+        """Closes the connection to the given ip, or all connections
+        if no ip is specified
+        """
+        for client_ip in ([ip] if ip else list(self._clients)):
+            client = self._clients.pop(client_ip, None)
+            if client:
+                await self._close(client)
+
+        if not ip:
+            logging.info("Ssh connection stats: %s", self._stats)
+
+    ## Helpers
+
+    async def _connect(self, ip):
+        attempts = 1
+        while True:
+            client = SshClient(self._ssh_key, ip)
+            try:
+                await run_in_loop_executor(client.__enter__)
+                return client
+
+            except Exception as e:
+                if attempts >= self.CONNECT_ATTEMPTS:
+                    raise
+                logging.warning("Failed to connect to %s (%s). Retrying in %s "
+                    "seconds", ip, e, self.SECONDS_BETWEEN_CONNECT_ATTEMPTS)
+                attempts += 1
+                await asyncio.sleep(self.SECONDS_BETWEEN_CONNECT_ATTEMPTS)
+
+    async def _close(self, client):
+        try:
+            await run_in_loop_executor(client.__exit__, None, None, None)
+        except Exception as e:
+            logging.warning("Failed to close ssh connection: %s", e)
+
+    def _is_healthy(self, client):
+        # afaws' SshClient wraps a paramiko SSHClient; if it doesn't
+        # expose it, assume that the connection is still open
+        paramiko_client = getattr(client, '_client', None)
+        if paramiko_client is None or not hasattr(paramiko_client, 'get_transport'):
+            return True
+
+        transport = paramiko_client.get_transport()
+        return bool(transport and transport.is_active())
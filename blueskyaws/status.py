@@ -4,7 +4,7 @@ import logging
 import os
 from collections import defaultdict
 
-from afaws.asyncutils import run_in_loop_executor
+from .timing import summarize_timings
 
 __all__ = [
     "SystemState",
@@ -46,6 +46,28 @@ class Status(object):
     UNKNOWN = "unknown"
 
 class StatusTracker(object):
+    """Tracks system and run status, saving it to s3.
+
+    By default, status is saved on every change.  If
+    'status' > 'flush_interval_seconds' is configured, status is
+    instead written behind - changes are made in memory and flushed
+    by a background task at most once per interval, as well as
+    whenever a run or the system reaches a terminal state and when
+    the tracker is closed.
+
+    Status is saved to a single, combined object,
+    'status/<request_id>-status.json'.  If 'status' > 'sharded' is
+    set, it's instead saved as a small manifest,
+    'status/<request_id>/manifest.json', with everything but the runs
+    and instances, plus one object per run,
+    'status/<request_id>/<run_id>.json', and per instance,
+    'status/<request_id>/instances/<ip>.json', only the changed of which
+    are written on each save.  The combined object is still written
+    alongside them if 'status' > 'write_combined' is set, in which case
+    each save still grows with the number of runs and instances.
+    """
+
+    TERMINAL_RUN_STATUSES = (Status.SUCCESS, Status.FAILURE, Status.UNKNOWN)
 
     def __init__(self, bluesky_today, request_id, s3_client, config):
         self._s3_client = s3_client
@@ -53,29 +75,26 @@ class StatusTracker(object):
         self._request_id = request_id
         self._config = config
         self._status = None
+        # Guards in-memory updates
         self._lock = asyncio.Lock()
+        # Serializes writes to s3, so that they land in order
+        self._write_lock = asyncio.Lock()
+        self._dirty = False
+        self._dirty_runs = set()
+        self._dirty_instances = set()
+        self._sharded = config('status', 'sharded')
+        self._write_combined = (not self._sharded
+            or config('status', 'write_combined'))
+        self._flush_interval = config('status', 'flush_interval_seconds')
+        self._flusher = None
 
-    async def _record_in_request_index(self):
-        path = os.path.join('request-index',
-            self._bluesky_today.strftime("%Y%m%d"), self._request_id)
-        await run_in_loop_executor(self._s3_client.put_object, Body='',
-            Bucket=self._config('aws', 's3', 'bucket_name'), Key=path)
+    async def __aenter__(self):
+        return self
 
-    async def _save_status(self):
-        logging.info("Saving status %s", self._status)
-        await run_in_loop_executor(self._s3_client.put_object,
-            Body=json.dumps(self._status),
-            Bucket=self._config('aws', 's3', 'bucket_name'),
-            Key=os.path.join('status', self._request_id + '-status.json'))
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
 
-    def _initialize_counts(self):
-        self._status["counts"] = {
-            Status.WAITING: 0,
-            Status.RUNNING: 0,
-            Status.SUCCESS: 0,
-            Status.FAILURE: 0,
-            Status.UNKNOWN: 0
-        }
+    ## Public Interface
 
     async def initialize(self):
         logging.info("Initializing status tracker for %s", self._request_id)
@@ -84,32 +103,184 @@ class StatusTracker(object):
             "system_error": None,
             "system_message": None,
             "bluesky_today": self._bluesky_today.strftime("%Y-%m-%d"),
+            "instances": defaultdict(lambda: {}),
             "runs": defaultdict(lambda: {})
         }
         self._initialize_counts()
-        await self._save_status()
+        self._dirty = True
+        await self._flush()
         await self._record_in_request_index()
 
+        if self._flush_interval and not self._flusher:
+            self._flusher = asyncio.ensure_future(self._flush_periodically())
+
     async def set_system_state(self, system_state, **kwargs):
-        self._status['system_state'] = system_state
-        self._status.update(**kwargs)
+        async with self._lock:
+            self._status['system_state'] = system_state
+            self._status.update(**kwargs)
+            self._dirty = True
 
-        await self._save_status()
+        await self._flush()
 
     async def set_run_status(self, run, status, **kwargs):
         logging.info("Setting run status for %s", run.run_id)
+        if self._status is None:
+            await self.initialize()
+
         async with self._lock:
-            logging.info("Lock acquired to set run status for %s", run.run_id)
-            if self._status is None:
-                await self.initialize()
+            run_status = self._status["runs"][run.run_id]
+
+            # update counts incrementally, rather than recounting all runs
+            if run_status.get("status"):
+                self._status["counts"][run_status["status"]] -= 1
+            self._status["counts"][status] += 1
 
             # Update run's status
-            self._status["runs"][run.run_id]["status"] = status
-            self._status["runs"][run.run_id].update(**kwargs)
+            run_status["status"] = status
+            run_status.update(**kwargs)
+            self._dirty = True
+            self._dirty_runs.add(run.run_id)
+
+        if not self._flush_interval or status in self.TERMINAL_RUN_STATUSES:
+            await self._flush()
+
+    async def record_interruption(self, run, **info):
+        """Records that the run was interrupted, e.g. by its spot instance
+        being reclaimed, and marks it as waiting to be run again
+        """
+        if self._status is None:
+            await self.initialize()
+
+        async with self._lock:
+            interruptions = list(self._status["runs"][run.run_id].get(
+                "interruptions", []))
+
+        await self.set_run_status(run, Status.WAITING,
+            interruptions=interruptions + [info])
+
+    async def set_instance_status(self, ip, **kwargs):
+        """Records information about an instance, such as how long it
+        took to initialize, keyed by ip
+        """
+        if self._status is None:
+            await self.initialize()
+
+        async with self._lock:
+            self._status["instances"][ip].update(**kwargs)
+            self._dirty = True
+            self._dirty_instances.add(ip)
+
+        if not self._flush_interval:
+            await self._flush()
 
-            # update counts
-            self._initialize_counts()
-            for r in self._status["runs"].values():
-                self._status["counts"][r['status']] += 1
+    async def summarize_timings(self):
+        """Returns the count, min, median, 95th percentile, and max of
+        each stage of the request's runs and of preparing its instances
+        """
+        if self._status is None:
+            await self.initialize()
 
-            await self._save_status()
+        async with self._lock:
+            return {
+                'runs': summarize_timings(r['timings']
+                    for r in self._status['runs'].values() if r.get('timings')),
+                'instances': summarize_timings(i['timings']
+                    for i in self._status['instances'].values() if i.get('timings'))
+            }
+
+    async def close(self):
+        """Stops the background flusher, if running, and saves any
+        pending changes
+        """
+        if self._flusher:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+
+        if self._status is not None:
+            await self._flush()
+
+    ## Helpers
+
+    async def _record_in_request_index(self):
+        path = os.path.join('request-index',
+            self._bluesky_today.strftime("%Y%m%d"), self._request_id)
+        await self._s3_client.put_object(Body='',
+            Bucket=self._config('aws', 's3', 'bucket_name'), Key=path)
+
+    async def _flush(self):
+        async with self._write_lock:
+            # Another caller may have already written this change
+            if not self._dirty:
+                return
+
+            async with self._lock:
+                dirty_runs = self._dirty_runs
+                dirty_instances = self._dirty_instances
+                objects = self._form_status_objects(dirty_runs,
+                    dirty_instances)
+                self._dirty = False
+                self._dirty_runs = set()
+                self._dirty_instances = set()
+
+            try:
+                await asyncio.gather(*[self._save_status(key, body)
+                    for key, body in objects])
+            except Exception:
+                self._dirty = True
+                self._dirty_runs.update(dirty_runs)
+                self._dirty_instances.update(dirty_instances)
+                raise
+
+    SHARDED_KEYS = ('runs', 'instances')
+
+    def _form_status_objects(self, dirty_runs, dirty_instances):
+        objects = []
+        if self._write_combined:
+            objects.append((os.path.join('status',
+                self._request_id + '-status.json'), json.dumps(self._status)))
+
+        if self._sharded:
+            manifest = {k: v for k, v in self._status.items()
+                if k not in self.SHARDED_KEYS}
+            objects.append((os.path.join('status', self._request_id,
+                'manifest.json'), json.dumps(manifest)))
+            objects.extend([
+                (os.path.join('status', self._request_id, run_id + '.json'),
+                    json.dumps(self._status['runs'][run_id]))
+                for run_id in dirty_runs
+            ])
+            objects.extend([
+                (os.path.join('status', self._request_id, 'instances',
+                    ip + '.json'), json.dumps(self._status['instances'][ip]))
+                for ip in dirty_instances
+            ])
+
+        return objects
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            try:
+                await self._flush()
+            except Exception as e:
+                logging.warning("Failed to flush status: %s", e)
+
+    async def _save_status(self, key, body):
+        logging.info("Saving status %s to %s", body, key)
+        await self._s3_client.put_object(
+            Body=body,
+            Bucket=self._config('aws', 's3', 'bucket_name'),
+            Key=key)
+
+    def _initialize_counts(self):
+        self._status["counts"] = {
+            Status.WAITING: 0,
+            Status.RUNNING: 0,
+            Status.SUCCESS: 0,
+            Status.FAILURE: 0,
+            Status.UNKNOWN: 0
+        }
@@ -0,0 +1,59 @@
+import contextlib
+import math
+import statistics
+import time
+from collections import OrderedDict, defaultdict
+
+__all__ = [
+    "StageTimer",
+    "summarize_timings"
+]
+
+class StageTimer(object):
+    """Records how long, in seconds, each stage of a run or of preparing
+    an instance took, using the monotonic clock.  Stages that raise an
+    exception are still recorded, so that the time spent before failing
+    is known.
+    """
+
+    def __init__(self):
+        self._timings = OrderedDict()
+
+    ## Public Interface
+
+    @property
+    def timings(self):
+        return dict(self._timings)
+
+    @contextlib.contextmanager
+    def time(self, stage):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._timings[stage] = round(self._timings.get(stage, 0)
+                + time.monotonic() - start, 3)
+
+
+def summarize_timings(timings):
+    """Given an iterable of dicts of seconds by stage, as recorded by
+    StageTimer, returns the count, min, median, 95th percentile, and max
+    of each stage
+    """
+    seconds_by_stage = defaultdict(list)
+    for t in timings:
+        for stage, seconds in t.items():
+            seconds_by_stage[stage].append(seconds)
+
+    summary = {}
+    for stage, seconds in seconds_by_stage.items():
+        seconds.sort()
+        summary[stage] = {
+            'count': len(seconds),
+            'min': seconds[0],
+            'median': round(statistics.median(seconds), 3),
+            # nearest rank
+            'p95': seconds[math.ceil(0.95 * len(seconds)) - 1],
+            'max': seconds[-1]
+        }
+    return summary
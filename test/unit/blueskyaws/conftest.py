@@ -0,0 +1,204 @@
+import asyncio
+import datetime
+import json
+import types
+
+import pytest
+
+import blueskyaws
+from blueskyaws import launch, pool, ssh
+from blueskyaws.config import Config
+
+
+MINIMAL_CONFIG = {
+    "ssh_key": "id_rsa",
+    "aws": {
+        "iam_instance_profile": {
+            "Arn": "arn:aws:iam::abc123:instance-profile/bluesky-iam-role",
+            "Name": "bluesky-iam-role"
+        },
+        "ec2": {
+            "image_id": "ami-123abc",
+            "instance_type": "t2.nano",
+            "key_pair_name": "sdfsdf",
+            "security_groups": ["ssh"]
+        },
+        "s3": {
+            "bucket_name": "bluesky-aws"
+        }
+    },
+    "bluesky": {
+        "modules": ["fuelbeds", "consumption", "emissions"]
+    }
+}
+
+@pytest.fixture
+def make_config():
+    """Returns a function that creates a Config from the minimal
+    config merged with the given overrides
+    """
+    def f(overrides=None):
+        config = json.loads(json.dumps(MINIMAL_CONFIG))
+        _merge(config, overrides or {})
+        return Config(config)
+    return f
+
+def _merge(config, overrides):
+    for k, v in overrides.items():
+        if isinstance(v, dict) and isinstance(config.get(k), dict):
+            _merge(config[k], v)
+        else:
+            config[k] = v
+
+
+class FakeS3Client(object):
+    """Stands in for S3Client, keeping objects' bodies in memory, by key"""
+
+    def __init__(self):
+        self.objects = {}
+        self.last_modified = {}
+        self.num_puts = 0
+
+    async def put_object(self, Body, Bucket, Key):
+        self.num_puts += 1
+        self.objects[Key] = Body
+        self.last_modified[Key] = datetime.datetime.utcnow()
+
+    async def get_object(self, Bucket, Key):
+        body = self.objects[Key]
+        return {'Body': body.encode() if isinstance(body, str) else body}
+
+    async def list_objects_v2(self, Bucket, Prefix, ContinuationToken=None):
+        return {'Contents': [
+            {'Key': k, 'LastModified': self.last_modified[k]}
+            for k in sorted(self.objects) if k.startswith(Prefix)
+        ]}
+
+@pytest.fixture
+def s3_client():
+    """An empty in-memory stand-in for S3Client"""
+    return FakeS3Client()
+
+
+class FakeInstance(object):
+
+    def __init__(self, n, instance_type):
+        self.id = 'i-{:08x}'.format(n)
+        self.instance_type = instance_type
+        self.classic_address = types.SimpleNamespace(
+            public_ip='10.0.{}.{}'.format(n // 256, n % 256))
+        self.state = {'Name': 'running'}
+
+    def reload(self):
+        pass
+
+
+class FakeEc2(object):
+    """Stands in for ec2 and ssh, recording the instances launched and
+    shut down and the commands executed on them, each of which succeeds
+    unless `respond` returns something else for it
+    """
+
+    def __init__(self):
+        self.launched = []
+        self.shut_down = []
+        self.commands = []
+        self.fail_launches = 0
+        self.num_created = 0
+        # Called with (ip, cmd); returns (stdout, return_code), or None
+        # for the default response
+        self.respond = lambda ip, cmd: None
+
+    def create_instance(self, instance_type='t2.nano'):
+        """Returns an instance that wasn't launched by the manager,
+        e.g. one leased from a pool
+        """
+        self.num_created += 1
+        return FakeInstance(10000 + self.num_created, instance_type)
+
+    def respond_default(self, cmd):
+        first_line = cmd.split('\n')[0]
+        if cmd.startswith('bash /tmp/bluesky-aws-bootstrap'):
+            return json.dumps({"home_dir": "/home/ubuntu",
+                "host_data_dir": "/home/ubuntu/data/bluesky",
+                "image_digest": None,
+                "has_aws_credentials": True, "staged_misses": [],
+                "image_pulled": False})
+        if launch.Ec2InstancesManager.IMAGE_SCRIPT_DELIMITER in first_line:
+            return json.dumps({"installed": [], "install_failed": [],
+                "has_docker": True, "image_digest": None,
+                "pulled": False, "pull_failed": False, "pull_seconds": 0})
+        if blueskyaws.BlueskySingleRunner.ARCHIVE_SCRIPT_DELIMITER in first_line:
+            return json.dumps({"extension": ".tar.gz", "seconds": 0,
+                "uncompressed_bytes": 1000, "compressed_bytes": 250})
+        if '| at now' in cmd:
+            return 'job 1 at now'
+        if cmd.startswith('timeout '):
+            # bsp's exit code
+            return '0'
+        if 'python3 -c' in cmd:
+            # no error in bluesky's output
+            return '""'
+        return ''
+
+    def install(self, monkeypatch):
+        fake_ec2 = self
+
+        class FakeEc2Launcher(object):
+            def __init__(self, image_id, config, **options):
+                self._instance_type = options.get('instance_type')
+
+            async def launch(self, names):
+                await asyncio.sleep(0)
+                if fake_ec2.fail_launches:
+                    fake_ec2.fail_launches -= 1
+                    raise RuntimeError("Failed to launch")
+                instances = []
+                for name in names:
+                    instances.append(FakeInstance(len(fake_ec2.launched),
+                        self._instance_type))
+                    fake_ec2.launched.append(instances[-1])
+                return instances
+
+        class FakeEc2Shutdown(object):
+            async def shutdown(self, instances, terminate=True):
+                for instance in instances:
+                    instance.state = {
+                        'Name': 'terminated' if terminate else 'stopped'}
+                fake_ec2.shut_down.extend(instances)
+
+        class FakeSshClient(object):
+            def __init__(self, ssh_key, ip):
+                self._ip = ip
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                pass
+
+            async def execute(self, cmd, ignore_errors=False):
+                await asyncio.sleep(0)
+                fake_ec2.commands.append((self._ip, cmd))
+                stdout, return_code = (fake_ec2.respond(self._ip, cmd)
+                    or (fake_ec2.respond_default(cmd), 0))
+                if return_code and not ignore_errors:
+                    raise RuntimeError("Failed to execute '{}'".format(cmd))
+                return types.SimpleNamespace(stdout=stdout + '\n',
+                    stderr='', return_code=return_code)
+
+            async def put(self, local_path, remote_path):
+                await asyncio.sleep(0)
+
+        monkeypatch.setattr(launch, 'Ec2Launcher', FakeEc2Launcher)
+        monkeypatch.setattr(launch, 'Ec2Shutdown', FakeEc2Shutdown)
+        monkeypatch.setattr(pool, 'Ec2Shutdown', FakeEc2Shutdown)
+        monkeypatch.setattr(ssh, 'SshClient', FakeSshClient)
+
+
+@pytest.fixture
+def fake_ec2(monkeypatch):
+    """Replaces ec2 launching and shutdown, and ssh, with in-process fakes"""
+    ec2 = FakeEc2()
+    ec2.install(monkeypatch)
+    return ec2
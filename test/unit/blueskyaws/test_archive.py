@@ -0,0 +1,87 @@
+import os
+import subprocess
+import tarfile
+import tempfile
+
+import pytest
+
+from blueskyaws.archive import (
+    get_archive_packages, form_archive_script, parse_archive_result
+)
+
+
+@pytest.fixture
+def archive_config(make_config):
+    """Returns a function that creates a Config with the given archive
+    settings overridden
+    """
+    def f(**archive_settings):
+        return make_config({'archive': archive_settings})
+    return f
+
+def _create_output(exports_dir, files):
+    for name, contents in files.items():
+        pathname = os.path.join(exports_dir, 'run-1', name)
+        os.makedirs(os.path.dirname(pathname), exist_ok=True)
+        with open(pathname, 'wb') as f:
+            f.write(contents)
+
+def _run_script(script):
+    p = subprocess.run(['bash'], input=script.encode(),
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert p.returncode == 0, p.stderr
+    return parse_archive_result(p.stdout.decode())
+
+
+class TestGetArchivePackages(object):
+
+    def test(self, archive_config):
+        assert get_archive_packages(archive_config()) == []
+        assert get_archive_packages(archive_config(codec='none')) == []
+        assert get_archive_packages(archive_config(codec='pigz')) == ['pigz']
+        assert get_archive_packages(archive_config(codec='zstd')) == ['zstd']
+
+
+class TestArchiveScript(object):
+
+    def test_gzip(self, archive_config):
+        with tempfile.TemporaryDirectory() as exports_dir:
+            _create_output(exports_dir, {'output.json': b'{"a": 1}' * 1000})
+            result = _run_script(form_archive_script(
+                archive_config(level=9), 'run-1', exports_dir))
+
+            assert result['extension'] == '.tar.gz'
+            assert result['compressed_bytes'] == os.path.getsize(
+                os.path.join(exports_dir, 'run-1.tar.gz'))
+            assert result['compressed_bytes'] < result['uncompressed_bytes']
+            assert result['seconds'] >= 0
+            with tarfile.open(os.path.join(exports_dir, 'run-1.tar.gz')) as t:
+                assert 'run-1/output.json' in t.getnames()
+
+    def test_none(self, archive_config):
+        with tempfile.TemporaryDirectory() as exports_dir:
+            _create_output(exports_dir, {'output.json': b'{}'})
+            result = _run_script(form_archive_script(
+                archive_config(codec='none'), 'run-1', exports_dir))
+
+            assert result['extension'] == '.tar'
+            with tarfile.open(os.path.join(exports_dir, 'run-1.tar')) as t:
+                assert 'run-1/output.json' in t.getnames()
+
+    def test_store_fraction(self, archive_config):
+        config = archive_config(store_extensions=['.png'], store_fraction=0.5)
+        with tempfile.TemporaryDirectory() as exports_dir:
+            _create_output(exports_dir, {
+                'output.json': b'{}',
+                'images/a.PNG': os.urandom(10000)
+            })
+            result = _run_script(form_archive_script(config, 'run-1', exports_dir))
+            assert result['extension'] == '.tar'
+
+        with tempfile.TemporaryDirectory() as exports_dir:
+            _create_output(exports_dir, {
+                'output.json': b'{"a": 1}' * 10000,
+                'images/a.png': os.urandom(100)
+            })
+            result = _run_script(form_archive_script(config, 'run-1', exports_dir))
+            assert result['extension'] == '.tar.gz'
@@ -0,0 +1,149 @@
+import json
+import os
+import subprocess
+import tempfile
+
+from blueskyaws.bootstrap import (
+    StagedFile, form_bootstrap_script, parse_bootstrap_result
+)
+
+
+FAKE_DOCKER = """#!/usr/bin/env bash
+if [ "$1" == "image" ]; then
+    echo "pnwairfire/bluesky@sha256:abc123"
+fi
+"""
+
+# Fetches from s3 fail unless the url ends in 'exists'
+FAKE_AWS = """#!/usr/bin/env bash
+if [ "$1" == "s3" ] && [[ "$4" == *exists ]]; then
+    echo '{"from": "s3"}' > "$5"
+elif [ "$1" == "s3" ]; then
+    exit 1
+fi
+"""
+
+def _run_script(script, tmp_dir):
+    home_dir = os.path.join(tmp_dir, 'home')
+    bin_dir = os.path.join(tmp_dir, 'bin')
+    os.makedirs(home_dir, exist_ok=True)
+    os.makedirs(bin_dir, exist_ok=True)
+    for name, contents in (('docker', FAKE_DOCKER), ('aws', FAKE_AWS)):
+        path = os.path.join(bin_dir, name)
+        with open(path, 'w') as f:
+            f.write(contents)
+        os.chmod(path, 0o755)
+
+    script_path = os.path.join(tmp_dir, 'bootstrap.sh')
+    with open(script_path, 'w') as f:
+        f.write(script)
+
+    env = dict(os.environ, HOME=home_dir,
+        PATH=bin_dir + ':' + os.environ['PATH'])
+    p = subprocess.run(['bash', script_path], env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return home_dir, script_path, p
+
+
+class TestBootstrapScript(object):
+
+    def test_writes_files_and_reports(self):
+        files = {
+            'config.json': {"config": {"foo": "'\"bar\n$HOME"}},
+            'input.json': {"fires": [{"id": "abc"}]}
+        }
+        script = form_bootstrap_script('run-1', 'pnwairfire/bluesky:v4.2.9',
+            files)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            home_dir, script_path, p = _run_script(script, tmp_dir)
+            assert p.returncode == 0
+            assert p.stderr == b''
+
+            result = parse_bootstrap_result(p.stdout.decode())
+            assert result == {
+                "home_dir": home_dir,
+                "host_data_dir": os.path.join(home_dir, 'data/bluesky/run-1'),
+                "image_pulled": False,
+                "image_digest": "pnwairfire/bluesky@sha256:abc123",
+                "has_aws_credentials": False,
+                "staged_misses": []
+            }
+
+            for file_name, data in files.items():
+                with open(os.path.join(result['host_data_dir'], file_name)) as f:
+                    assert json.loads(f.read()) == data
+
+            # the script deletes itself
+            assert not os.path.exists(script_path)
+
+    def test_clears_old_output(self):
+        script = form_bootstrap_script('run-1', 'pnwairfire/bluesky:v4.2.9', {})
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            old_file = os.path.join(tmp_dir, 'home/data/bluesky/run-1/output.json')
+            os.makedirs(os.path.dirname(old_file))
+            with open(old_file, 'w') as f:
+                f.write('{}')
+            os.makedirs(os.path.join(tmp_dir, 'home/.aws'))
+            home_dir, script_path, p = _run_script(script, tmp_dir)
+            assert p.returncode == 0
+
+            result = parse_bootstrap_result(p.stdout.decode())
+            assert result['has_aws_credentials'] == True
+            assert os.listdir(result['host_data_dir']) == []
+
+    def test_missing_dependencies(self):
+        # dependencies are installed when instances are initialized
+        script = form_bootstrap_script('run-1', 'pnwairfire/bluesky:v4.2.9',
+            {}, packages=['bash', 'bluesky-aws-missing'])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            home_dir, script_path, p = _run_script(script, tmp_dir)
+            assert p.returncode != 0
+            assert p.stderr == b'Missing dependencies: bluesky-aws-missing\n'
+
+    def test_staged_files(self):
+        config = {"config": {"foo": "bar"}}
+        staged_file = StagedFile(config)
+        staged_files = {'config.json': staged_file}
+
+        def _run(tmp_dir, **kwargs):
+            script = form_bootstrap_script('run-1', 'pnwairfire/bluesky:v4.2.9',
+                {}, staged_files=staged_files, **kwargs)
+            home_dir, script_path, p = _run_script(script, tmp_dir)
+            assert p.returncode == 0, p.stderr
+            return home_dir, parse_bootstrap_result(p.stdout.decode())
+
+        def _read_config(result):
+            with open(os.path.join(result['host_data_dir'], 'config.json')) as f:
+                return json.loads(f.read())
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # not cached and not embedded
+            home_dir, result = _run(tmp_dir)
+            assert result['staged_misses'] == ['config.json']
+            assert os.listdir(result['host_data_dir']) == []
+
+            # embedded, and then cached
+            home_dir, result = _run(tmp_dir, embed=True)
+            assert result['staged_misses'] == []
+            assert _read_config(result) == config
+            cached = os.path.join(home_dir, 'data/bluesky/staged', staged_file.hash)
+            assert os.path.exists(cached)
+
+            home_dir, result = _run(tmp_dir)
+            assert result['staged_misses'] == []
+            assert _read_config(result) == config
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache_dir = os.path.join(tmp_dir, 'efs/staged')
+
+            # fetching from s3 fails
+            staged_file.s3_url = 's3://bucket/staged/missing'
+            home_dir, result = _run(tmp_dir, cache_dir=cache_dir)
+            assert result['staged_misses'] == ['config.json']
+            assert not os.path.exists(cache_dir) or os.listdir(cache_dir) == []
+
+            staged_file.s3_url = 's3://bucket/staged/exists'
+            home_dir, result = _run(tmp_dir, cache_dir=cache_dir)
+            assert result['staged_misses'] == []
+            assert _read_config(result) == {"from": "s3"}
+            assert os.listdir(cache_dir) == [staged_file.hash]
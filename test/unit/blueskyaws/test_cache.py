@@ -0,0 +1,111 @@
+import asyncio
+import datetime
+import json
+import time
+
+import pytest
+
+from blueskyaws.bootstrap import StagedFile
+from blueskyaws.cache import ResultCache
+
+
+@pytest.fixture
+def cache_config(make_config):
+    """Returns a function that creates a Config with caching enabled and
+    the given cache settings overridden
+    """
+    def f(**cache_settings):
+        return make_config({
+            'bluesky': {'modules': ['fuelbeds', 'consumption']},
+            'cache': dict({'enabled': True}, **cache_settings)
+        })
+    return f
+
+BLUESKY_CONFIG = StagedFile({"config": {"emissions": {"model": "feps"}}})
+TODAY = datetime.datetime(2020, 2, 1)
+INPUT_DATA = {"fires": [{"id": "a", "activity": []}]}
+
+def _cache(s3_client, config, bluesky_config=BLUESKY_CONFIG, today=TODAY):
+    return ResultCache(config, s3_client, bluesky_config, today)
+
+def _store_and_lookup(s3_client, cache, lookup_cache=None, created=None):
+    async def f():
+        await cache.store(INPUT_DATA, 'req-1', 'fire-a', 'output/req-1/fire-a.tar.gz',
+            'log/req-1/fire-a.log')
+        if created:
+            for key, body in s3_client.objects.items():
+                s3_client.objects[key] = json.dumps(dict(json.loads(body),
+                    created=created))
+        return await (lookup_cache or cache).lookup(INPUT_DATA)
+
+    return asyncio.run(f())
+
+
+class TestResultCacheKey(object):
+
+    def test_same_inputs(self, s3_client, cache_config):
+        config = cache_config()
+        assert (_cache(s3_client, config).get_key(INPUT_DATA)
+            == _cache(s3_client, config).get_key(
+                json.loads(json.dumps(INPUT_DATA))))
+
+    def test_changed_inputs(self, s3_client, cache_config, make_config):
+        key = _cache(s3_client, cache_config()).get_key(INPUT_DATA)
+        assert key != _cache(s3_client, cache_config()).get_key(
+            {"fires": [{"id": "b", "activity": []}]})
+        assert key != _cache(s3_client, cache_config(),
+            bluesky_config=StagedFile({"config": {}})).get_key(INPUT_DATA)
+        assert key != _cache(s3_client, cache_config(),
+            today=datetime.datetime(2020, 2, 2)).get_key(INPUT_DATA)
+        config = make_config({'bluesky': {'modules': ['fuelbeds']}})
+        assert key != _cache(s3_client, config).get_key(INPUT_DATA)
+        config = make_config({
+            'bluesky_version': 'v4.2.10',
+            'bluesky': {'modules': ['fuelbeds', 'consumption']}
+        })
+        assert key != _cache(s3_client, config).get_key(INPUT_DATA)
+
+
+class TestResultCache(object):
+
+    def test_hit(self, s3_client, cache_config):
+        cache = _cache(s3_client, cache_config())
+        entry = _store_and_lookup(s3_client, cache)
+        assert entry['request_id'] == 'req-1'
+        assert entry['run_id'] == 'fire-a'
+        assert entry['output_key'] == 'output/req-1/fire-a.tar.gz'
+        assert entry['log_key'] == 'log/req-1/fire-a.log'
+        assert list(s3_client.objects) == [
+            'cache/' + cache.get_key(INPUT_DATA) + '.json']
+
+    def test_miss(self, s3_client, cache_config):
+        assert asyncio.run(
+            _cache(s3_client, cache_config()).lookup(INPUT_DATA)) is None
+
+    def test_disabled(self, s3_client, cache_config):
+        cache = _cache(s3_client, cache_config(enabled=False))
+        assert _store_and_lookup(s3_client, cache) is None
+        assert s3_client.objects == {}
+
+    def test_expired(self, s3_client, cache_config):
+        assert _store_and_lookup(s3_client, _cache(s3_client, cache_config()),
+            created=time.time() - 25 * 3600) is None
+
+    def test_invalidated(self, s3_client, cache_config):
+        cache = _cache(s3_client,
+            cache_config(invalidate_before='2020-02-01T12:00:00'))
+        # 2020-02-01T11:00:00Z
+        assert _store_and_lookup(s3_client, cache, created=1580554800) is None
+
+        # 2020-02-01T13:00:00Z
+        s3_client.objects.clear()
+        cache = _cache(s3_client, cache_config(ttl_hours=10**6,
+            invalidate_before='2020-02-01T12:00:00'))
+        assert _store_and_lookup(s3_client, cache, created=1580562000)
+
+    def test_refresh(self, s3_client, cache_config):
+        cache = _cache(s3_client, cache_config(refresh=True))
+        assert _store_and_lookup(s3_client, cache) is None
+        # entries are still recorded
+        assert _store_and_lookup(s3_client, cache,
+            lookup_cache=_cache(s3_client, cache_config()))
@@ -175,6 +175,7 @@ class TestConfig(object):
             }
         })
         expected = {
+            "single_run": False,
             "request_id_format": None,
             "run_id_format": None,
             "bluesky_version": "v4.2.9",
@@ -183,8 +184,44 @@ class TestConfig(object):
                     'max_attempts': 3,
                     'strategy': 'fixed',
                     'time': 900
+                },
+                'streaming': False
+            },
+            "met": {
+                "domains": None,
+                "default_num_hours": 24,
+                "index_ttl_seconds": 60,
+                "wait": {
+                    "strategy": "backoff",
+                    "time": 300,
+                    "max_attempts": 6
                 }
             },
+            "scheduling": {
+                "policy": "fifo"
+            },
+            "cache": {
+                "enabled": False,
+                "ttl_hours": 24,
+                "invalidate_before": None,
+                "refresh": False
+            },
+            "delta": {
+                "enabled": False,
+                "previous_request_id": None
+            },
+            "archive": {
+                "codec": "gzip",
+                "level": None,
+                "threads": None,
+                "store_extensions": [],
+                "store_fraction": 0.9
+            },
+            "status": {
+                "flush_interval_seconds": None,
+                "sharded": False,
+                "write_combined": True
+            },
             "cleanup_output": True,
             "ssh_key": "id_rsa",
             "aws": {
@@ -197,6 +234,7 @@ class TestConfig(object):
                     "image_name_prefix_format": "bluesky-aws-{request_id}",
                     "image_id": "ami-123abc",
                     "instance_type":"t2.nano",
+                    "instance_type_ladder": None,
                     "key_pair_name": "sdfsdf",
                     "security_groups": ["ssh"],
                     "efs_volumes": None,
@@ -204,11 +242,31 @@ class TestConfig(object):
                         "volume_size": 8,
                         "device_name": "/dev/sda1"
                     },
-                    "minutes_until_auto_shutdown": None
+                    "minutes_until_auto_shutdown": None,
+                    "instance_initiated_shutdown_behavior": "terminate",
+                    "slots_per_instance": 1,
+                    "max_launch_attempts": 3,
+                    "spot": {
+                        "enabled": False,
+                        "max_price": None,
+                        "on_demand_fallback": True,
+                        "seconds_between_interruption_checks": 5,
+                        "metadata_url": "http://169.254.169.254/latest"
+                    },
+                    "pool": {
+                        "name": None,
+                        "size": 0,
+                        "idle_timeout_minutes": 60,
+                        "max_lease_minutes": 720
+                    }
                 },
                 "s3": {
                     "bucket_name": "bluesky-aws",
-                    "output_path": "output"
+                    "output_path": "output",
+                    "stream_output": False,
+                    "backend": "boto3",
+                    "max_concurrency": 32,
+                    "max_attempts": 5
                 }
             },
             "bluesky": {
@@ -220,7 +278,18 @@ class TestConfig(object):
                 ],
                 "config_file": None,
                 "config": {},
-                "seconds_between_completion_checks": 30
+                "completion_check_strategy": "wait",
+                "seconds_per_completion_wait": 300,
+                "seconds_between_completion_checks": 30,
+                "docker": {
+                    "cpus": None,
+                    "memory": None,
+                    "image_digest": None
+                },
+                "staged_config": {
+                    "cache_dir": None,
+                    "fetch_from_s3": False
+                }
             },
             "notifications": {
                 "email": {
@@ -243,11 +312,19 @@ class TestConfig(object):
 
         assert c('aws', 's3') == {
             "bucket_name": "bluesky-aws",
-            "output_path": "output"
+            "output_path": "output",
+            "stream_output": False,
+            "backend": "boto3",
+            "max_concurrency": 32,
+            "max_attempts": 5
         }
         assert c.get('aws', 's3') == {
             "bucket_name": "bluesky-aws",
-            "output_path": "output"
+            "output_path": "output",
+            "stream_output": False,
+            "backend": "boto3",
+            "max_concurrency": 32,
+            "max_attempts": 5
         }
 
         assert c('bluesky', 'config_file') == None
@@ -287,6 +364,7 @@ class TestConfig(object):
             }
         })
         expected = {
+            "single_run": False,
             "request_id_format": None,
             "run_id_format": None,
             "bluesky_version": "v4.2.9",
@@ -295,8 +373,44 @@ class TestConfig(object):
                     'max_attempts': 3,
                     'strategy': 'fixed',
                     'time': 900
+                },
+                'streaming': False
+            },
+            "met": {
+                "domains": None,
+                "default_num_hours": 24,
+                "index_ttl_seconds": 60,
+                "wait": {
+                    "strategy": "backoff",
+                    "time": 300,
+                    "max_attempts": 6
                 }
             },
+            "scheduling": {
+                "policy": "fifo"
+            },
+            "cache": {
+                "enabled": False,
+                "ttl_hours": 24,
+                "invalidate_before": None,
+                "refresh": False
+            },
+            "delta": {
+                "enabled": False,
+                "previous_request_id": None
+            },
+            "archive": {
+                "codec": "gzip",
+                "level": None,
+                "threads": None,
+                "store_extensions": [],
+                "store_fraction": 0.9
+            },
+            "status": {
+                "flush_interval_seconds": None,
+                "sharded": False,
+                "write_combined": True
+            },
             "cleanup_output": True,
             "ssh_key": "id_rsa",
             "aws": {
@@ -309,6 +423,7 @@ class TestConfig(object):
                     "image_name_prefix_format": "bluesky-aws-{request_id}",
                     "image_id": "ami-123abc",
                     "instance_type":"t2.nano",
+                    "instance_type_ladder": None,
                     "key_pair_name": "sdfsdf",
                     "security_groups": ["ssh"],
                     "efs_volumes": None,
@@ -316,11 +431,31 @@ class TestConfig(object):
                         "volume_size": 8,
                         "device_name": "/dev/sda1"
                     },
-                    "minutes_until_auto_shutdown": None
+                    "minutes_until_auto_shutdown": None,
+                    "instance_initiated_shutdown_behavior": "terminate",
+                    "slots_per_instance": 1,
+                    "max_launch_attempts": 3,
+                    "spot": {
+                        "enabled": False,
+                        "max_price": None,
+                        "on_demand_fallback": True,
+                        "seconds_between_interruption_checks": 5,
+                        "metadata_url": "http://169.254.169.254/latest"
+                    },
+                    "pool": {
+                        "name": None,
+                        "size": 0,
+                        "idle_timeout_minutes": 60,
+                        "max_lease_minutes": 720
+                    }
                 },
                 "s3": {
                     "bucket_name": "bluesky-aws",
-                    "output_path": "output"
+                    "output_path": "output",
+                    "stream_output": False,
+                    "backend": "boto3",
+                    "max_concurrency": 32,
+                    "max_attempts": 5
                 }
             },
             "bluesky": {
@@ -332,7 +467,18 @@ class TestConfig(object):
                 ],
                 "config_file": "sdsdf.json",
                 "config": {},
-                "seconds_between_completion_checks": 30
+                "completion_check_strategy": "wait",
+                "seconds_per_completion_wait": 300,
+                "seconds_between_completion_checks": 30,
+                "docker": {
+                    "cpus": None,
+                    "memory": None,
+                    "image_digest": None
+                },
+                "staged_config": {
+                    "cache_dir": None,
+                    "fetch_from_s3": False
+                }
             },
             "notifications": {
                 "email": {
@@ -355,11 +501,19 @@ class TestConfig(object):
 
         assert c('aws', 's3') == {
             "bucket_name": "bluesky-aws",
-            "output_path": "output"
+            "output_path": "output",
+            "stream_output": False,
+            "backend": "boto3",
+            "max_concurrency": 32,
+            "max_attempts": 5
         }
         assert c.get('aws', 's3') == {
             "bucket_name": "bluesky-aws",
-            "output_path": "output"
+            "output_path": "output",
+            "stream_output": False,
+            "backend": "boto3",
+            "max_concurrency": 32,
+            "max_attempts": 5
         }
 
         assert c('bluesky', 'config_file') == "sdsdf.json"
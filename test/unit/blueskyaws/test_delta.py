@@ -0,0 +1,122 @@
+import asyncio
+import datetime
+import json
+
+from blueskyaws.delta import get_run_settings, hash_fire, PreviousRequest
+
+
+TODAY = datetime.datetime(2020, 2, 1)
+CONFIG = {"bluesky_version": "v4.2.0", "bluesky": {"modules": ["fuelbeds"]}}
+BLUESKY_CONFIG = {"config": {"emissions": {"model": "prichard-oneill"}}}
+SETTINGS = get_run_settings(CONFIG, BLUESKY_CONFIG)
+FIRE_A = {"id": "a", "activity": [{"active_areas": []}]}
+FIRE_B = {"id": "b", "activity": []}
+
+def _objects(**extra):
+    objects = {
+        'request-index/20200201/req-1': datetime.datetime(2020, 2, 1, 1),
+        'request-index/20200201/req-2': datetime.datetime(2020, 2, 1, 2),
+        'request-index/20200201/req-3': datetime.datetime(2020, 2, 1, 3),
+        'request-index/20200202/req-4': datetime.datetime(2020, 2, 2, 1),
+        'requests/req-2.json': {"fires": [FIRE_A, FIRE_B]},
+        'config/req-2-config-bluesky-aws.json': CONFIG,
+        'config/req-2-config-bluesky.json': BLUESKY_CONFIG,
+        'status/req-2-status.json': {"runs": {
+            "fire-a": {"status": "success", "output_url": "s3://b/a.tar.gz"},
+            "fire-b": {"status": "failure"}
+        }}
+    }
+    objects.update(extra)
+    return objects
+
+def _load(s3_client, objects, request_id='req-3', previous_request_id=None,
+        settings=SETTINGS):
+    """Loads the previous request from s3_client, after putting the given
+    objects in it; request index entries are given by last modified time,
+    and other objects by their JSON content
+    """
+    for key, value in objects.items():
+        if isinstance(value, datetime.datetime):
+            s3_client.objects[key] = ''
+            s3_client.last_modified[key] = value
+        else:
+            s3_client.objects[key] = json.dumps(value)
+            s3_client.last_modified[key] = TODAY
+    return asyncio.run(PreviousRequest.load(s3_client, 'bucket', TODAY,
+        request_id, settings, previous_request_id=previous_request_id))
+
+
+class TestHashFire(object):
+
+    def test_key_order(self):
+        assert hash_fire({"id": "a", "type": "wf"}) == hash_fire(
+            {"type": "wf", "id": "a"})
+        assert hash_fire(FIRE_A) != hash_fire(FIRE_B)
+
+
+class TestPreviousRequest(object):
+
+    def test_most_recent_other_request(self, s3_client):
+        # the request with the latest index entry, other than this one
+        assert _load(s3_client, {}) is None
+        assert _load(s3_client, _objects()).request_id == 'req-2'
+        assert _load(s3_client, _objects(),
+            previous_request_id='req-2').request_id == 'req-2'
+
+    def test_get_unchanged_run(self, s3_client):
+        previous_request = _load(s3_client, _objects())
+        run_status = previous_request.get_unchanged_run(
+            json.loads(json.dumps(FIRE_A)))
+        assert run_status == {"status": "success",
+            "output_url": "s3://b/a.tar.gz", "run_id": "fire-a"}
+        # modified
+        assert previous_request.get_unchanged_run(
+            dict(FIRE_A, activity=[])) is None
+        # unsuccessful
+        assert previous_request.get_unchanged_run(FIRE_B) is None
+        # added
+        assert previous_request.get_unchanged_run({"id": "c"}) is None
+
+    def test_fire_id_in_run_status(self, s3_client):
+        objects = _objects(**{'status/req-2-status.json': {"runs": {
+            "run-1": {"status": "success", "fire_id": "a"}
+        }}})
+        assert _load(s3_client, objects).get_unchanged_run(
+            FIRE_A)['run_id'] == 'run-1'
+
+    def test_sharded_status(self, s3_client):
+        objects = _objects()
+        del objects['status/req-2-status.json']
+        objects.update({
+            'status/req-2/manifest.json': {"counts": {}},
+            'status/req-2/fire-a.json': {"status": "success"},
+            'status/req-2/instances/10.0.0.1.json': {"status": "success"},
+        })
+        previous_request = _load(s3_client, objects)
+        assert previous_request.get_unchanged_run(FIRE_A)['run_id'] == 'fire-a'
+        # instance statuses aren't taken for runs
+        assert set(previous_request._runs) == {'a'}
+
+    def test_previous_request_for_other_day(self, s3_client):
+        objects = _objects(**{
+            'requests/req-4.json': {"fires": [FIRE_A]},
+            'config/req-4-config-bluesky-aws.json': CONFIG,
+            'config/req-4-config-bluesky.json': BLUESKY_CONFIG
+        })
+        assert _load(s3_client, objects, previous_request_id='req-4') is None
+
+    def test_changed_settings(self, s3_client):
+        # bluesky config, version, or modules
+        for config, bluesky_config in (
+                (CONFIG, {"config": {}}),
+                (dict(CONFIG, bluesky_version="v4.3.0"), BLUESKY_CONFIG),
+                ({"bluesky_version": "v4.2.0",
+                    "bluesky": {"modules": ["fuelbeds", "consumption"]}},
+                    BLUESKY_CONFIG)):
+            assert _load(s3_client, _objects(), settings=get_run_settings(
+                config, bluesky_config)) is None
+
+    def test_unrecorded_config(self, s3_client):
+        objects = _objects()
+        del objects['config/req-2-config-bluesky.json']
+        assert _load(s3_client, objects) is None
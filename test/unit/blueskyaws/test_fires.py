@@ -0,0 +1,117 @@
+from blueskyaws.fires import get_fire_info, FireMetadataIndex
+
+
+POINTS_FIRE = {
+    "id": "points",
+    "activity": [
+        {
+            "active_areas": [
+                {
+                    "specified_points": [
+                        {"lat": 45.0, "lng": -120.0, "area": 100},
+                        {"lat": 47.0, "lng": -122.0, "area": 50}
+                    ]
+                }
+            ]
+        }
+    ]
+}
+
+PERIMETER_FIRE = {
+    "id": "perimeter",
+    "activity": [
+        {
+            "active_areas": [
+                {
+                    "perimeter": {
+                        "area": 200,
+                        "polygon": [
+                            [-121.0, 46.0], [-120.0, 46.0],
+                            [-120.0, 47.0], [-121.0, 47.0]
+                        ]
+                    }
+                }
+            ]
+        }
+    ]
+}
+
+
+class TestGetFireInfo(object):
+
+    def test_points(self):
+        assert get_fire_info(POINTS_FIRE) == {
+            'area': 150, 'lat': 45.0, 'lng': -120.0,
+            'num_points': 2, 'num_perimeters': 0
+        }
+
+    def test_unparseable(self):
+        assert get_fire_info({"id": "a"}) == {
+            'area': None, 'lat': None, 'lng': None,
+            'num_points': 0, 'num_perimeters': 0
+        }
+
+
+class TestFireMetadataIndex(object):
+
+    def test_build(self):
+        index = FireMetadataIndex.build(
+            [POINTS_FIRE, PERIMETER_FIRE, {"id": "bad"}])
+        assert len(index) == 3
+        assert index.ids == ['points', 'perimeter', 'bad']
+        assert index.num_errors == 1
+        assert index.errors[:2] == [None, None]
+        assert list(index.column('area'))[:2] == [150, 200]
+        assert list(index.column('num_perimeters')) == [0, 1, 0]
+
+    def test_row(self):
+        index = FireMetadataIndex.build([POINTS_FIRE, PERIMETER_FIRE])
+        assert index.row(0) == {
+            'id': 'points', 'error': None, 'area': 150,
+            'lat': 45.0, 'lng': -120.0,
+            'centroid_lat': 46.0, 'centroid_lng': -121.0,
+            'min_lat': 45.0, 'min_lng': -122.0,
+            'max_lat': 47.0, 'max_lng': -120.0,
+            'start': None, 'end': None,
+            'num_points': 2, 'num_perimeters': 0
+        }
+        assert index.row(1)['centroid_lat'] == 46.5
+        assert index.row(1)['centroid_lng'] == -120.5
+
+    def test_unparseable_row(self):
+        index = FireMetadataIndex.build([{"id": "bad"}])
+        row = index.row(0)
+        assert row['error']
+        assert row['area'] is None and row['centroid_lat'] is None
+
+    def test_times(self):
+        fire = {
+            "id": "timed",
+            "activity": [
+                {
+                    "active_areas": [
+                        {
+                            "start": "2019-06-11T00:00:00",
+                            "end": "2019-06-12T00:00:00",
+                            "utc_offset": "-07:00",
+                            "specified_points": [
+                                {"lat": 45.0, "lng": -120.0, "area": 10}
+                            ]
+                        },
+                        {
+                            "start": "2019-06-12T00:00:00",
+                            "end": "2019-06-13T00:00:00",
+                            "utc_offset": "-07:00",
+                            "specified_points": [
+                                {"lat": 45.0, "lng": -120.0, "area": 10}
+                            ]
+                        }
+                    ]
+                }
+            ]
+        }
+        index = FireMetadataIndex.build([fire, POINTS_FIRE])
+        # 2019-06-11T07:00:00Z and 2019-06-13T07:00:00Z
+        assert index.row(0)['start'] == 1560236400
+        assert index.row(0)['end'] == 1560409200
+        assert index.row(1)['start'] is None
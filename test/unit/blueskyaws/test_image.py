@@ -0,0 +1,147 @@
+import os
+import subprocess
+import tempfile
+
+from blueskyaws.image import form_image_script, parse_image_result
+
+
+# The image is "on the instance" if $IMAGE_FILE exists, in which case
+# it contains the image's repo digest.  Pulls write $REMOTE_DIGEST to it,
+# unless $REMOTE_DIGEST is empty, in which case they fail
+FAKE_DOCKER = """#!/usr/bin/env bash
+if [ "$1" == "image" ]; then
+    [ -e "$IMAGE_FILE" ] || exit 1
+    cat "$IMAGE_FILE"
+elif [ "$1" == "pull" ]; then
+    [ -n "$REMOTE_DIGEST" ] || exit 1
+    echo "pnwairfire/bluesky@$REMOTE_DIGEST" > "$IMAGE_FILE"
+    echo "$2" >> "$PULLS_FILE"
+fi
+"""
+
+# Records each command in $SUDO_FILE, failing to install the packages
+# in $UNAVAILABLE
+FAKE_SUDO = """#!/usr/bin/env bash
+echo "$@" >> "$SUDO_FILE"
+for PACKAGE in $UNAVAILABLE; do
+    [ "$1 $2 $3 $4" != "apt -y install $PACKAGE" ] || exit 1
+done
+"""
+
+IMAGE = 'pnwairfire/bluesky:v4.2.9'
+
+def _write_executable(bin_dir, name, contents):
+    with open(os.path.join(bin_dir, name), 'w') as f:
+        f.write(contents)
+    os.chmod(os.path.join(bin_dir, name), 0o755)
+
+def _run_script(tmp_dir, script, local_digest=None, remote_digest='sha256:new',
+        has_docker=True, has_sudo=False, unavailable=()):
+    bin_dir = os.path.join(tmp_dir, 'bin')
+    os.makedirs(bin_dir, exist_ok=True)
+    _write_executable(bin_dir, 'aws', '')
+    if has_docker:
+        _write_executable(bin_dir, 'docker', FAKE_DOCKER)
+    if has_sudo:
+        _write_executable(bin_dir, 'sudo', FAKE_SUDO)
+    # PATH is limited to bin_dir, so that docker can be left out; it
+    # includes everything else the script uses
+    for cmd in ('bash', 'env', 'python3', 'date', 'cat', 'which', 'mkdir'):
+        path = subprocess.run(['which', cmd],
+            stdout=subprocess.PIPE).stdout.decode().strip()
+        if not os.path.exists(os.path.join(bin_dir, cmd)):
+            os.symlink(path, os.path.join(bin_dir, cmd))
+
+    image_file = os.path.join(tmp_dir, 'image')
+    if local_digest:
+        with open(image_file, 'w') as f:
+            f.write("pnwairfire/bluesky@" + local_digest)
+
+    pulls_file = os.path.join(tmp_dir, 'pulls')
+    env = dict(PATH=bin_dir, HOME=os.path.join(tmp_dir, 'home'),
+        IMAGE_FILE=image_file, PULLS_FILE=pulls_file,
+        REMOTE_DIGEST=remote_digest or '',
+        SUDO_FILE=os.path.join(tmp_dir, 'sudo'),
+        UNAVAILABLE=' '.join(unavailable))
+    p = subprocess.run(['/bin/bash'], input=script.encode(), env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert p.returncode == 0, p.stderr
+    pulls = open(pulls_file).read().split() if os.path.exists(pulls_file) else []
+    return parse_image_result(p.stdout.decode()), pulls
+
+
+class TestImageScript(object):
+
+    def test_no_expected_digest(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            result, pulls = _run_script(tmp_dir, form_image_script(IMAGE),
+                local_digest='sha256:new')
+            assert pulls == [IMAGE]
+            assert result['has_docker'] == True
+            assert result['pulled'] == True
+            assert result['pull_failed'] == False
+            assert result['pull_seconds'] >= 0
+            assert result['image_digest'] == 'pnwairfire/bluesky@sha256:new'
+
+    def test_expected_digest_matches(self):
+        for expected in ('sha256:abc', 'pnwairfire/bluesky@sha256:abc'):
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                result, pulls = _run_script(tmp_dir,
+                    form_image_script(IMAGE, expected),
+                    local_digest='sha256:abc')
+                assert pulls == []
+                assert result == {
+                    'installed': [],
+                    'install_failed': [],
+                    'has_docker': True,
+                    'image_digest': 'pnwairfire/bluesky@sha256:abc',
+                    'pulled': False,
+                    'pull_failed': False,
+                    'pull_seconds': None
+                }
+
+    def test_expected_digest_differs_or_missing(self):
+        for local_digest in ('sha256:old', None):
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                result, pulls = _run_script(tmp_dir,
+                    form_image_script(IMAGE, 'sha256:new'),
+                    local_digest=local_digest)
+                assert pulls == [IMAGE]
+                assert result['pulled'] == True
+                assert result['image_digest'] == 'pnwairfire/bluesky@sha256:new'
+
+    def test_pull_fails(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            result, pulls = _run_script(tmp_dir, form_image_script(IMAGE),
+                remote_digest=None)
+            assert result['pulled'] == False
+            assert result['pull_failed'] == True
+            assert result['image_digest'] is None
+
+    def test_no_docker(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            result, pulls = _run_script(tmp_dir, form_image_script(IMAGE),
+                has_docker=False)
+            assert pulls == []
+            assert result == {
+                # sudo isn't available
+                'installed': [],
+                'install_failed': ['docker'],
+                'has_docker': False,
+                'image_digest': None,
+                'pulled': False,
+                'pull_failed': False,
+                'pull_seconds': None
+            }
+
+    def test_installs_packages(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            result, pulls = _run_script(tmp_dir,
+                form_image_script(IMAGE, packages=['pigz', 'zstd', 'cat']),
+                has_sudo=True, unavailable=['zstd'])
+            assert result['installed'] == ['pigz']
+            assert result['install_failed'] == ['zstd']
+            assert result['pulled'] == True
+            with open(os.path.join(tmp_dir, 'sudo')) as f:
+                assert f.read().split('\n')[:-1] == [
+                    'apt -y install pigz', 'apt -y install zstd']
@@ -0,0 +1,79 @@
+import asyncio
+import json
+import os
+import tempfile
+
+import pytest
+
+from blueskyaws.input import InputLoader
+
+
+@pytest.fixture
+def load(make_config):
+    """Returns a function that loads the given input data, streaming or
+    not, and returns the input loader and the fires it iterates
+    """
+    def f(input_data, streaming):
+        config = make_config({
+            'input': {
+                'streaming': streaming,
+                'wait': {'strategy': 'fixed', 'time': 0, 'max_attempts': 1}
+            }
+        })
+        return _load(config, input_data)
+    return f
+
+INPUT_DATA = {
+    "run_config": {"emissions": {"model": "prichard-oneill"}},
+    "fires": [
+        {"id": "a", "activity": [{"active_areas": [{"specified_points": [
+            {"lat": 45.1, "lng": -120.5, "area": 100.5}]}]}]},
+        {"id": "b", "activity": [{"active_areas": [{"specified_points": [
+            {"lat": 46, "lng": -121, "area": 50}]}]}]}
+    ]
+}
+
+def _load(config, input_data):
+    async def f():
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_file_name = os.path.join(tmp_dir, 'input.json')
+            with open(input_file_name, 'w') as fp:
+                fp.write(json.dumps(input_data))
+
+            async with InputLoader(config, input_file_name, None) as input_loader:
+                fires = [f async for f in input_loader.iter_fires()]
+                return input_loader, fires
+
+    return asyncio.run(f())
+
+
+class TestInputLoader(object):
+
+    def test_not_streaming(self, load):
+        input_loader, fires = load(INPUT_DATA, False)
+        assert input_loader.streaming == False
+        assert input_loader.num_fires == 2
+        assert input_loader.fires == INPUT_DATA['fires']
+        assert input_loader.bluesky_config == INPUT_DATA['run_config']
+        assert fires == INPUT_DATA['fires']
+        assert input_loader.fire_index.ids == ['a', 'b']
+
+    def test_streaming(self, load):
+        input_loader, fires = load(INPUT_DATA, True)
+        assert input_loader.streaming == True
+        assert input_loader.num_fires == 2
+        assert input_loader.fires is None
+        assert input_loader.bluesky_config == INPUT_DATA['run_config']
+        assert fires == INPUT_DATA['fires']
+        # floats aren't parsed as Decimals, which json can't serialize
+        json.dumps(fires)
+        assert input_loader.fire_index.ids == ['a', 'b']
+        row = input_loader.fire_index.row(0)
+        assert (row['area'], row['lat'], row['lng']) == (100.5, 45.1, -120.5)
+
+    def test_streaming_bluesky_config_and_no_fires(self, load):
+        input_data = {"bluesky_config": {"foo": [1, {"bar": None}]}, "fires": []}
+        input_loader, fires = load(input_data, True)
+        assert input_loader.num_fires == 0
+        assert input_loader.bluesky_config == input_data['bluesky_config']
+        assert fires == []
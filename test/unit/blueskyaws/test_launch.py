@@ -0,0 +1,196 @@
+import asyncio
+import datetime
+
+from blueskyaws import pool
+from blueskyaws.launch import Ec2InstancesManager
+from blueskyaws.pool import InstancePool
+
+
+class FakePool(object):
+    def __init__(self):
+        self.released = []
+
+    async def release(self, instances):
+        self.released.extend(instances)
+
+
+class TestEc2InstancesManager(object):
+
+    def test_exit_without_consuming(self, fake_ec2, make_config):
+        async def f():
+            async with Ec2InstancesManager(make_config(), 2, 'req'):
+                pass
+
+        asyncio.run(f())
+        # Instances are launched even if none are waited for, and then
+        # terminated
+        assert len(fake_ec2.launched) == 2
+        assert fake_ec2.shut_down == fake_ec2.launched
+
+    def test_ready_instances(self, fake_ec2, make_config):
+        async def f():
+            async with Ec2InstancesManager(make_config(), 3, 'req') as manager:
+                return [i async for i in manager.ready_instances()]
+
+        assert len(asyncio.run(f())) == 3
+        assert len(fake_ec2.shut_down) == 3
+
+    def test_retries_failed_launch(self, fake_ec2, make_config):
+        fake_ec2.fail_launches = 1
+
+        async def f():
+            async with Ec2InstancesManager(make_config(), 2, 'req') as manager:
+                return [i async for i in manager.ready_instances()]
+
+        assert len(asyncio.run(f())) == 2
+
+    def test_stop_launching(self, fake_ec2, make_config):
+        fake_ec2.fail_launches = 1
+
+        async def f():
+            async with Ec2InstancesManager(make_config(), 2, 'req') as manager:
+                # first attempts aren't affected, but the failed one
+                # isn't retried
+                manager.stop_launching()
+                return [i async for i in manager.ready_instances()]
+
+        assert len(asyncio.run(f())) == 1
+
+    def test_failed_instances_not_released(self, fake_ec2, make_config):
+        instance_pool = FakePool()
+
+        async def f():
+            async with Ec2InstancesManager(make_config(), 2, 'req',
+                    pool=instance_pool, pooled=[pooled]) as manager:
+                instances = [i async for i in manager.ready_instances()]
+                for i in instances:
+                    await manager.terminate_instance(i, failed=(i is not pooled))
+
+        pooled = fake_ec2.create_instance()
+        asyncio.run(f())
+        # the healthy pooled instance is released, and the failed new
+        # instance is terminated rather than being released at exit
+        assert instance_pool.released == [pooled]
+        assert fake_ec2.shut_down == fake_ec2.launched
+        assert len(fake_ec2.launched) == 1
+
+    def test_failed_pooled_instance_terminated(self, fake_ec2, make_config):
+        pooled = fake_ec2.create_instance()
+        instance_pool = FakePool()
+
+        async def f():
+            async with Ec2InstancesManager(make_config(), 1, 'req',
+                    pool=instance_pool, pooled=[pooled]) as manager:
+                async for i in manager.ready_instances():
+                    await manager.terminate_instance(i, failed=True)
+
+        asyncio.run(f())
+        assert instance_pool.released == []
+        assert fake_ec2.shut_down == [pooled]
+
+    def test_pooled_instances_auto_shutdown(self, fake_ec2, make_config):
+        pooled = fake_ec2.create_instance()
+        instance_pool = FakePool()
+
+        async def f():
+            async with Ec2InstancesManager(make_config(
+                    {"aws": {"ec2": {"minutes_until_auto_shutdown": 60}}}),
+                    2, 'req', pool=instance_pool, pooled=[pooled]) as manager:
+                [i async for i in manager.ready_instances()]
+
+        asyncio.run(f())
+        # leased and new instances are scheduled to shut down after the
+        # maximum lease time, which is cancelled when they're released
+        for instance in (pooled, fake_ec2.launched[0]):
+            ip = instance.classic_address.public_ip
+            cmds = [c for i, c in fake_ec2.commands if i == ip]
+            assert any('at now + 720 minutes' in c for c in cmds)
+            assert cmds[-1] == Ec2InstancesManager.CANCEL_AUTO_SHUTDOWN_CMD
+        assert instance_pool.released == [pooled, fake_ec2.launched[0]]
+
+    def test_uncancelled_auto_shutdown_terminated(self, fake_ec2, make_config):
+        pooled = fake_ec2.create_instance()
+        instance_pool = FakePool()
+        fake_ec2.respond = lambda ip, cmd: (('', 1)
+            if cmd == Ec2InstancesManager.CANCEL_AUTO_SHUTDOWN_CMD else None)
+
+        async def f():
+            async with Ec2InstancesManager(make_config(), 1, 'req',
+                    pool=instance_pool, pooled=[pooled]) as manager:
+                [i async for i in manager.ready_instances()]
+
+        asyncio.run(f())
+        assert instance_pool.released == []
+        assert fake_ec2.shut_down == [pooled]
+
+
+class TestInstancePool(object):
+
+    def _pooled_instance(self, fake_ec2, state, minutes_ago):
+        instance = fake_ec2.create_instance()
+        since = datetime.datetime.utcnow() - datetime.timedelta(minutes=minutes_ago)
+        instance.tags = [
+            {'Key': InstancePool.POOL_TAG, 'Value': 'p'},
+            {'Key': InstancePool.STATE_TAG, 'Value': state},
+            {'Key': InstancePool.SINCE_TAG,
+                'Value': since.strftime('%Y-%m-%dT%H:%M:%S')}
+        ]
+        return instance
+
+    def _pool(self, make_config, monkeypatch, instances, pool_config):
+        monkeypatch.setattr(pool.boto3, 'resource', lambda *a, **k: None)
+        instance_pool = InstancePool(make_config(
+            {"aws": {"ec2": {"pool": dict(pool_config, name="p")}}}))
+
+        async def _find(state):
+            return [i for i in instances
+                if not state or instance_pool._get_tag(
+                    i, InstancePool.STATE_TAG) == state]
+        monkeypatch.setattr(instance_pool, '_find', _find)
+        return instance_pool
+
+    def test_reap_idle(self, fake_ec2, make_config, monkeypatch):
+        recent = self._pooled_instance(fake_ec2, 'idle', 5)
+        expired = [self._pooled_instance(fake_ec2, 'idle', m) for m in (90, 120)]
+        instance_pool = self._pool(make_config, monkeypatch,
+            [recent] + expired, {"size": 2})
+
+        # the two most recently used are kept warm
+        assert asyncio.run(instance_pool.reap()) == 2
+        assert fake_ec2.shut_down == [expired[1]]
+
+    def test_reap_orphaned_leases(self, fake_ec2, make_config, monkeypatch):
+        leased = self._pooled_instance(fake_ec2, 'leased:req-abc', 60)
+        orphaned = self._pooled_instance(fake_ec2, 'leased:req-def', 721)
+        instance_pool = self._pool(make_config, monkeypatch,
+            [leased, orphaned], {})
+
+        # leases are reaped after 720 minutes by default
+        assert asyncio.run(instance_pool.reap()) == 0
+        assert fake_ec2.shut_down == [orphaned]
+
+    def test_keep_leases(self, fake_ec2, make_config, monkeypatch):
+        orphaned = self._pooled_instance(fake_ec2, 'leased:req-def', 10000)
+        instance_pool = self._pool(make_config, monkeypatch, [orphaned],
+            {"max_lease_minutes": None})
+
+        asyncio.run(instance_pool.reap())
+        assert fake_ec2.shut_down == []
+
+    def test_maintain(self, fake_ec2, make_config, monkeypatch):
+        monkeypatch.setattr(pool.boto3, 'resource', lambda *a, **k: None)
+        instance_pool = InstancePool(make_config(
+            {"aws": {"ec2": {"pool": {"name": "p", "size": 3}}}}))
+        released = []
+
+        async def reap():
+            return 1
+        async def release(instances):
+            released.extend(instances)
+        monkeypatch.setattr(instance_pool, 'reap', reap)
+        monkeypatch.setattr(instance_pool, 'release', release)
+
+        asyncio.run(instance_pool.maintain())
+        assert len(fake_ec2.launched) == 2
+        assert released == fake_ec2.launched
+        assert fake_ec2.shut_down == []
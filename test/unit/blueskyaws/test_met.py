@@ -0,0 +1,162 @@
+import asyncio
+import datetime
+import os
+import tempfile
+
+import pytest
+
+from blueskyaws.fires import FireMetadataIndex
+from blueskyaws.met import (
+    get_met_domain,
+    get_required_met_files,
+    MetDirectoryIndex,
+    MetReadinessGate
+)
+from blueskyaws.status import SystemState, SystemErrors
+
+
+DOMAINS = {
+    "north": {
+        "boundary": {"sw": {"lat": 45, "lng": -125}, "ne": {"lat": 50, "lng": -115}},
+        "dir": "/Met/north/",
+        "file_name_format": "north.%Y%m%d%H.arl"
+    },
+    "south": {
+        "boundary": {"sw": {"lat": 40, "lng": -125}, "ne": {"lat": 45, "lng": -115}},
+        "dir": "/Met/south/",
+        "file_name_format": "south.%Y%m%d%H.arl",
+        "hours_per_file": 12
+    }
+}
+
+@pytest.fixture
+def met_config(make_config):
+    """Returns a function that creates a Config checking the north domain's
+    met, in met_dir, waiting up to max_attempts times
+    """
+    def f(met_dir, max_attempts=3):
+        return make_config({
+            'met': {
+                'domains': {
+                    "north": dict(DOMAINS['north'], dir=met_dir)
+                },
+                'index_ttl_seconds': 0,
+                'wait': {'strategy': 'fixed', 'time': 0.01,
+                    'max_attempts': max_attempts}
+            }
+        })
+    return f
+
+class FakeStatusTracker(object):
+    def __init__(self):
+        self.states = []
+
+    async def set_system_state(self, system_state, **kwargs):
+        self.states.append((system_state, kwargs.get('system_error')))
+
+def _fire(fire_id, lat, lng):
+    return {"id": fire_id, "activity": [{"active_areas": [{
+        "start": "2019-06-11T00:00:00",
+        "end": "2019-06-12T00:00:00",
+        "utc_offset": "+00:00",
+        "specified_points": [{"lat": lat, "lng": lng, "area": 10}]
+    }]}]}
+
+# 2019-06-11T00:00:00Z
+START = 1560211200
+
+
+class TestGetMetDomain(object):
+
+    def test_in_domain(self):
+        assert get_met_domain(DOMAINS, 47, -120) == 'north'
+        assert get_met_domain(DOMAINS, 42, -120) == 'south'
+        # the first domain containing the location is used
+        assert get_met_domain(DOMAINS, 45, -120) == 'north'
+
+    def test_not_in_domain(self):
+        assert get_met_domain(DOMAINS, 35, -120) is None
+        assert get_met_domain(DOMAINS, None, None) is None
+        assert get_met_domain(None, 47, -120) is None
+
+
+class TestGetRequiredMetFiles(object):
+
+    def test_daily(self):
+        assert get_required_met_files(DOMAINS['north'], START,
+            START + 86400) == ['north.2019061100.arl']
+        assert get_required_met_files(DOMAINS['north'], START + 3600,
+            START + 86400 + 3600) == [
+            'north.2019061100.arl', 'north.2019061200.arl'
+        ]
+
+    def test_hours_per_file(self):
+        assert get_required_met_files(DOMAINS['south'], START + 3600 * 13,
+            START + 86400) == ['south.2019061112.arl']
+        assert get_required_met_files(DOMAINS['south'], START,
+            START + 86400) == [
+            'south.2019061100.arl', 'south.2019061112.arl'
+        ]
+
+
+class TestMetDirectoryIndex(object):
+
+    def test_cached_listing(self):
+        async def f():
+            with tempfile.TemporaryDirectory() as met_dir:
+                index = MetDirectoryIndex(60)
+                missing = [await index.get_missing(met_dir, ['a', 'b'])]
+                open(os.path.join(met_dir, 'a'), 'w').close()
+                # still cached
+                missing.append(await index.get_missing(met_dir, ['a', 'b']))
+                index = MetDirectoryIndex(0)
+                missing.append(await index.get_missing(met_dir, ['a', 'b']))
+                missing.append(await index.get_missing(
+                    os.path.join(met_dir, 'nonexistent'), ['a']))
+                return missing
+
+        assert asyncio.run(f()) == [['a', 'b'], ['a', 'b'], ['b'], ['a']]
+
+
+class TestMetReadinessGate(object):
+
+    def test_wait(self, met_config):
+        fire_index = FireMetadataIndex.build([_fire('a', 47, -120),
+            _fire('b', 35, -120)])
+        today = datetime.datetime(2019, 6, 11)
+
+        async def f(met_dir):
+            status_tracker = FakeStatusTracker()
+            gate = MetReadinessGate(met_config(met_dir, max_attempts=20),
+                fire_index, today, status_tracker)
+            missing = await gate.get_missing([0, 1])
+            # 'b' isn't in any domain
+            assert await gate.get_missing([1]) == []
+
+            async def arrive():
+                await asyncio.sleep(0.015)
+                open(os.path.join(met_dir, 'north.2019061100.arl'), 'w').close()
+            asyncio.ensure_future(arrive())
+            return missing, await gate.wait([0]), status_tracker.states
+
+        with tempfile.TemporaryDirectory() as met_dir:
+            missing, still_missing, states = asyncio.run(f(met_dir))
+            assert missing == [os.path.join(met_dir, 'north.2019061100.arl')]
+            assert still_missing == []
+            assert states == [
+                (SystemState.WAITING, SystemErrors.WAITING_FOR_MET),
+                (SystemState.RUNNING, None)
+            ]
+
+    def test_gives_up(self, met_config):
+        fire_index = FireMetadataIndex.build([_fire('a', 47, -120)])
+        today = datetime.datetime(2019, 6, 11)
+
+        async def f(met_dir):
+            gate = MetReadinessGate(met_config(met_dir, max_attempts=2),
+                fire_index, today, FakeStatusTracker())
+            return await gate.wait([0])
+
+        with tempfile.TemporaryDirectory() as met_dir:
+            assert asyncio.run(f(met_dir)) == [
+                os.path.join(met_dir, 'north.2019061100.arl')]
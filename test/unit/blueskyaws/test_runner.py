@@ -0,0 +1,294 @@
+import asyncio
+import datetime
+import types
+from collections import Counter
+
+import pytest
+
+from blueskyaws import BlueskyParallelRunner, BlueskySingleRunner
+from blueskyaws.bootstrap import StagedFile
+from blueskyaws.image import get_bluesky_image
+from blueskyaws.launch import Ec2InstancesManager
+from blueskyaws.scheduling import WorkQueue
+from blueskyaws.ssh import SshConnectionPool
+from blueskyaws.status import Status
+
+
+class FakeSshClient(object):
+    """Responds to the exit code waits with each of the given outputs in
+    turn, and to container checks with whether the container's running
+    """
+
+    def __init__(self, exit_codes, running):
+        self.exit_codes = list(exit_codes)
+        self.running = list(running)
+        self.commands = []
+
+    async def execute(self, cmd, ignore_errors=False):
+        self.commands.append(cmd)
+        stdout = (self.exit_codes.pop(0) if cmd.startswith('timeout ')
+            else self.running.pop(0))
+        return types.SimpleNamespace(stdout=stdout + '\n', stderr='',
+            return_code=0)
+
+def _runner(make_config, ssh_client):
+    runner = BlueskySingleRunner({"fires": [{"id": "a"}]},
+        make_config({"bluesky": {"seconds_per_completion_wait": 1}}),
+        StagedFile({}), 'req', None, datetime.datetime(2020, 2, 1), None)
+    runner._ssh_client = ssh_client
+    runner._ip = '10.0.0.1'
+    runner._host_data_dir = '/data'
+    runner._container_name = 'req-0'
+    return runner
+
+
+class TestWaitForExitCode(object):
+
+    def test_completes_after_timeouts(self, make_config):
+        ssh_client = FakeSshClient(['', '', '1'], ['abc123', 'abc123'])
+        assert asyncio.run(_runner(make_config,
+            ssh_client)._wait_for_exit_code()) == 1
+        assert ssh_client.commands[0].endswith('|| true')
+
+    def test_exit_code_written_after_exit(self, make_config):
+        ssh_client = FakeSshClient(['', '0'], [''])
+        assert asyncio.run(_runner(make_config,
+            ssh_client)._wait_for_exit_code()) == 0
+
+    def test_exit_code_never_written(self, make_config):
+        ssh_client = FakeSshClient(['', '', ''], ['abc123', '', ''])
+        with pytest.raises(RuntimeError):
+            asyncio.run(_runner(make_config, ssh_client)._wait_for_exit_code())
+
+
+class TestFormBspCommand(object):
+
+    def test_runs_pulled_image(self, make_config):
+        config = make_config({"aws": {"ec2": {"efs_volumes": []}}})
+        runner = BlueskySingleRunner({"fires": [{"id": "a"}]}, config,
+            StagedFile({}), 'req', None, datetime.datetime(2020, 2, 1), None)
+        runner._container_name = 'req-0'
+        runner._host_data_dir = '/data'
+        assert ' {} bsp '.format(get_bluesky_image(config)) in (
+            runner._form_bsp_command())
+
+
+class FakeStatusTracker(object):
+    def __init__(self):
+        self.statuses = []
+
+    async def set_run_status(self, runner, status, **kwargs):
+        self.statuses.append((runner.run_id, status, kwargs.get('message')))
+
+class FailingSshPool(object):
+    async def get(self, ip):
+        raise RuntimeError("Failed to connect to {}".format(ip))
+
+
+class TestRun(object):
+
+    def test_failed_connection(self, make_config, s3_client):
+        status_tracker = FakeStatusTracker()
+        runner = BlueskySingleRunner({"fires": [{"id": "a"}]}, make_config(),
+            StagedFile({}), 'req', status_tracker,
+            datetime.datetime(2020, 2, 1), s3_client)
+        instance = types.SimpleNamespace(
+            classic_address=types.SimpleNamespace(public_ip='10.0.0.1'))
+        asyncio.run(runner.run(instance, FailingSshPool(), 'req-0'))
+        assert status_tracker.statuses == [
+            ('fire-a', Status.RUNNING, None),
+            ('fire-a', Status.UNKNOWN, "Failed to connect to 10.0.0.1")
+        ]
+
+
+class TestSetExecutor(object):
+
+    def _max_workers(self, config, num_fires, num_instances):
+        runner = BlueskyParallelRunner.__new__(BlueskyParallelRunner)
+        runner._config = config
+        runner._input_loader = types.SimpleNamespace(num_fires=num_fires)
+        runner._completed_runs = set([0])
+        runner._total_instances_needed = num_instances
+
+        async def f():
+            runner._set_executor()
+            return asyncio.get_event_loop()._default_executor._max_workers
+
+        return asyncio.run(f()) - BlueskyParallelRunner.BASE_MAX_EXECUTOR_THREADS
+
+    def test_sized_by_slots(self, make_config):
+        config = make_config({"aws": {"ec2": {"slots_per_instance": 2}}})
+        assert self._max_workers(config, 10000, 10) == 20
+        # fewer fires left to run than slots
+        assert self._max_workers(config, 11, 10) == 10
+
+
+class TestMetGating(object):
+
+    def _runner(self, config):
+        runner = BlueskyParallelRunner.__new__(BlueskyParallelRunner)
+        runner._config = config
+        runner._all_fires_sorted = asyncio.Event()
+        runner._num_waiting_for_met = Counter()
+        runner._exhausted_queues = set()
+        return runner
+
+    def test_size_launches(self, make_config):
+        runner = self._runner(make_config(
+            {"aws": {"ec2": {"slots_per_instance": 2}}}))
+        runner._instance_types = ['a', 'b', 'a', 'b', 'a']
+        runner._num_allocated = Counter(runner._instance_types)
+        runner._num_to_run = Counter({'a': 12, 'b': 4})
+        runner._num_waiting_for_met.update({'a': 9, 'b': 4})
+
+        runner._size_launches()
+        # two instances' worth of slots for the three fires ready to
+        # run, and none for fires that are all waiting for met
+        assert runner._instance_types == ['a', 'a']
+        assert runner._total_instances_needed == 2
+
+    def test_idle_while_waiting_for_met(self, make_config):
+        runner = self._runner(make_config())
+
+        async def f():
+            queue = asyncio.Queue()
+            get = asyncio.ensure_future(runner._get_from_queue(queue, 'a'))
+            await asyncio.sleep(0)
+            await queue.put('fire-0')
+            items = [await get]
+
+            # once all fires are sorted, with the rest waiting for met
+            runner._num_waiting_for_met['a'] += 1
+            get = asyncio.ensure_future(runner._get_from_queue(queue, 'a'))
+            await asyncio.sleep(0)
+            runner._all_fires_sorted.set()
+            items.append(await get)
+
+            # existing instances aren't released
+            get = asyncio.ensure_future(runner._get_from_queue(queue))
+            await queue.put('fire-1')
+            items.append(await get)
+            return items, queue.qsize()
+
+        assert asyncio.run(f()) == (
+            ['fire-0', BlueskyParallelRunner.IDLE, 'fire-1'], 0)
+
+
+class FakeRuns(object):
+    """Stands in for BlueskySingleRunner, recording the instance and slot
+    each fire is run in, and the fires aborted, and raising from the runs
+    of the given fires
+    """
+
+    def __init__(self, failing_fire_ids=()):
+        self.runs = []
+        self.aborted = []
+        self.failing_fire_ids = failing_fire_ids
+        self.active = Counter()
+        self.max_active = Counter()
+
+    def create_runner(self, input_data, fire_metadata, run_id=None,
+            instance_type=None):
+        fake_runs = self
+        fire_id = input_data['fires'][0]['id']
+
+        class FakeRunner(object):
+            run_id = fire_id
+
+            async def run(self, instance, ssh_pool, container_name):
+                ip = instance.classic_address.public_ip
+                fake_runs.active[ip] += 1
+                fake_runs.max_active[ip] = max(fake_runs.max_active[ip],
+                    fake_runs.active[ip])
+                try:
+                    await asyncio.sleep(0)
+                    fake_runs.runs.append((fire_id, instance.instance_type,
+                        container_name))
+                    if fire_id in fake_runs.failing_fire_ids:
+                        raise RuntimeError("Failed to run")
+                finally:
+                    fake_runs.active[ip] -= 1
+
+            async def abort(self, message):
+                fake_runs.aborted.append(fire_id)
+
+        return FakeRunner()
+
+
+class TestRunOnInstances(object):
+
+    def _runner(self, config, fake_runs):
+        runner = BlueskyParallelRunner.__new__(BlueskyParallelRunner)
+        runner._config = config
+        runner._instances = None
+        runner._request_id = 'req'
+        runner._status_tracker = FakeStatusTracker()
+        runner._interruption_notices = {}
+        runner._exhausted_queues = set()
+        runner._ended_queues = set()
+        runner._aborts = []
+        runner._aborted_types = set()
+        runner._all_fires_sorted = asyncio.Event()
+        runner._all_fires_sorted.set()
+        runner._num_waiting_for_met = Counter()
+        runner._num_serving = Counter()
+        runner._num_launching = Counter()
+        runner._idle_instance_ids = set()
+        runner._create_runner = fake_runs.create_runner
+        return runner
+
+    def _run(self, config, fake_runs, instance_types, fire_types):
+        """Runs fires, whose types are given by fire_types, on instances
+        of instance_types, as _run_all does, once all fires are queued,
+        and returns the status tracker
+        """
+        async def f():
+            runner = self._runner(config, fake_runs)
+            queues = {t: WorkQueue() for t in set(fire_types)}
+            for i, t in enumerate(fire_types):
+                queues[t].put_nowait(({"fires": [{"id": str(i)}]}, None))
+            for queue in queues.values():
+                queue.put_nowait(BlueskyParallelRunner.END_OF_QUEUE)
+                runner._ended_queues.add(queue)
+
+            runner._ssh_pool = SshConnectionPool(config('ssh_key'))
+            async with runner._ssh_pool, Ec2InstancesManager(config,
+                    len(instance_types), 'req', ssh_pool=runner._ssh_pool,
+                    instance_types=instance_types) as manager:
+                runner._num_pending = Counter(instance_types)
+                runs = [runner._start_runs_on_instance(manager, i, queues)
+                    async for i in manager.ready_instances()]
+                await asyncio.gather(*runs)
+                await asyncio.gather(*runner._aborts)
+            return runner._status_tracker
+
+        return asyncio.run(f())
+
+    def test_runs_on_instances_of_each_type(self, fake_ec2, make_config):
+        fake_runs = FakeRuns()
+        self._run(make_config({"aws": {"ec2": {"slots_per_instance": 2}}}),
+            fake_runs, ['t2.nano', 'c5.large', 't2.nano'],
+            ['t2.nano'] * 5 + ['c5.large'] * 2)
+
+        # each fire is run once, on an instance of its type
+        assert sorted((f, t) for f, t, c in fake_runs.runs) == (
+            [(str(i), 't2.nano') for i in range(5)]
+            + [('5', 'c5.large'), ('6', 'c5.large')])
+        assert set(c for f, t, c in fake_runs.runs) <= {'req-0', 'req-1'}
+        assert max(fake_runs.max_active.values()) <= 2
+        assert fake_runs.aborted == []
+        assert len(fake_ec2.launched) == 3
+        assert sorted(i.id for i in fake_ec2.shut_down) == sorted(
+            i.id for i in fake_ec2.launched)
+
+    def test_failed_run_doesnt_end_slot(self, fake_ec2, make_config):
+        fake_runs = FakeRuns(failing_fire_ids={'0'})
+        status_tracker = self._run(make_config(), fake_runs, ['t2.nano'],
+            ['t2.nano'] * 3)
+
+        # the rest of the fires are still run on the only instance
+        assert [f for f, t, c in fake_runs.runs] == ['0', '1', '2']
+        assert fake_runs.aborted == []
+        assert status_tracker.statuses == [
+            ('0', Status.UNKNOWN, "Failed to run")]
+        assert fake_ec2.shut_down == fake_ec2.launched
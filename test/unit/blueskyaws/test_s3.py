@@ -0,0 +1,94 @@
+import asyncio
+import io
+import threading
+
+import blueskyaws.s3
+from blueskyaws.s3 import S3Client, get_s3_client
+
+
+class FakeBoto3Client(object):
+    def __init__(self):
+        self.objects = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+
+    def put_object(self, Bucket, Key, Body):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        # Give other calls a chance to start
+        self._event.wait(0.01)
+        with self._lock:
+            self.in_flight -= 1
+        self.objects[Key] = Body
+
+    def get_object(self, Bucket, Key):
+        return {'Body': io.BytesIO(self.objects[Key])}
+
+class FakeBoto3(object):
+    def __init__(self):
+        self.client_kwargs = None
+        self.s3_client = FakeBoto3Client()
+
+    def client(self, service, **kwargs):
+        assert service == 's3'
+        self.client_kwargs = kwargs
+        return self.s3_client
+
+
+class TestS3Client(object):
+
+    def test_calls_and_stats(self, monkeypatch):
+        fake_boto3 = FakeBoto3()
+        monkeypatch.setattr(blueskyaws.s3, 'boto3', fake_boto3)
+        s3_client = S3Client(max_concurrency=2)
+
+        async def f():
+            await asyncio.gather(*[
+                s3_client.put_object(Bucket='b', Key=str(i), Body=b'abc')
+                for i in range(6)
+            ])
+            return await s3_client.get_object(Bucket='b', Key='1')
+
+        response = asyncio.run(f())
+        assert response['Body'] == b'abc'
+        assert fake_boto3.s3_client.max_in_flight <= 2
+        assert fake_boto3.client_kwargs['config'] is not None
+
+        stats = s3_client.stats
+        assert stats['put_object']['requests'] == 6
+        assert stats['put_object']['bytes_sent'] == 18
+        assert stats['put_object']['errors'] == 0
+        assert stats['get_object']['requests'] == 1
+        assert stats['get_object']['bytes_received'] == 3
+
+    def test_errors(self, monkeypatch):
+        monkeypatch.setattr(blueskyaws.s3, 'boto3', FakeBoto3())
+        s3_client = S3Client()
+
+        async def f():
+            try:
+                await s3_client.get_object(Bucket='b', Key='foo')
+            except KeyError:
+                return True
+
+        assert asyncio.run(f())
+        assert s3_client.stats['get_object']['requests'] == 1
+        assert s3_client.stats['get_object']['errors'] == 1
+
+
+class TestGetS3Client(object):
+
+    def test_settings(self, monkeypatch):
+        monkeypatch.setattr(blueskyaws.s3, 'boto3', FakeBoto3())
+        monkeypatch.setattr(blueskyaws.s3, '_s3_clients', {})
+
+        s3_client = get_s3_client('boto3', max_concurrency=8, max_attempts=3)
+        assert s3_client._max_concurrency == 8
+        assert s3_client._max_attempts == 3
+        # shared by everything using the same settings
+        assert get_s3_client('boto3', max_concurrency=8,
+            max_attempts=3) is s3_client
+        assert get_s3_client('boto3')._max_concurrency == S3Client.MAX_CONCURRENCY
@@ -0,0 +1,203 @@
+import asyncio
+import itertools
+import logging
+
+import pytest
+
+from blueskyaws.fires import FireMetadataIndex
+from blueskyaws.scheduling import (
+    SchedulingPolicy,
+    WorkQueue,
+    estimate_cost,
+    estimate_costs,
+    order_fires,
+    order_fire_indices,
+    simulate_makespan
+)
+
+
+def _fire(fire_id, area, num_points=1):
+    return {
+        "id": fire_id,
+        "activity": [
+            {
+                "active_areas": [
+                    {
+                        "specified_points": [
+                            {"lat": 45.0, "lng": -120.0, "area": area / num_points}
+                            for i in range(num_points)
+                        ]
+                    }
+                ]
+            }
+        ]
+    }
+
+@pytest.fixture
+def scheduling_config(make_config):
+    """Returns a function that creates a Config with the given scheduling
+    policy and, optionally, modules
+    """
+    def f(policy, modules=None):
+        overrides = {"scheduling": {"policy": policy}}
+        if modules:
+            overrides["bluesky"] = {"modules": modules}
+        return make_config(overrides)
+    return f
+
+def _makespan(fires, config, num_instances):
+    ordered = order_fires(fires, config)
+    costs = [estimate_cost(f, config('bluesky', 'modules')) for f in ordered]
+    makespan = simulate_makespan(costs, num_instances)
+    logging.info("%s makespan on %s instances: %s",
+        config('scheduling', 'policy'), num_instances, makespan)
+    return makespan
+
+
+class TestEstimateCost(object):
+
+    def test_larger_fire_costs_more(self):
+        modules = ["fuelbeds", "consumption", "emissions"]
+        assert estimate_cost(_fire('a', 50000), modules) > estimate_cost(
+            _fire('b', 10), modules)
+
+    def test_dispersion_costs_more(self):
+        fire = _fire('a', 5000)
+        assert estimate_cost(fire, ["fuelbeds", "dispersion"]) > estimate_cost(
+            fire, ["fuelbeds"])
+
+    def test_unparseable_fire(self):
+        assert estimate_cost({"id": "a"}, ["fuelbeds"]) > 0
+
+    def test_estimate_costs_matches_estimate_cost(self):
+        modules = ["fuelbeds", "dispersion"]
+        fires = [_fire('a', 10), _fire('b', 50000, 3), {"id": "c"}]
+        index = FireMetadataIndex.build(fires)
+        assert estimate_costs(index, modules) == [
+            estimate_cost(f, modules) for f in fires]
+
+
+class TestSimulateMakespan(object):
+
+    def test_single_instance(self):
+        assert simulate_makespan([3, 2, 1], 1) == 6
+
+    def test_more_instances_than_runs(self):
+        assert simulate_makespan([3, 2, 1], 10) == 3
+
+    def test_no_runs(self):
+        assert simulate_makespan([], 3) == 0
+
+
+class TestOrderFires(object):
+
+    def test_fifo_retains_input_order(self, scheduling_config):
+        fires = [_fire('a', 10), _fire('b', 50000), _fire('c', 100)]
+        ordered = order_fires(fires, scheduling_config(SchedulingPolicy.FIFO))
+        assert [f['id'] for f in ordered] == ['a', 'b', 'c']
+
+    def test_longest_first(self, scheduling_config):
+        fires = [_fire('a', 10), _fire('b', 50000), _fire('c', 100)]
+        ordered = order_fires(fires,
+            scheduling_config(SchedulingPolicy.LONGEST_FIRST))
+        assert [f['id'] for f in ordered] == ['b', 'c', 'a']
+
+    def test_order_fire_indices(self, scheduling_config):
+        index = FireMetadataIndex.build(
+            [_fire('a', 10), _fire('b', 50000), _fire('c', 100)])
+        assert order_fire_indices(index,
+            scheduling_config(SchedulingPolicy.FIFO)) == [0, 1, 2]
+        assert order_fire_indices(index,
+            scheduling_config(SchedulingPolicy.LONGEST_FIRST)) == [1, 2, 0]
+
+    def test_longest_first_makespan_large_fire_last(self, scheduling_config):
+        # many small fires followed by one very large one; with fifo, the
+        # large fire is started last, after all instances are already busy
+        fires = [_fire(str(i), 100) for i in range(40)] + [_fire('big', 200000)]
+        fifo = _makespan(fires, scheduling_config(SchedulingPolicy.FIFO), 4)
+        lpt = _makespan(fires,
+            scheduling_config(SchedulingPolicy.LONGEST_FIRST), 4)
+        assert lpt < fifo
+
+    def test_longest_first_makespan_mixed_fires(self, scheduling_config):
+        # Mixed set of pile burns, medium fires, and a few large fires,
+        # including dispersion
+        areas = ([10] * 200 + [1000, 2500, 5000] * 20
+            + [20000, 35000, 50000] * 4)
+        fires = [_fire(str(i), a, 1 + (i % 3)) for i, a in enumerate(areas)]
+        modules = ["fuelbeds", "consumption", "emissions", "dispersion"]
+        for num_instances in (5, 20, 50):
+            fifo = _makespan(fires, scheduling_config(SchedulingPolicy.FIFO,
+                modules), num_instances)
+            lpt = _makespan(fires, scheduling_config(
+                SchedulingPolicy.LONGEST_FIRST, modules), num_instances)
+            assert lpt <= fifo
+
+    def test_longest_first_makespan_within_lpt_bound(self, scheduling_config):
+        # Small enough to find the optimal makespan by trying every
+        # assignment of fires to instances
+        areas = [10, 100, 1000, 2500, 5000, 20000, 35000, 50000]
+        fires = [_fire(str(i), a) for i, a in enumerate(areas)]
+        config = scheduling_config(SchedulingPolicy.LONGEST_FIRST)
+        costs = [estimate_cost(f, config('bluesky', 'modules')) for f in fires]
+        for num_instances in (2, 3):
+            optimal = min(
+                max(sum(c for c, i in zip(costs, assignment) if i == n)
+                    for n in range(num_instances))
+                for assignment in itertools.product(range(num_instances),
+                    repeat=len(costs)))
+            lpt = _makespan(fires, config, num_instances)
+            # Graham's bound for longest-processing-time-first
+            assert lpt <= (4.0 / 3 - 1.0 / (3 * num_instances)) * optimal
+
+
+class TestWorkQueue(object):
+
+    def test_put_back(self):
+        async def f():
+            queue = WorkQueue(maxsize=2)
+            await queue.put('a')
+            await queue.put('b')
+            assert await queue.get() == 'a'
+            await queue.put('c')
+            # put back in front, even though the queue is full
+            queue.put_back('a')
+            return [await queue.get() for i in range(3)]
+
+        assert asyncio.run(f()) == ['a', 'b', 'c']
+
+    def test_put_back_wakes_up_getter(self):
+        async def f():
+            queue = WorkQueue()
+            getter = asyncio.ensure_future(queue.get())
+            await asyncio.sleep(0)
+            queue.put_back('a')
+            return await asyncio.wait_for(getter, 1)
+
+        assert asyncio.run(f()) == 'a'
+
+    def test_put_back_order(self):
+        async def f():
+            queue = WorkQueue(maxsize=1)
+            await queue.put('c')
+            queue.put_back('a')
+            queue.put_back('b')
+            # items put back don't count against maxsize
+            assert queue.full() and queue.qsize() == 3
+            items = [await queue.get() for i in range(3)]
+            assert queue.empty()
+            return items
+
+        assert asyncio.run(f()) == ['a', 'b', 'c']
+
+    def test_cancelled_get(self):
+        async def f():
+            queue = WorkQueue()
+            getter = asyncio.ensure_future(queue.get())
+            await asyncio.sleep(0)
+            getter.cancel()
+            await asyncio.gather(getter, return_exceptions=True)
+            await queue.put('a')
+            return await asyncio.wait_for(queue.get(), 1)
+
+        assert asyncio.run(f()) == 'a'
@@ -0,0 +1,98 @@
+from blueskyaws.config import Config
+from blueskyaws.fires import FireMetadataIndex
+from blueskyaws.sizing import (
+    get_instance_type,
+    get_instance_types,
+    allocate_instances
+)
+
+
+LADDER = [
+    {"max_area": 1000, "modules": ["dispersion"], "instance_type": "c5.xlarge"},
+    {"modules": ["dispersion"], "instance_type": "c5.4xlarge"},
+    {"max_area": 1000, "instance_type": "t3.small"}
+]
+
+def _config(ladder=LADDER, modules=None):
+    config = {
+        "ssh_key": "id_rsa",
+        "aws": {
+            "iam_instance_profile": {
+                "Arn": "arn:aws:iam::abc123:instance-profile/bluesky-iam-role",
+                "Name": "bluesky-iam-role"
+            },
+            "ec2": {
+                "image_id": "ami-123abc",
+                "instance_type":"t2.nano",
+                "key_pair_name": "sdfsdf",
+                "security_groups": ["ssh"]
+            },
+            "s3": {
+                "bucket_name": "bluesky-aws",
+            }
+        },
+        "bluesky": {
+            "modules": modules or ["fuelbeds", "consumption", "emissions"]
+        }
+    }
+    if ladder:
+        config['aws']['ec2']['instance_type_ladder'] = ladder
+    return Config(config)
+
+def _fire(fire_id, area):
+    return {
+        "id": fire_id,
+        "activity": [{"active_areas": [{"specified_points": [
+            {"lat": 45.0, "lng": -120.0, "area": area}
+        ]}]}]
+    }
+
+
+class TestGetInstanceType(object):
+
+    def test_no_ladder(self):
+        config = _config(ladder=None)
+        assert get_instance_type(10, config) == 't2.nano'
+        assert get_instance_type(100000, config) == 't2.nano'
+
+    def test_by_area(self):
+        config = _config()
+        assert get_instance_type(10, config) == 't3.small'
+        assert get_instance_type(1000, config) == 't3.small'
+        assert get_instance_type(1001, config) == 't2.nano'
+
+    def test_by_modules(self):
+        config = _config(modules=["fuelbeds", "consumption", "emissions",
+            "dispersion"])
+        assert get_instance_type(10, config) == 'c5.xlarge'
+        assert get_instance_type(1001, config) == 'c5.4xlarge'
+
+    def test_unknown_area(self):
+        config = _config()
+        assert get_instance_type(None, config) == 't3.small'
+        assert get_instance_type(float('nan'), config) == 't3.small'
+
+    def test_instance_types(self):
+        fire_index = FireMetadataIndex.build([_fire('a', 5000), _fire('b', 10),
+            {"id": "c"}])
+        assert get_instance_types(fire_index, _config()) == [
+            't2.nano', 't3.small', 't3.small']
+        assert get_instance_types(fire_index, _config(ladder=None)) == [
+            't2.nano', 't2.nano', 't2.nano']
+
+
+class TestAllocateInstances(object):
+
+    def test_enough_instances(self):
+        types = ['a', 'b', 'a', 'a', 'c']
+        assert allocate_instances(types, 1) == ['a', 'a', 'a', 'b', 'c']
+        assert allocate_instances(types, 2) == ['a', 'a', 'b', 'c']
+        assert allocate_instances(types, 'auto', 5) == ['a', 'a', 'a', 'b', 'c']
+        assert allocate_instances([], 1) == []
+
+    def test_limited_instances(self):
+        types = ['a'] * 10 + ['b'] * 4 + ['c']
+        assert allocate_instances(types, 1, 8) == ['a'] * 5 + ['b'] * 2 + ['c']
+        assert allocate_instances(types, 1, 3) == ['a', 'b', 'c']
+        assert allocate_instances(types, 1, 2) == ['a', 'b']
+        assert len(allocate_instances(types, 1, 14)) == 14
@@ -0,0 +1,78 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from blueskyaws.spot import (
+    form_interruption_check_script, parse_interruption_notice
+)
+
+
+FAKE_METADATA_SCRIPT = os.path.abspath(os.path.join(os.path.dirname(__file__),
+    '../../../dev/scripts/fake-instance-metadata'))
+
+def _get_free_port():
+    with socket.socket() as s:
+        s.bind(('', 0))
+        return s.getsockname()[1]
+
+class FakeMetadata(object):
+    def __init__(self, *args):
+        self.port = _get_free_port()
+        self.url = 'http://localhost:{}/latest'.format(self.port)
+        self._args = args
+
+    def __enter__(self):
+        self._process = subprocess.Popen([sys.executable, FAKE_METADATA_SCRIPT,
+            '--port', str(self.port)] + list(self._args),
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        # Wait for it to start listening
+        self._process.stdout.readline()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._process.terminate()
+        self._process.wait()
+
+def _check(metadata_url, num_checks=2):
+    p = subprocess.run(['bash'], input=form_interruption_check_script(
+        metadata_url, 1, num_checks).encode(),
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert p.returncode == 0, p.stderr
+    return parse_interruption_notice(p.stdout.decode())
+
+
+class TestParseInterruptionNotice(object):
+
+    def test(self):
+        assert parse_interruption_notice('') is None
+        assert parse_interruption_notice('\n') is None
+        assert parse_interruption_notice(
+            '{"action": "terminate", "time": "2020-03-01T08:22:00Z"}\n') == {
+            "action": "terminate", "time": "2020-03-01T08:22:00Z"}
+
+
+class TestInterruptionCheckScript(object):
+
+    def test_no_notice(self):
+        with FakeMetadata() as metadata:
+            start = time.time()
+            assert _check(metadata.url) is None
+            # sleeps between checks, but not after the last one
+            assert 1 <= time.time() - start < 2
+
+    def test_notice(self):
+        with FakeMetadata('--interrupt-after', '0') as metadata:
+            notice = _check(metadata.url + '/')
+            assert notice['action'] == 'terminate'
+            assert notice['time']
+
+    def test_notice_issued_while_checking(self):
+        with FakeMetadata('--interrupt-after', '1.5',
+                '--action', 'stop') as metadata:
+            assert _check(metadata.url, num_checks=5)['action'] == 'stop'
+
+    def test_metadata_unreachable(self):
+        assert _check('http://localhost:{}/latest'.format(_get_free_port()),
+            num_checks=1) is None
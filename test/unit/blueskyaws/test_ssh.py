@@ -0,0 +1,74 @@
+import asyncio
+
+import blueskyaws.ssh
+from blueskyaws.ssh import SshConnectionPool
+
+
+class FakeTransport(object):
+    def __init__(self):
+        self.active = True
+
+    def is_active(self):
+        return self.active
+
+class FakeParamikoClient(object):
+    def __init__(self):
+        self.transport = FakeTransport()
+
+    def get_transport(self):
+        return self.transport
+
+class FakeSshClient(object):
+    instances = []
+
+    def __init__(self, ssh_key, ip):
+        self.ip = ip
+        self.closed = False
+        self._client = FakeParamikoClient()
+        self.instances.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.closed = True
+
+
+class TestSshConnectionPool(object):
+
+    def setup_method(self):
+        FakeSshClient.instances = []
+
+    def _run(self, monkeypatch, f):
+        monkeypatch.setattr(blueskyaws.ssh, 'SshClient', FakeSshClient)
+        return asyncio.run(f())
+
+    def test_reuse(self, monkeypatch):
+        async def f():
+            async with SshConnectionPool('id_rsa') as pool:
+                clients = await asyncio.gather(*[
+                    pool.get(ip) for ip in ('1.1.1.1', '1.1.1.1', '2.2.2.2')
+                ])
+                assert clients[0] is clients[1]
+                assert clients[0] is not clients[2]
+                assert (await pool.get('2.2.2.2')) is clients[2]
+                return pool.stats
+
+        stats = self._run(monkeypatch, f)
+        assert stats == {'opened': 2, 'reused': 2, 'reconnected': 0}
+        assert len(FakeSshClient.instances) == 2
+        assert all(c.closed for c in FakeSshClient.instances)
+
+    def test_reconnect(self, monkeypatch):
+        async def f():
+            async with SshConnectionPool('id_rsa') as pool:
+                client = await pool.get('1.1.1.1')
+                client._client.transport.active = False
+                new_client = await pool.get('1.1.1.1')
+                assert new_client is not client
+                assert client.closed
+                assert not new_client.closed
+                return pool.stats
+
+        stats = self._run(monkeypatch, f)
+        assert stats == {'opened': 2, 'reused': 0, 'reconnected': 1}
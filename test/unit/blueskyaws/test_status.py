@@ -0,0 +1,123 @@
+import asyncio
+import datetime
+import json
+
+import pytest
+
+from blueskyaws.status import Status, SystemState, StatusTracker
+
+
+class FakeRun(object):
+    def __init__(self, run_id):
+        self.run_id = run_id
+
+STATUS_KEY = 'status/req-status.json'
+
+@pytest.fixture
+def status_config(make_config):
+    """Returns a function that creates a Config with the given status
+    settings overridden
+    """
+    def f(**status_settings):
+        return make_config({'status': status_settings})
+    return f
+
+def _run_all(s3_client, config):
+    async def f():
+        tracker = StatusTracker(datetime.date(2020, 3, 1), 'req',
+            s3_client, config)
+        async with tracker:
+            await tracker.initialize()
+            await tracker.set_instance_status('10.0.0.1',
+                image={'pulled': True, 'pull_seconds': 1.5})
+            runs = [FakeRun('run-{}'.format(i)) for i in range(10)]
+            await asyncio.gather(*[
+                tracker.set_run_status(r, Status.RUNNING) for r in runs])
+            await asyncio.gather(*[
+                tracker.set_run_status(r, Status.SUCCESS, output_url='o')
+                for r in runs[:8]])
+            await tracker.set_run_status(runs[8], Status.FAILURE)
+            await tracker.record_interruption(runs[9], ip='10.0.0.1')
+            await tracker.set_run_status(runs[9], Status.RUNNING)
+            await tracker.set_system_state(SystemState.COMPLETE)
+
+    asyncio.run(f())
+
+
+class TestStatusTracker(object):
+
+    def _check_final_status(self, s3_client):
+        status = json.loads(s3_client.objects[STATUS_KEY])
+        assert status['system_state'] == SystemState.COMPLETE
+        assert status['counts'] == {
+            Status.WAITING: 0,
+            Status.RUNNING: 1,
+            Status.SUCCESS: 8,
+            Status.FAILURE: 1,
+            Status.UNKNOWN: 0
+        }
+        assert status['runs']['run-0'] == {
+            'status': Status.SUCCESS, 'output_url': 'o'}
+        assert status['runs']['run-9'] == {'status': Status.RUNNING,
+            'interruptions': [{'ip': '10.0.0.1'}]}
+        assert status['instances'] == {
+            '10.0.0.1': {'image': {'pulled': True, 'pull_seconds': 1.5}}}
+
+    def test_write_on_every_change(self, s3_client, status_config):
+        _run_all(s3_client, status_config())
+        self._check_final_status(s3_client)
+
+    def test_write_behind(self, s3_client, status_config):
+        _run_all(s3_client, status_config(flush_interval_seconds=60))
+        self._check_final_status(s3_client)
+        # Running statuses aren't written individually; terminal statuses
+        # are, but concurrent ones may be coalesced
+        assert s3_client.num_puts < 1 + 1 + 10 + 1
+
+    def test_sharded(self, s3_client, status_config):
+        _run_all(s3_client, status_config(sharded=True, write_combined=False))
+        assert STATUS_KEY not in s3_client.objects
+        assert set(s3_client.objects) == set(
+            ['request-index/20200301/req', 'status/req/manifest.json',
+                'status/req/instances/10.0.0.1.json'] +
+            ['status/req/run-{}.json'.format(i) for i in range(10)])
+
+        manifest = json.loads(s3_client.objects['status/req/manifest.json'])
+        assert 'runs' not in manifest
+        assert 'instances' not in manifest
+        assert manifest['system_state'] == SystemState.COMPLETE
+        assert manifest['counts'][Status.SUCCESS] == 8
+        assert json.loads(s3_client.objects[
+            'status/req/instances/10.0.0.1.json'])['image']['pulled']
+        assert json.loads(s3_client.objects['status/req/run-0.json']) == {
+            'status': Status.SUCCESS, 'output_url': 'o'}
+        assert json.loads(s3_client.objects['status/req/run-8.json']) == {
+            'status': Status.FAILURE}
+
+    def test_sharded_with_combined(self, s3_client, status_config):
+        _run_all(s3_client, status_config(sharded=True))
+        self._check_final_status(s3_client)
+        assert 'status/req/manifest.json' in s3_client.objects
+
+    def test_summarize_timings(self, s3_client, status_config):
+        async def f():
+            tracker = StatusTracker(datetime.date(2020, 3, 1), 'req',
+                s3_client, status_config())
+            async with tracker:
+                await tracker.initialize()
+                await tracker.set_instance_status('10.0.0.1',
+                    timings={'launch': 30.0})
+                await tracker.set_run_status(FakeRun('run-0'),
+                    Status.SUCCESS, timings={'run_bluesky': 10.0})
+                await tracker.set_run_status(FakeRun('run-1'),
+                    Status.SUCCESS, timings={'run_bluesky': 20.0})
+                # e.g. reused from the cache
+                await tracker.set_run_status(FakeRun('run-2'), Status.SUCCESS)
+                return await tracker.summarize_timings()
+
+        assert asyncio.run(f()) == {
+            'runs': {'run_bluesky': {'count': 2, 'min': 10.0, 'median': 15.0,
+                'p95': 20.0, 'max': 20.0}},
+            'instances': {'launch': {'count': 1, 'min': 30.0, 'median': 30.0,
+                'p95': 30.0, 'max': 30.0}}
+        }
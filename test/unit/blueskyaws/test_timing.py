@@ -0,0 +1,45 @@
+import time
+
+from blueskyaws.timing import StageTimer, summarize_timings
+
+
+class TestStageTimer(object):
+
+    def test_time(self):
+        timer = StageTimer()
+        with timer.time('a'):
+            time.sleep(0.01)
+        try:
+            with timer.time('b'):
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+
+        timings = timer.timings
+        assert list(timings) == ['a', 'b']
+        assert 0.01 <= timings['a'] < 1
+        # failed stages are still recorded
+        assert 0 <= timings['b'] < 1
+
+    def test_repeated_stage(self):
+        timer = StageTimer()
+        for i in range(2):
+            with timer.time('a'):
+                time.sleep(0.01)
+        assert timer.timings['a'] >= 0.02
+
+
+class TestSummarizeTimings(object):
+
+    def test_empty(self):
+        assert summarize_timings([]) == {}
+
+    def test_summary(self):
+        timings = [{'a': float(i)} for i in range(1, 101)]
+        timings[0]['b'] = 3.0
+        assert summarize_timings(timings) == {
+            'a': {'count': 100, 'min': 1.0, 'median': 50.5, 'p95': 95.0,
+                'max': 100.0},
+            'b': {'count': 1, 'min': 3.0, 'median': 3.0, 'p95': 3.0,
+                'max': 3.0}
+        }